@@ -0,0 +1,1199 @@
+"""
+analysis_pipeline.py - the /analyze flow as a pipeline of pluggable stages
+
+Every analyzer is wrapped in a Stage that declares which context keys it reads
+(inputs) and which it writes (outputs). AnalysisPipeline runs the stages over a
+shared context dict and builds the extension response from it, so the Flask
+app variants (app.py, app_with_cache.py, app_with_caching.py) and the async app
+are just different stage lists - see app_factory.py.
+
+Context keys:
+    data                                  - raw payload from the extension
+    url, images, reviews, review_images,
+    valid_images, seller                  - ParseInputStage
+    shop                                  - ShopStage (shop-level aggregate, see shop_cache.py)
+    sentiment, duplicates, image_similarity,
+    synthid, image_reuse, similar_listings - analyzer stages (same keys as response['results'])
+    risk                                  - RiskStage
+
+Any output passed to run() up front (e.g. sentiment aggregated while review pages
+streamed in) is used as-is and the stage that would produce it is skipped. The shop
+stage does the same with review results cached for the listing's shop.
+
+Stages run as a dependency graph: each one starts as soon as the stages producing
+its inputs are done. A scan has an overall deadline (and a stage may have its own
+timeout); a stage still running then is detached, its outputs stay empty and the
+risk score is calculated from what finished. response['stages'] has the per-stage
+status and response['partial'] is True when anything timed out.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from log_setup import log_payload, sample_payloads
+from metrics import (
+    SCAN_SECONDS, SCANS_IN_FLIGHT, STAGE_SECONDS, STAGE_RUNS, STAGES_IN_FLIGHT, ANALYZER_ERRORS,
+    IMAGE_DOWNLOAD_SECONDS, IMAGE_DOWNLOAD_ERRORS, CACHE_SECONDS, CACHE_REQUESTS,
+)
+import tracing
+from tracing import span, annotate
+import capture
+from capture import record_image
+from profiler import PROFILER
+from analyzers.utils.seller_key import seller_key
+from shop_cache import SELLER_FIELDS, shop_id_of, review_fingerprint, review_photo_stats
+
+logger = logging.getLogger(__name__)
+
+# Order of analyzers in response['analyzers_status']
+ANALYZER_STATUS_KEYS = ('synthid', 'sentiment', 'image_similarity', 'image_comparator', 'duplicate_detector', 'shop_analyzer')
+
+# Review fields still needed downstream (risk, image similarity) once the text is scored
+STREAM_REVIEW_FIELDS = ('transactionId', 'rating', 'date', 'images', 'appreciationPhotoUrl', 'hasPhoto', 'hasVideo')
+
+
+def extract_image_urls(images):
+    """
+    Better image URL validation - handles both strings AND objects
+
+    Returns:
+        List of http(s) image URLs, in scraper order
+    """
+    valid_images = []
+    for i, img in enumerate(images):
+        if img and isinstance(img, dict):
+            # It's an image object - try to extract URL from common fields
+            url = None
+
+            # Try different possible field names where URL might be stored
+            if 'contentURL' in img and img['contentURL']:
+                url = img['contentURL']
+            elif 'url' in img and img['url']:
+                url = img['url']
+            elif 'src' in img and img['src']:
+                url = img['src']
+            elif 'thumbnail' in img and img['thumbnail']:
+                url = img['thumbnail']
+            elif 'image' in img and isinstance(img['image'], str):
+                url = img['image']
+
+            if url and isinstance(url, str):
+                # Clean up the URL if needed
+                url = url.strip()
+                if url.startswith(('http://', 'https://')):
+                    valid_images.append(url)
+                    logger.debug("  ✅ Extracted URL from image object %d: %.100s...", i + 1, url)
+                else:
+                    logger.warning("  ❌ Extracted URL missing protocol from object %d: %.100s", i + 1, url)
+            else:
+                logger.warning("  ❌ Could not extract valid URL from image object %d: %.200s", i + 1, img)
+
+        elif img and isinstance(img, str):
+            # It's already a string URL
+            img = img.strip()
+            if img.startswith(('http://', 'https://')):
+                valid_images.append(img)
+                logger.debug("  ✅ Valid image URL %d: %.100s...", i + 1, img)
+            else:
+                logger.warning("  ❌ Image %d missing http:// or https://: %.100s", i + 1, img)
+        else:
+            logger.warning("  ❌ Image %d invalid type: %s - %.100s", i + 1, type(img), img)
+
+    return valid_images
+
+
+async def fetch_image(ctx: Dict, url: str) -> Optional[Image.Image]:
+    """
+    Download an image with the request's shared httpx.AsyncClient (ctx['http_client'])
+    Each URL is fetched once per request, however many stages ask for it
+    """
+    downloads = ctx.setdefault('downloads', {})
+    if url not in downloads:
+        downloads[url] = asyncio.ensure_future(_download(ctx['http_client'], url))
+    # shield: a stage that times out must not cancel a download other stages share
+    return await asyncio.shield(downloads[url])
+
+
+async def _download(client, url: str) -> Optional[Image.Image]:
+    started, resp = time.perf_counter(), None
+    try:
+        with span('download', source='async', url=url[:120]) as s, IMAGE_DOWNLOAD_SECONDS.time(source='async'):
+            resp = await client.get(url)
+            record_image(url, resp.content, resp.status_code, time.perf_counter() - started, 'async')
+            resp.raise_for_status()
+            annotate(s, bytes=len(resp.content))
+        img = Image.open(BytesIO(resp.content))
+        img.load()
+        return img
+    except Exception as e:
+        if resp is None:
+            record_image(url, None, None, time.perf_counter() - started, 'async', error=str(e))
+        IMAGE_DOWNLOAD_ERRORS.inc(source='async')
+        logger.error(f"❌ Error downloading image {url[:80]}: {e}")
+        return None
+
+
+async def fetch_images(ctx: Dict, urls: List[str]) -> Dict[str, Optional[Image.Image]]:
+    """url -> PIL.Image (None if the download failed) for every URL"""
+    urls = list(dict.fromkeys(urls))
+    return dict(zip(urls, await asyncio.gather(*(fetch_image(ctx, u) for u in urls))))
+
+
+# =====================================================================
+# STAGES
+# =====================================================================
+
+class Stage:
+    """
+    One step of the analysis
+
+    Subclasses set name/inputs/outputs and implement run(ctx) -> {output: value}.
+    arun(ctx) is the asyncio version; by default it runs run() in a worker thread.
+    run() only reads ctx - the pipeline merges the returned outputs - so a stage
+    that is detached after a timeout cannot change the response.
+    """
+
+    name = 'stage'
+    inputs = ()
+    # Read if some stage produces them, None otherwise
+    optional_inputs = ()
+    outputs = ()
+    # Key in response['analyzers_status'] / /status this stage reports under
+    status_key = None
+    # Seconds this stage may run (None = only the pipeline deadline applies)
+    timeout = None
+    # False for stages that must always run (parsing, scoring): they run inline and ignore the deadline
+    bounded = True
+    # Dedicated thread pool run() uses (None = the pool shared by all stages)
+    pool = None
+
+    def __init__(self, analyzer=None, timeout=None):
+        self.analyzer = analyzer
+        if timeout is not None:
+            self.timeout = timeout
+
+    @property
+    def ready(self) -> bool:
+        return self.analyzer is not None
+
+    def run(self, ctx: Dict) -> Dict:
+        raise NotImplementedError
+
+    async def arun(self, ctx: Dict) -> Dict:
+        return await asyncio.to_thread(self.run, ctx)
+
+    def empty(self) -> Dict:
+        """Outputs used when the stage fails"""
+        return {key: None for key in self.outputs}
+
+    def after_scan(self, ctx: Dict):
+        """Called with the finished context before the response is built (e.g. to cache results)"""
+
+
+class ParseInputStage(Stage):
+    """Pull images, reviews and the seller out of the extension payload"""
+
+    name = 'parse_input'
+    inputs = ('data',)
+    outputs = ('url', 'images', 'reviews', 'review_images', 'valid_images', 'seller')
+    bounded = False
+
+    @property
+    def ready(self) -> bool:
+        return True
+
+    def run(self, ctx):
+        data = ctx['data']
+        # Raw payload samples are only dumped for a share of requests (LOG_PAYLOAD_SAMPLE, DEBUG level)
+        sampled = sample_payloads()
+
+        # Show what arrived (keys + samples)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🧾 Top-level keys: %s", sorted(data.keys()))
+            if isinstance(data.get("data"), dict):
+                logger.debug("🧾 data keys: %s", sorted(data["data"].keys()))
+
+        # Get images from scraper - handle different possible structures
+        images = []
+        if isinstance(data.get("data"), dict):
+            images = data["data"].get("images", []) or []
+        elif "images" in data:
+            images = data.get("images", []) or []
+
+        logger.info("🖼️ Raw images received: %d", len(images))
+        log_payload(logger, sampled, "🖼️ Image sample", images[:3])
+
+        # Reviews
+        reviews = []
+        if isinstance(data.get("data"), dict):
+            reviews = data["data"].get("reviews", []) or []
+        elif "reviews" in data:
+            reviews = data.get("reviews", []) or []
+
+        logger.info("📝 Reviews received: %d", len(reviews))
+        log_payload(logger, sampled, "📝 Review sample", reviews[:1])
+
+        # Extract review images
+        review_images = []
+        reviews_with_photos = 0
+        for review in reviews:
+            review_imgs = review.get('images', [])
+            if review_imgs and len(review_imgs) > 0:
+                reviews_with_photos += 1
+                review_images.extend(review_imgs)
+
+        logger.info("📸 Review images: %d total from %d reviews", len(review_images), reviews_with_photos)
+        if review_images:
+            logger.debug("📸 First review image: %.80s...", review_images[0])
+
+        # Extra blocks your extension sends
+        log_payload(logger, sampled, "📦 reviewFetch", data.get("reviewFetch"))
+        log_payload(logger, sampled, "📦 report", data.get("report"))
+
+        # Validate image URLs (strings or image objects)
+        valid_images = extract_image_urls(images)
+        logger.info("📊 Valid images: %d out of %d", len(valid_images), len(images))
+
+        listing_data = data.get('data') if isinstance(data.get('data'), dict) else {}
+        # Both identifiers when known - either one may be missing on a given visit
+        seller = seller_key((listing_data.get('reviewDebug') or {}).get('shop_id'), listing_data.get('sellerName'))
+
+        return {
+            'url': data.get('url'),
+            'images': images,
+            'reviews': reviews,
+            'review_images': review_images,
+            'valid_images': valid_images,
+            'seller': seller,
+        }
+
+
+class ShopStage(Stage):
+    """
+    Shop-level aggregate cached by shop_id (analyzer: shop_cache.ShopCache)
+
+    When the listing's reviews are exactly the set the shop's entry was computed from,
+    the cached review results go into the context and the stages producing them are
+    skipped as precomputed. after_scan() records what this scan computed.
+    """
+
+    name = 'shop'
+    inputs = ('data', 'reviews')
+    outputs = ('shop',)
+    status_key = 'shop_analyzer'
+    bounded = False
+    # Outputs of later stages that can come from the cache
+    reusable = ('sentiment', 'duplicates')
+
+    def run(self, ctx):
+        shop_id = shop_id_of(ctx['data'])
+        if not shop_id:
+            return {'shop': None}
+
+        reviews = ctx['reviews']
+        fingerprint, _ = review_fingerprint(reviews)
+        entry, result = self.analyzer.lookup(shop_id, fingerprint)
+
+        outputs = {}
+        if result == 'hit':
+            outputs = {
+                key: entry['results'][key] for key in self.reusable
+                if key in entry['results'] and ctx.get(key) is None
+            }
+            if outputs:
+                logger.info("🏪 Shop %s cache hit - reusing %s for %d reviews", shop_id, ', '.join(outputs), len(reviews))
+        elif result == 'changed':
+            logger.info("🏪 Shop %s reviews changed since cached - recomputing review analysis", shop_id)
+
+        outputs['shop'] = {
+            'analyzed': True,
+            'shop_id': shop_id,
+            'cache': result,
+            'reused': sorted(key for key in outputs if key in self.reusable),
+            'seller': dict(entry['seller']) if entry else {},
+            'previous_scans': entry['scans'] if entry else 0,
+            'cached_at': entry['updated_at'] if entry else None,
+            **review_photo_stats(reviews),
+        }
+        return outputs
+
+    def after_scan(self, ctx):
+        shop = ctx.get('shop')
+        if not self.ready or not shop:
+            return
+        listing_data = ctx['data'].get('data') or {}
+        seller = {key: listing_data.get(key) for key in SELLER_FIELDS}
+
+        # Results this scan computed in full for its reviews (not reused, failed or timed out)
+        status = ctx.get('stage_status', {})
+        results = {
+            key: ctx[key] for key in self.reusable
+            if key not in shop['reused'] and ctx.get(key) is not None
+            and status.get(key, {}).get('status') in ('ok', 'precomputed')
+        }
+        try:
+            self.analyzer.update(shop['shop_id'], seller, ctx['reviews'] if results else None, results)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not update shop cache for {shop['shop_id']}: {e}")
+
+
+class SentimentStage(Stage):
+    """TextBlob sentiment vs star rating"""
+
+    name = 'sentiment'
+    inputs = ('reviews',)
+    # The shop stage may fill in the output from its cache
+    optional_inputs = ('shop',)
+    outputs = ('sentiment',)
+    status_key = 'sentiment'
+
+    def run(self, ctx, scores=None):
+        reviews = ctx['reviews']
+        if not reviews:
+            logger.info("ℹ️ No reviews to analyze")
+            return {'sentiment': None}
+
+        logger.info("🔍 Running sentiment analysis on %d reviews...", len(reviews))
+        sentiment_results = self.analyzer.analyze_reviews(reviews, scores=scores)
+        counts, percentages = sentiment_results['sentiment_counts'], sentiment_results['sentiment_percentages']
+        logger.info(
+            "✅ Sentiment analysis complete: positive %s (%s%%), negative %s (%s%%), neutral %s (%s%%), "
+            "average %s, suspicious %s",
+            counts['positive'], percentages['positive'], counts['negative'], percentages['negative'],
+            counts['neutral'], percentages['neutral'], sentiment_results['average_sentiment'],
+            sentiment_results['sentiment_rating_mismatch_count']
+        )
+        return {'sentiment': sentiment_results}
+
+
+class DuplicateReviewStage(Stage):
+    """Near-duplicate review text (MinHash + LSH)"""
+
+    name = 'duplicates'
+    inputs = ('reviews',)
+    optional_inputs = ('shop',)
+    outputs = ('duplicates',)
+    status_key = 'duplicate_detector'
+
+    def run(self, ctx):
+        reviews = ctx['reviews']
+        if not reviews:
+            return {'duplicates': None}
+
+        logger.info("🔍 Checking %d reviews for near-duplicate text...", len(reviews))
+        duplicate_results = self.analyzer.find_duplicates(reviews)
+        logger.info("✅ Duplicate check complete: %s", duplicate_results['message'])
+        return {'duplicates': duplicate_results}
+
+
+class ImageSimilarityStage(Stage):
+    """Review photos vs listing images (OpenCLIP)"""
+
+    name = 'image_similarity'
+    inputs = ('images', 'reviews', 'review_images')
+    outputs = ('image_similarity',)
+    status_key = 'image_similarity'
+
+    def _pairs(self, ctx):
+        """(listing images, review images) to compare, or None"""
+        images, review_images = ctx['images'], ctx['review_images']
+        if not (images and ctx['reviews']):
+            return None
+        if not review_images:
+            logger.info("ℹ️ No review photos available for comparison")
+            return None
+        return images[:3], review_images[:3]  # Use first 3 listing images, up to 3 review photos
+
+    def run(self, ctx):
+        pairs = self._pairs(ctx)
+        if not pairs:
+            return {'image_similarity': None}
+        return {'image_similarity': self._compare(*pairs, total=len(ctx['review_images']))}
+
+    def _compare(self, listing_images, review_images, total):
+        logger.info("🔍 Comparing %d review photos with listing images...", total)
+        similarity_results = self.analyzer.analyze_review_photos(
+            listing_images=listing_images,
+            review_images=review_images,
+            max_comparisons=3
+        )
+
+        logger.info(
+            "✅ Image similarity analysis complete: average match %s/100, verified authentic %s - %s",
+            similarity_results.get('average_match_score', 0), similarity_results.get('verified_authentic', False),
+            similarity_results.get('message', 'N/A')
+        )
+        return similarity_results
+
+    async def arun(self, ctx):
+        pairs = self._pairs(ctx)
+        if not pairs:
+            return {'image_similarity': None}
+        listing_images, review_images = pairs
+        # Download concurrently, then encode once - the analyzer's embedding cache serves the comparisons
+        urls = [u for u in listing_images + review_images if isinstance(u, str)]
+        downloaded = await fetch_images(ctx, urls)
+        await asyncio.to_thread(lambda: [
+            self.analyzer.embed_image(u, img) for u, img in downloaded.items() if img is not None
+        ])
+        return {'image_similarity': await asyncio.to_thread(
+            self._compare, listing_images, review_images, len(ctx['review_images'])
+        )}
+
+
+class SynthIDStage(Stage):
+    """Gemini AI-generated image check on the first valid listing image"""
+
+    name = 'synthid'
+    inputs = ('images', 'valid_images')
+    outputs = ('synthid',)
+    status_key = 'synthid'
+    # A slow Gemini call should not hold the whole scan
+    timeout = 20
+    # Calls still running after a timeout keep their thread - never the one the other stages share
+    pool = 'gemini'
+
+    def _base(self, ctx):
+        return {
+            'status': 'working',
+            'results': [],
+            'any_ai': False,
+            'message': 'No valid images to analyze',
+            'images_analyzed': 0,
+            'total_images': len(ctx['images']),
+            'valid_images': len(ctx['valid_images'])
+        }
+
+    def _first_image(self, ctx):
+        valid_images, images = ctx['valid_images'], ctx['images']
+        if not valid_images:
+            logger.warning("⚠️ No valid images to analyze")
+            if images:
+                # Show sample of first image to help debug
+                logger.debug("  First image data sample: %.200s", images[0])
+            return None
+
+        # Analyze first valid image
+        first_image = valid_images[0]
+        logger.info("🔍 Analyzing image: %.50s...", first_image)
+        return first_image
+
+    def _record(self, synthid_results, result):
+        if result:
+            ai_detected = result.get('is_ai_generated', False)
+            confidence = result.get('confidence', 0)
+
+            logger.info("  ✅ Analysis complete - AI detected: %s (confidence %s%%)", ai_detected, confidence)
+            logger.debug("  📝 Explanation: %.100s...", result.get('explanation', 'No explanation'))
+
+            if result.get('indicators'):
+                logger.debug("  🚩 Indicators: %s", result.get('indicators'))
+
+            synthid_results['results'] = [result]
+            synthid_results['any_ai'] = ai_detected
+            synthid_results['message'] = 'Analysis complete'
+            synthid_results['images_analyzed'] = 1
+        else:
+            logger.error("  ❌ No result returned from analyzer")
+            synthid_results['message'] = 'Analyzer returned no result'
+        return {'synthid': synthid_results}
+
+    def _failed(self, synthid_results, e):
+        logger.error(f"  ❌ Error during image analysis: {e}")
+        logger.error(traceback.format_exc())
+        synthid_results['message'] = f'Error during analysis: {str(e)}'
+        return {'synthid': synthid_results}
+
+    def run(self, ctx):
+        synthid_results = self._base(ctx)
+        first_image = self._first_image(ctx)
+        if not first_image:
+            return {'synthid': synthid_results}
+        try:
+            return self._record(synthid_results, self.analyzer.analyze_image(first_image))
+        except Exception as e:
+            return self._failed(synthid_results, e)
+
+    async def arun(self, ctx):
+        synthid_results = self._base(ctx)
+        first_image = self._first_image(ctx)
+        if not first_image:
+            return {'synthid': synthid_results}
+        try:
+            img = await fetch_image(ctx, first_image)
+            if img is None:
+                return self._record(synthid_results, self.analyzer._error_result("Image download failed"))
+            async with ctx['gemini_slots']:
+                result = await self.analyzer.analyze_pil_async(img)
+            return self._record(synthid_results, result)
+        except Exception as e:
+            return self._failed(synthid_results, e)
+
+    def empty(self):
+        return {'synthid': {
+            'status': 'working', 'results': [], 'any_ai': False,
+            'message': 'SynthID stage failed', 'images_analyzed': 0
+        }}
+
+
+class ImageReuseStage(Stage):
+    """Cross-listing image reuse (perceptual-hash index)"""
+
+    name = 'image_reuse'
+    inputs = ('url', 'valid_images', 'seller')
+    outputs = ('image_reuse',)
+    status_key = 'image_comparator'
+
+    def run(self, ctx, images=None):
+        valid_images = ctx['valid_images']
+        if not valid_images:
+            return {'image_reuse': None}
+        comparator = self.analyzer
+        logger.info("🔍 Checking %d listing images against %d indexed images...",
+                    min(len(valid_images), comparator.max_images), len(comparator.index))
+        image_reuse_results = comparator.check_listing(ctx['url'], ctx['seller'], valid_images, images)
+        logger.info("✅ Image reuse check complete: %s", image_reuse_results['message'])
+        return {'image_reuse': image_reuse_results}
+
+    async def arun(self, ctx):
+        valid_images = ctx['valid_images']
+        if not valid_images:
+            return {'image_reuse': None}
+        downloaded = await fetch_images(ctx, valid_images[:self.analyzer.max_images])
+        return await asyncio.to_thread(self.run, ctx, downloaded)
+
+
+class SimilarListingsStage(Stage):
+    """Cross-shop semantic image search (CLIP embeddings + ANN index)"""
+
+    name = 'similar_listings'
+    inputs = ('url', 'valid_images', 'seller')
+    outputs = ('similar_listings',)
+    status_key = 'image_similarity'
+
+    @property
+    def ready(self) -> bool:
+        return self.analyzer is not None and self.analyzer.embedding_index is not None
+
+    def run(self, ctx):
+        valid_images = ctx['valid_images']
+        if not valid_images:
+            return {'similar_listings': None}
+        similar_listings_results = self.analyzer.find_similar_images(ctx['url'], ctx['seller'], valid_images)
+        logger.info("✅ Cross-shop image search complete: %s", similar_listings_results['message'])
+        return {'similar_listings': similar_listings_results}
+
+    async def arun(self, ctx):
+        valid_images = ctx['valid_images']
+        if valid_images:
+            downloaded = await fetch_images(ctx, valid_images[:3])
+            await asyncio.to_thread(lambda: [
+                self.analyzer.embed_image(u, img) for u, img in downloaded.items() if img is not None
+            ])
+        return await asyncio.to_thread(self.run, ctx)
+
+
+class RiskStage(Stage):
+    """Combine every analyzer result into one 0-100 risk score"""
+
+    name = 'risk'
+    inputs = ('data',)
+    optional_inputs = ('sentiment', 'synthid', 'image_similarity', 'duplicates', 'image_reuse', 'shop')
+    outputs = ('risk',)
+    status_key = 'risk_calculator'
+    bounded = False
+
+    def run(self, ctx):
+        logger.info("🎯 Calculating comprehensive risk score...")
+        listing_data = ctx['data'].get('data', {})
+        # Seller stats this page did not show, from the shop's other listings
+        shop_seller = (ctx.get('shop') or {}).get('seller') or {}
+        missing = {key: value for key, value in shop_seller.items() if listing_data.get(key) is None}
+        if missing:
+            logger.info("🏪 Seller stats from shop cache: %s", ', '.join(sorted(missing)))
+            listing_data = dict(listing_data, **missing)
+
+        # Prepare data for risk calculator
+        risk_data = {
+            'data': listing_data,
+            'results': {key: ctx.get(key) for key in self.optional_inputs if key != 'shop'}
+        }
+
+        risk_assessment = self.analyzer.calculate_risk(risk_data)
+
+        risk = {
+            'score': risk_assessment['score'],
+            'level': risk_assessment['level'],
+            'color': risk_assessment['color'],
+            'message': risk_assessment['recommendation'],
+            'warnings': risk_assessment['warnings'],
+            'breakdown': risk_assessment['breakdown']
+        }
+
+        logger.info("📊 RISK ASSESSMENT: score %s/100, level %s, %d warnings - %s",
+                    risk['score'], risk['level'], len(risk['warnings']), risk['message'])
+        if risk['warnings'] and logger.isEnabledFor(logging.DEBUG):
+            for w in risk['warnings'][:5]:  # Show first 5
+                logger.debug("      %s", w)
+        return {'risk': risk}
+
+    def empty(self):
+        return {'risk': {'score': 0, 'level': 'UNKNOWN', 'message': 'Unable to calculate risk'}}
+
+
+# Placeholder result per response key when its stage did not produce anything
+EMPTY_RESULTS = {
+    'sentiment': {'message': 'No sentiment analysis performed'},
+    'image_similarity': {'analyzed': False, 'message': 'No review photos to compare'},
+    'duplicates': {'analyzed': False, 'message': 'No duplicate review check performed'},
+    'image_reuse': {'analyzed': False, 'message': 'No listing images checked'},
+    'similar_listings': {'analyzed': False, 'message': 'No cross-shop image search performed'},
+    'shop': {'analyzed': False, 'message': 'No shop_id for this listing'},
+}
+
+
+# =====================================================================
+# PIPELINE
+# =====================================================================
+
+class AnalysisPipeline:
+    """
+    Dependency graph of stages + optional result cache
+
+    Stages whose analyzer failed to initialize are kept (for status reporting)
+    but never run; their outputs stay None.
+    """
+
+    def __init__(self, stages: List[Stage], cache=None, use_cache: bool = False, result_keys=None,
+                 deadline: Optional[float] = None, max_workers: Optional[int] = None,
+                 pool_workers: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            stages: Stages in execution order; every input must be 'data' or an earlier output
+            cache: BackboardCache (get(url) / set(url, value)) for whole responses, None if unavailable
+            use_cache: This configuration caches responses (adds from_cache / cache status,
+                even when the cache itself failed to initialize)
+            result_keys: Keys shown in response['results'] (default: every analyzer output)
+            deadline: Seconds a scan may spend in bounded stages (None = wait for every stage)
+            max_workers: Threads shared by all scans for running stages in run()
+            pool_workers: Threads of each dedicated pool (Stage.pool name -> threads, default 4)
+        """
+        produced = {'data'}
+        for stage in stages:
+            missing = [key for key in stage.inputs if key not in produced]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' needs {missing}, which no earlier stage produces")
+            produced.update(stage.outputs)
+
+        self.stages = stages
+        self.cache = cache
+        self.use_cache = use_cache or cache is not None
+        self.result_keys = result_keys or [
+            key for stage in stages if stage.status_key and stage.name != 'risk' for key in stage.outputs
+        ]
+        self.deadline = deadline or None
+        # Stage threads only ever run scans - the profiler samples them whenever it runs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage',
+                                           initializer=PROFILER.enter)
+        # Stages that can hang (Gemini) run in their own bounded pools, so detached calls
+        # piling up cannot starve the other stages of threads
+        self.pools = {
+            name: ThreadPoolExecutor(max_workers=(pool_workers or {}).get(name, 4), thread_name_prefix=name,
+                                     initializer=PROFILER.enter)
+            for name in {stage.pool for stage in stages if stage.pool}
+        }
+
+        # Stage name -> names of the earlier stages producing its inputs
+        producers = {}
+        self.dependencies = {}
+        for stage in stages:
+            self.dependencies[stage.name] = {
+                producers[key] for key in stage.inputs + stage.optional_inputs if key in producers
+            }
+            producers.update({key: stage.name for key in stage.outputs})
+
+    def stage(self, name: str) -> Optional[Stage]:
+        return next((s for s in self.stages if s.name == name), None)
+
+    def analyzer(self, status_key: str):
+        """First analyzer instance registered under a status key (None if missing/failed)"""
+        return next((s.analyzer for s in self.stages if s.status_key == status_key and s.analyzer is not None), None)
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+    def _new_context(self, data, precomputed, on_stage=None):
+        ctx = {'data': data, 'stage_status': {}, 'on_stage': on_stage}
+        ctx.update({k: v for k, v in precomputed.items() if v is not None})
+        return ctx
+
+    def _record(self, stage, ctx, status, started=None, **extra):
+        entry = {'status': status}
+        if started is not None:
+            elapsed = time.monotonic() - started
+            entry['duration_ms'] = round(elapsed * 1000, 1)
+            STAGE_SECONDS.observe(elapsed, stage=stage.name)
+        entry.update(extra)
+        ctx['stage_status'][stage.name] = entry
+        STAGE_RUNS.inc(stage=stage.name, status=status)
+        if status == 'error':
+            ANALYZER_ERRORS.inc(stage=stage.name)
+
+        if ctx.get('on_stage'):
+            try:
+                ctx['on_stage'](self.stage_event(stage, ctx))
+            except Exception as e:
+                logger.warning(f"⚠️ Stage listener failed for {stage.name}: {e}")
+
+    def stage_event(self, stage, ctx) -> Dict:
+        """
+        What a stage contributed, in response format:
+            {'stage': name, 'status': ..., 'duration_ms': ..., 'results': {key: result}}
+        ('risk' for the risk stage, which is a top-level response key)
+        """
+        event = {'stage': stage.name}
+        event.update(ctx['stage_status'].get(stage.name, {}))
+        if stage.name == 'risk':
+            event['risk'] = self._risk(ctx)
+        else:
+            event['results'] = {
+                key: self._result(key, ctx) for key in stage.outputs if key in self.result_keys
+            }
+        return event
+
+    def _skip(self, stage, ctx) -> bool:
+        if stage.outputs and all(key in ctx for key in stage.outputs):
+            logger.info(f"ℹ️ Using precomputed {stage.name} results")
+            self._record(stage, ctx, 'precomputed')
+            return True
+        if not stage.ready:
+            logger.warning(f"⚠️ {stage.name} stage not initialized")
+            ctx.update(stage.empty())
+            self._record(stage, ctx, 'not_ready')
+            return True
+        return False
+
+    def _call(self, stage, ctx) -> Dict:
+        with span(stage.name), STAGES_IN_FLIGHT.track(stage=stage.name):
+            return stage.run(ctx)
+
+    async def _acall(self, stage, ctx) -> Dict:
+        with span(stage.name), STAGES_IN_FLIGHT.track(stage=stage.name):
+            return await stage.arun(ctx)
+
+    def _stage_deadline(self, stage, started, deadline) -> Optional[float]:
+        """monotonic() time a stage started at `started` must be done by (None = no limit)"""
+        if not stage.bounded:
+            return None
+        limits = [d for d in (deadline, started + stage.timeout if stage.timeout else None) if d]
+        return min(limits) if limits else None
+
+    def _finished(self, stage, ctx, result, started):
+        ctx.update(result)
+        self._record(stage, ctx, 'ok', started)
+
+    def _failed(self, stage, ctx, e, started=None):
+        logger.error(f"❌ Error during {stage.name} stage: {e}")
+        logger.error(traceback.format_exc())
+        ctx.update(stage.empty())
+        self._record(stage, ctx, 'error', started, error=str(e))
+
+    def _timed_out(self, stage, ctx, started=None):
+        if started is None:
+            logger.warning(f"⏱️ {stage.name} not started before the scan deadline - scoring without it")
+        else:
+            logger.warning(f"⏱️ {stage.name} timed out after {time.monotonic() - started:.1f}s - scoring without it")
+        ctx.update(stage.empty())
+        self._record(stage, ctx, 'timeout', started)
+
+    def run(self, data: Dict, on_stage=None, debug_timing=False, **precomputed) -> Dict:
+        """
+        Run the stages and build the extension response
+
+        Bounded stages run in the shared thread pool as soon as their inputs are ready;
+        parsing and risk scoring run inline. Stages still running at their deadline
+        are detached (their thread finishes in the background, the result is dropped).
+
+        Args:
+            data: Payload from the extension (url, data, report, reviewFetch)
+            on_stage: Called with stage_event() as each stage finishes, fails or times out
+            debug_timing: Add a span tree to response['receipt']['timing'] (also set by
+                data['debug_timing'])
+            **precomputed: Stage outputs that are already known (e.g. sentiment=...)
+
+        Returns:
+            Response dict for the extension
+        """
+        with tracing.start_trace('analyze', debug_timing or bool(data.get('debug_timing'))) as trace, \
+                capture.start_capture() as recording:
+            response = self.cache_lookup(data)
+            if not response:
+                with SCANS_IN_FLIGHT.track(), SCAN_SECONDS.time():
+                    ctx = self._schedule(data, precomputed, on_stage)
+                response = self.finish(ctx)
+        capture.save(recording, data, response)
+        return self._with_timing(response, trace)
+
+    def _schedule(self, data, precomputed, on_stage) -> Dict:
+        """Run the stage graph for run(); returns the finished context"""
+        ctx = self._new_context(data, precomputed, on_stage)
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        pending = list(self.stages)
+        done = set()
+        running = {}  # future -> (stage, started, stage deadline)
+
+        while pending or running:
+            # Start everything whose producers are done; inline stages can unlock more
+            progress = True
+            while progress:
+                progress = False
+                for stage in list(pending):
+                    if not self.dependencies[stage.name] <= done:
+                        continue
+                    pending.remove(stage)
+                    progress = True
+                    now = time.monotonic()
+                    if self._skip(stage, ctx):
+                        done.add(stage.name)
+                    elif stage.bounded and deadline and now >= deadline:
+                        self._timed_out(stage, ctx)
+                        done.add(stage.name)
+                    elif not stage.bounded:
+                        try:
+                            self._finished(stage, ctx, self._call(stage, ctx), now)
+                        except Exception as e:
+                            self._failed(stage, ctx, e, now)
+                        done.add(stage.name)
+                    else:
+                        # copy_context: the stage's spans belong to this request's trace
+                        executor = self.pools.get(stage.pool, self.executor)
+                        future = executor.submit(contextvars.copy_context().run, self._call, stage, ctx)
+                        running[future] = (stage, now, self._stage_deadline(stage, now, deadline))
+
+            if not running:
+                break
+
+            limits = [limit for _, _, limit in running.values() if limit]
+            timeout = max(0, min(limits) - time.monotonic()) if limits else None
+            finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                stage, started, _ = running.pop(future)
+                try:
+                    self._finished(stage, ctx, future.result(), started)
+                except Exception as e:
+                    self._failed(stage, ctx, e, started)
+                done.add(stage.name)
+
+            now = time.monotonic()
+            for future, (stage, started, limit) in list(running.items()):
+                if limit and now >= limit:
+                    future.cancel()
+                    del running[future]
+                    self._timed_out(stage, ctx, started)
+                    done.add(stage.name)
+
+        return ctx
+
+    async def arun(self, data: Dict, http_client=None, gemini_slots=None, on_stage=None,
+                   debug_timing=False, **precomputed) -> Dict:
+        """
+        asyncio version of run(): same graph and deadlines, stages run as tasks
+        and a stage that times out is cancelled
+
+        Args:
+            http_client: Shared httpx.AsyncClient for image downloads
+            gemini_slots: asyncio.Semaphore bounding concurrent Gemini calls
+            on_stage: Called (on the event loop) with stage_event() as each stage ends
+        """
+        with tracing.start_trace('analyze', debug_timing or bool(data.get('debug_timing'))) as trace, \
+                capture.start_capture() as recording:
+            response = await asyncio.to_thread(self.cache_lookup, data)
+            if not response:
+                response = await self._aschedule(data, http_client, gemini_slots, on_stage, precomputed)
+        if recording is not None:
+            await asyncio.to_thread(capture.save, recording, data, response)
+        return self._with_timing(response, trace)
+
+    async def _aschedule(self, data, http_client, gemini_slots, on_stage, precomputed) -> Dict:
+        """Run the stage graph for arun(); returns the response"""
+        ctx = self._new_context(data, precomputed, on_stage)
+        ctx['http_client'] = http_client
+        ctx['gemini_slots'] = gemini_slots or asyncio.Semaphore(16)
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        tasks = {}
+
+        async def run_stage(stage):
+            await asyncio.gather(*(tasks[name] for name in self.dependencies[stage.name]))
+            if self._skip(stage, ctx):
+                return
+            started = time.monotonic()
+            limit = self._stage_deadline(stage, started, deadline)
+            if limit and started >= limit:
+                self._timed_out(stage, ctx)
+                return
+            try:
+                result = await asyncio.wait_for(self._acall(stage, ctx), limit - started if limit else None)
+                self._finished(stage, ctx, result, started)
+            except asyncio.TimeoutError:
+                self._timed_out(stage, ctx, started)
+            except Exception as e:
+                self._failed(stage, ctx, e, started)
+
+        with SCANS_IN_FLIGHT.track(), SCAN_SECONDS.time():
+            for stage in self.stages:
+                tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+            await asyncio.gather(*tasks.values())
+
+        return await asyncio.to_thread(self.finish, ctx)
+
+    # ------------------------------------------------------------------
+    # Response + cache
+    # ------------------------------------------------------------------
+    def analyzers_status(self) -> Dict:
+        status = {}
+        for key in ANALYZER_STATUS_KEYS:
+            stages = [s for s in self.stages if s.status_key == key]
+            if not stages:
+                status[key] = '⏳ IN PROGRESS'
+            else:
+                status[key] = '✅ READY' if any(s.analyzer is not None for s in stages) else '❌ ERROR'
+        if self.use_cache:
+            status['cache'] = '✅ READY' if self.cache else '❌ DISABLED'
+        return status
+
+    def finish(self, ctx: Dict) -> Dict:
+        """Build the extension response from a finished context (and store it in the cache)"""
+        data = ctx['data']
+        for stage in self.stages:
+            try:
+                stage.after_scan(ctx)
+            except Exception as e:
+                logger.warning(f"⚠️ {stage.name} after_scan failed: {e}")
+        risk = self._risk(ctx)
+        logger.info("📊 Final Risk level: %s - %s", risk['level'], risk['message'])
+
+        images = ctx.get('images') or []
+        receipt = {
+            "top_level_keys": sorted(list(data.keys())),
+            "data_keys": sorted(list(data.get("data", {}).keys())) if isinstance(data.get("data"), dict) else None,
+            "url": data.get("url"),
+            "images_received": len(images),
+            "valid_images": len(ctx.get('valid_images') or []),
+            "reviews_received": len((data.get("data") or {}).get("reviews", []) or []),
+            "review_fetch": data.get("reviewFetch"),
+            "report_received": data.get("report"),
+        }
+
+        stage_status = ctx.get('stage_status', {})
+        partial = any(entry.get('status') == 'timeout' for entry in stage_status.values())
+        results = {key: self._result(key, ctx) for key in self.result_keys}
+
+        # Response for extension
+        response = {
+            'success': True,
+            'receipt': receipt,
+            'url': data.get('url', 'unknown'),
+            'timestamp': datetime.now().isoformat(),
+            'analyzers_status': self.analyzers_status(),
+            'results': results,
+            'risk': risk,
+            'stages': stage_status,
+            'partial': partial
+        }
+        if self.use_cache:
+            response['from_cache'] = False
+            # A partial scan would hide the full result for the whole TTL
+            if not partial:
+                self.cache_store(data, response)
+        return response
+
+    def _with_timing(self, response: Dict, trace) -> Dict:
+        """Copy of the response with the span tree in receipt['timing'] (the cached copy stays clean)"""
+        if trace is None:
+            return response
+        timing = tracing.export(trace, response.get('url'))
+        return dict(response, receipt=dict(response.get('receipt') or {}, timing=timing))
+
+    def _risk(self, ctx) -> Dict:
+        return ctx.get('risk') or RiskStage().empty()['risk']
+
+    def _result(self, key, ctx):
+        """response['results'][key] for a context (placeholder if the stage produced nothing)"""
+        stage = next((s for s in self.stages if key in s.outputs), None)
+        if stage and ctx.get('stage_status', {}).get(stage.name, {}).get('status') == 'timeout':
+            # Result placeholder for a stage that did not finish before its deadline
+            result = dict(stage.empty().get(key) or {'analyzed': False})
+            result['timed_out'] = True
+            result['message'] = f'{stage.name} did not finish in time - not included in the risk score'
+            return result
+        return ctx.get(key) or EMPTY_RESULTS.get(key, {'analyzed': False})
+
+    def cache_lookup(self, data: Dict) -> Optional[Dict]:
+        """Cached response for the listing URL, unless force_refresh was requested"""
+        if not self.cache:
+            return None
+        url = data.get('url', 'unknown')
+        if data.get('force_refresh', False):
+            logger.info("🔄 Force refresh requested - bypassing cache")
+            return None
+
+        logger.info("🔍 Checking Backboard.io cache...")
+        try:
+            with span('cache_get') as s, CACHE_SECONDS.time(op='get'):
+                cached_result = self.cache.get(url)
+                annotate(s, cache='hit' if cached_result else 'miss')
+
+            CACHE_REQUESTS.inc(result='hit' if cached_result else 'miss')
+            if cached_result:
+                logger.info("✨ CACHE HIT! Returning cached analysis")
+                logger.info(f"   Cached at: {cached_result.get('cached_at', 'unknown')}")
+
+                # Add cache metadata to response
+                response = cached_result.get('analysis_result', {})
+                response['from_cache'] = True
+                response['cached_at'] = cached_result.get('cached_at')
+                return response
+            logger.info("⊗ Cache MISS - will run full analysis")
+        except Exception as e:
+            CACHE_REQUESTS.inc(result='error')
+            logger.warning(f"⚠️ Cache check failed: {e} - continuing with analysis")
+        return None
+
+    def cache_store(self, data: Dict, response: Dict):
+        """Store a fresh response for next time"""
+        if not self.cache:
+            return
+        logger.info("💾 Storing analysis result in Backboard.io cache...")
+        try:
+            cache_data = {
+                'analysis_result': response,
+                'cached_at': datetime.now().isoformat()
+            }
+
+            with span('cache_set'), CACHE_SECONDS.time(op='set'):
+                cache_success = self.cache.set(data.get('url'), cache_data)
+            if cache_success:
+                logger.info("✅ Analysis cached successfully in Backboard.io")
+            else:
+                logger.warning("⚠️ Failed to cache analysis result")
+        except Exception as e:
+            logger.warning(f"⚠️ Error caching result: {e}")
+
+    def flush(self):
+        """Persist unsaved index inserts (CLIP embedding index)"""
+        clip = self.analyzer('image_similarity')
+        if clip is not None and getattr(clip, 'embedding_index', None) is not None:
+            clip.embedding_index.flush()
+
+    def connect_gemini(self):
+        """Connect a SynthID detector built with connect=False (forked workers: after the fork)"""
+        synthid = self.analyzer('synthid')
+        if synthid is None or not hasattr(synthid, 'connect'):
+            return
+        try:
+            synthid.connect()
+        except Exception as e:
+            logger.error(f"❌ Gemini connection failed: {e}")
+
+    def memory_only_indexes(self):
+        """
+        Stop saving the CLIP embedding index (it stays loaded and keeps growing in memory)
+
+        For forked worker processes: each one would save its own copy to the same
+        file, the last writer winning and the others' inserts lost.
+        """
+        clip = self.analyzer('image_similarity')
+        index = getattr(clip, 'embedding_index', None) if clip is not None else None
+        if index is not None and index.path:
+            logger.warning(f"⚠️ CLIP index {index.path} is read-only in this process - new embeddings are not saved")
+            index.path = None
+
+
+class StreamIngest:
+    """
+    Incremental state for one NDJSON /analyze/stream upload
+
+    Each review page is scored for sentiment and MinHash-signed for duplicate text as soon
+    as it arrives, and only the slim fields listed in STREAM_REVIEW_FIELDS are kept.
+    """
+
+    def __init__(self, pipeline: AnalysisPipeline):
+        sentiment_analyzer = pipeline.analyzer('sentiment')
+        duplicate_detector = pipeline.analyzer('duplicate_detector')
+        self.data = {}
+        self.slim_reviews = []
+        self.pages = 0
+        self.accumulator = sentiment_analyzer.start_stream() if sentiment_analyzer else None
+        self.duplicate_accumulator = duplicate_detector.start_stream() if duplicate_detector else None
+
+    def ingest(self, page_reviews):
+        page_reviews = [r for r in page_reviews if isinstance(r, dict)]
+        if self.accumulator:
+            self.accumulator.add_reviews(page_reviews)
+        if self.duplicate_accumulator:
+            self.duplicate_accumulator.add_reviews(page_reviews)
+        self.slim_reviews.extend(
+            {k: r[k] for k in STREAM_REVIEW_FIELDS if k in r} for r in page_reviews
+        )
+        return len(page_reviews)
+
+    def feed_line(self, raw, line_no):
+        """Consume one NDJSON line; raises ValueError on invalid JSON"""
+        raw = raw.strip()
+        if not raw:
+            return
+        try:
+            chunk = json.loads(raw)
+        except ValueError as e:
+            logger.error(f"❌ Invalid NDJSON on line {line_no}: {e}")
+            raise ValueError(f'Invalid JSON on line {line_no}')
+
+        if not isinstance(chunk, dict):
+            return
+
+        if chunk.get('type') == 'reviews':
+            self.pages += 1
+            count = self.ingest(chunk.get('reviews') or [])
+            logger.info(f"📥 Review page {chunk.get('page', self.pages)}: {count} reviews ({len(self.slim_reviews)} so far)")
+        else:
+            # Listing header - reviews embedded in it are treated as one more page
+            header = {k: v for k, v in chunk.items() if k != 'type'}
+            if isinstance(header.get('data'), dict) and header['data'].get('reviews'):
+                header['data'] = dict(header['data'])
+                self.ingest(header['data'].pop('reviews') or [])
+            self.data.update(header)
+
+    @property
+    def empty(self):
+        return not self.data and not self.slim_reviews
+
+    def finish(self):
+        """
+        Returns:
+            (data, precomputed stage outputs) ready for AnalysisPipeline.run
+        """
+        data = self.data
+        logger.info(f"📥 Analyzing (streamed): {data.get('url', 'unknown')} - {len(self.slim_reviews)} reviews in {self.pages} pages")
+
+        if not isinstance(data.get('data'), dict):
+            data['data'] = {}
+        data['data']['reviews'] = self.slim_reviews
+
+        precomputed = {}
+        if self.slim_reviews:
+            if self.accumulator:
+                precomputed['sentiment'] = self.accumulator.result()
+            if self.duplicate_accumulator:
+                precomputed['duplicates'] = self.duplicate_accumulator.result()
+        return data, precomputed
@@ -0,0 +1,284 @@
+"""
+duplicate_detector.py
+Finds near-duplicate review texts (copy-pasted / lightly edited fake reviews)
+
+Pipeline, all vectorized with NumPy:
+  1. Normalize each review and cut it into character 5-gram shingles
+  2. MinHash signature per review (multiply-shift hash family, `num_perm` hashes)
+  3. LSH banding - reviews sharing any band bucket become candidates
+  4. Verify candidates by signature agreement, group them with union-find
+
+Only candidates from the same bucket are compared, so the cost grows roughly
+linearly with the number of reviews instead of O(n^2) pairwise comparisons.
+"""
+
+import logging
+import re
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+# Shingles are hashed in blocks of about this many rows to bound temporary memory
+_BLOCK_SHINGLES = 1 << 15
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+class DuplicateReviewDetector:
+    """
+    Detect groups of near-duplicate reviews with MinHash + LSH
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        threshold: float = 0.7,
+        min_chars: int = 30,
+        max_chars: int = 600,
+        seed: int = 1,
+    ):
+        """
+        Args:
+            num_perm: MinHash signature length (must be divisible by bands)
+            bands: LSH bands - with 16 bands x 4 rows, pairs above ~0.5 Jaccard become candidates
+            shingle_size: Character n-gram size
+            threshold: Estimated Jaccard similarity needed to call two reviews duplicates
+            min_chars: Shorter normalized reviews ("Love it!") are skipped - they repeat naturally
+            max_chars: Only the first max_chars characters of a review are shingled
+            seed: Seed for the hash family, fixed so signatures are comparable across calls
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: h(x) = (a * x + b) mod 2^64 >> 32, a odd
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self._band_coeffs = rng.integers(1, 2 ** 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+        logger.info("✅ DuplicateReviewDetector initialized")
+
+    def find_duplicates(self, reviews: List[Dict]) -> Dict:
+        """
+        Find near-duplicate review texts
+
+        Args:
+            reviews: List of review dicts with a 'text' field
+
+        Returns:
+            Dict with duplicate groups and summary counts
+        """
+        accumulator = self.start_stream()
+        accumulator.add_reviews(reviews)
+        return accumulator.result()
+
+    def start_stream(self) -> 'DuplicateAccumulator':
+        """Start an incremental detection that accepts reviews page by page"""
+        return DuplicateAccumulator(self)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """
+        MinHash signatures for already-normalized texts
+
+        Every text must be at least shingle_size bytes long once UTF-8 encoded.
+
+        Returns:
+            uint32 array of shape (len(texts), num_perm)
+        """
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            # Group whole documents into blocks so each block reduces independently
+            end, total = start, 0
+            while end < len(texts) and (end == start or total < _BLOCK_SHINGLES):
+                total += len(texts[end].encode('utf-8'))
+                end += 1
+            out[start:end] = self._signature_block(texts[start:end])
+            start = end
+        return out
+
+    def _signature_block(self, texts: List[str]) -> np.ndarray:
+        k = self.shingle_size
+        encoded = [t.encode('utf-8') for t in texts]
+        lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+
+        # Pack each k-byte window into one integer (exact for k <= 8)
+        n_windows = len(data) - k + 1
+        packed = np.zeros(n_windows, dtype=np.uint64)
+        for j in range(k):
+            packed |= data[j:j + n_windows] << (np.uint64(8) * np.uint64(k - 1 - j))
+
+        # Keep only windows that do not cross into the next document
+        doc_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        doc_ends = doc_starts + lengths
+        doc_of = np.repeat(np.arange(len(texts)), lengths)[:n_windows]
+        valid = np.arange(n_windows) + k <= doc_ends[doc_of]
+        shingles = packed[valid]
+        shingle_counts = lengths - k + 1
+
+        # One row per hash function keeps the per-document min reduction contiguous
+        hashed = np.multiply.outer(self._a, shingles)
+        hashed += self._b[:, None]
+        hashed >>= np.uint64(32)
+        seg_starts = np.concatenate(([0], np.cumsum(shingle_counts)[:-1]))
+        return np.minimum.reduceat(hashed, seg_starts, axis=1).T.astype(np.uint32)
+
+    def group(self, signatures: np.ndarray) -> List[List[int]]:
+        """
+        Bucket signatures with LSH and return groups of duplicate row indices (size >= 2)
+        """
+        n = len(signatures)
+        if n < 2:
+            return []
+
+        reps, members = [], []
+        for b in range(self.bands):
+            band = signatures[:, b * self.rows:(b + 1) * self.rows]
+            keys = (band.astype(np.uint64) * self._band_coeffs).sum(axis=1)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            # First row of every bucket is its representative; everyone else is paired with it
+            new_bucket = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+            bucket_id = np.cumsum(new_bucket) - 1
+            rep_rows = order[new_bucket][bucket_id]
+            is_member = ~new_bucket
+            reps.append(rep_rows[is_member])
+            members.append(order[is_member])
+
+        rep = np.concatenate(reps)
+        mem = np.concatenate(members)
+        if not len(rep):
+            return []
+
+        pair_keys = np.unique(rep.astype(np.int64) * n + mem.astype(np.int64))
+        rep, mem = pair_keys // n, pair_keys % n
+
+        similarity = (signatures[rep] == signatures[mem]).mean(axis=1)
+        keep = similarity >= self.threshold
+        rep, mem = rep[keep], mem[keep]
+
+        parent = list(range(n))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in zip(rep.tolist(), mem.tolist()):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        groups = {}
+        for i in set(rep.tolist()) | set(mem.tolist()):
+            groups.setdefault(find(i), []).append(i)
+
+        return [sorted(g) for g in groups.values() if len(g) >= 2]
+
+
+class DuplicateAccumulator:
+    """
+    Running MinHash signatures for reviews that arrive in pages
+    Keeps one signature row and a short snippet per review, never the full text
+    """
+
+    def __init__(self, detector: DuplicateReviewDetector):
+        self.detector = detector
+        self.total_reviews = 0
+        self.indices = []
+        self.snippets = []
+        self.blocks = []
+
+    def add_reviews(self, reviews: List[Dict]) -> None:
+        """Shingle and sign one page of reviews"""
+        det = self.detector
+        texts = []
+        for review in reviews:
+            i = self.total_reviews
+            self.total_reviews += 1
+
+            text = review.get('text') if isinstance(review, dict) else None
+            if not isinstance(text, str):
+                # Scraped payloads sometimes carry numbers or null-like values here
+                text = str(text) if isinstance(text, (int, float)) else ''
+            norm = normalize_text(text)[:det.max_chars]
+            if len(norm) < det.min_chars:
+                continue
+
+            texts.append(norm)
+            self.indices.append(i)
+            self.snippets.append(text[:100] + ('...' if len(text) > 100 else ''))
+
+        if texts:
+            self.blocks.append(det.signatures(texts))
+
+    def result(self) -> Dict:
+        """Group everything seen so far into duplicate clusters"""
+        det = self.detector
+        checked = len(self.indices)
+
+        if checked < 2:
+            return {
+                'analyzed': checked > 0,
+                'total_reviews': self.total_reviews,
+                'reviews_checked': checked,
+                'duplicate_groups': [],
+                'duplicate_group_count': 0,
+                'duplicate_review_count': 0,
+                'duplicate_ratio': 0,
+                'largest_group_size': 0,
+                'message': 'Not enough review text to compare'
+            }
+
+        signatures = np.concatenate(self.blocks)
+        groups = sorted(det.group(signatures), key=len, reverse=True)
+
+        summaries = []
+        for g in groups[:10]:
+            sig = signatures[g]
+            agreement = float((sig[1:] == sig[0]).mean()) if len(g) > 1 else 1.0
+            summaries.append({
+                'size': len(g),
+                'review_indices': [self.indices[i] for i in g[:20]],
+                'estimated_similarity': round(agreement, 3),
+                'sample': self.snippets[g[0]]
+            })
+
+        duplicate_count = sum(len(g) for g in groups)
+        largest = len(groups[0]) if groups else 0
+
+        if groups:
+            message = f'{duplicate_count} reviews in {len(groups)} near-duplicate group(s)'
+        else:
+            message = f'No near-duplicate reviews among {checked} checked'
+
+        return {
+            'analyzed': True,
+            'total_reviews': self.total_reviews,
+            'reviews_checked': checked,
+            'duplicate_groups': summaries,
+            'duplicate_group_count': len(groups),
+            'duplicate_review_count': duplicate_count,
+            'duplicate_ratio': round(duplicate_count / checked, 3),
+            'largest_group_size': largest,
+            'message': message
+        }
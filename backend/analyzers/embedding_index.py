@@ -0,0 +1,570 @@
+"""
+embedding_index.py
+Approximate nearest-neighbour index over CLIP image embeddings (IVF-PQ in NumPy)
+
+Used to find listing photos that are semantically close to images from other
+shops - dropshipped copies or AI-regenerated versions that a perceptual hash
+would not catch.
+
+Layout:
+  - Coarse quantizer: `nlist` spherical k-means centroids, each vector is filed
+    in the inverted list of its nearest centroid
+  - Product quantizer: the residual (vector - centroid) is split into `m`
+    sub-vectors, each stored as a 1-byte code into a 256-entry codebook
+  - Query: score the centroids, scan the `nprobe` best lists, and score every
+    code with one lookup table (m x 256) of query/codebook inner products
+
+Until `train_size` vectors have been inserted the index is exact (flat scan of
+the raw vectors); it trains itself once and every later insert is encoded
+incrementally. Embeddings are expected to be L2-normalized, scores are cosine.
+Training runs in a background thread; searches stay exact until it is done.
+
+Persistence: a .npz snapshot (vectors and metadata in one file, replaced
+atomically) plus an append-only NDJSON log of the inserts made since. The
+snapshot is rewritten in the background every `snapshot_every` inserts, and
+on load the log is replayed on top of it.
+"""
+
+import base64
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator, spherical: bool = False) -> np.ndarray:
+    """Plain Lloyd's k-means (cosine assignment when spherical)"""
+    centroids = x[rng.choice(len(x), size=k, replace=len(x) < k)].copy()
+    for _ in range(iters):
+        if spherical:
+            assign = (x @ centroids.T).argmax(axis=1)
+        else:
+            d = (x * x).sum(1)[:, None] - 2 * x @ centroids.T + (centroids * centroids).sum(1)[None, :]
+            assign = d.argmin(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            # Re-seed empty clusters with random points
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()))]
+        if spherical:
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+    return centroids.astype(np.float32)
+
+
+def _json_rows(rows: List[Dict], chunk: int = 10000) -> bytes:
+    """JSON array of rows, encoded in chunks - one json.dumps over a million rows holds the GIL for seconds"""
+    parts = [json.dumps(rows[i:i + chunk])[1:-1] for i in range(0, len(rows), chunk)]
+    return ('[' + ','.join(parts) + ']').encode('utf-8')
+
+
+class _InvertedList:
+    """
+    Growable (codes, ids) arrays for one coarse cell
+    Codes are stored sub-vector-major (m, n) so each lookup-table pass reads contiguous memory
+    """
+
+    def __init__(self, m: int):
+        self.codes = np.empty((m, 8), dtype=np.uint8)
+        self.ids = np.empty(8, dtype=np.int64)
+        self.size = 0
+
+    def add(self, codes: np.ndarray, ids: np.ndarray):
+        """Append codes of shape (n, m) and their ids"""
+        need = self.size + len(ids)
+        if need > len(self.ids):
+            cap = max(need, 2 * len(self.ids))
+            grown = np.empty((self.codes.shape[0], cap), dtype=np.uint8)
+            grown[:, :self.size] = self.codes[:, :self.size]
+            self.codes = grown
+            self.ids = np.resize(self.ids, cap)
+        self.codes[:, self.size:need] = codes.T
+        self.ids[self.size:need] = ids
+        self.size = need
+
+
+class EmbeddingIndex:
+    """
+    IVF-PQ approximate nearest-neighbour index with incremental inserts and persistence
+
+    Searches only wait for in-memory inserts: training and snapshot writes run
+    outside the lock (training in a background thread), and every insert is
+    appended to a log next to the snapshot instead of rewriting it.
+    """
+
+    def __init__(
+        self,
+        dim: int = 512,
+        nlist: int = 1024,
+        m: int = 64,
+        nprobe: int = 16,
+        train_size: int = 20000,
+        path: Optional[str] = None,
+        snapshot_every: int = 50000,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            dim: Embedding dimension (512 for ViT-B-32)
+            nlist: Number of coarse cells
+            m: PQ sub-vectors per embedding (bytes per stored vector); dim % m == 0
+            nprobe: Cells scanned per query
+            train_size: Vectors collected (and searched exactly) before training
+            path: .npz snapshot to persist to, with inserts since the snapshot appended
+                to path + '.log'; both loaded on startup if present
+            snapshot_every: Rewrite the snapshot in the background after this many logged
+                inserts (0 = only on explicit save() / flush())
+            seed: Seed for k-means initialisation
+        """
+        if dim % m:
+            raise ValueError("dim must be divisible by m")
+
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.dsub = dim // m
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.RLock()
+        self._log_lock = threading.Lock()  # keeps log lines in id order, held across an insert
+        self._save_lock = threading.Lock()  # one snapshot writer at a time
+
+        self.metadata = []  # per id: {'image', 'listing', 'seller'}
+        self.by_image = {}  # (image url, listing) -> id, so rescans do not duplicate vectors
+        self._flat = np.empty((0, dim), dtype=np.float32)  # raw vectors until trained
+        self._flat_size = 0
+        self.centroids = None
+        self.codebooks = None  # (m, 256, dsub)
+        self.lists = None
+        self._unsaved = 0  # inserts not in the snapshot yet (only in the log)
+        self._training = None  # background training thread
+        self._snapshotting = None  # background snapshot thread
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @property
+    def flat(self) -> np.ndarray:
+        """Raw vectors collected before training"""
+        return self._flat[:self._flat_size]
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self.metadata)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until background training and snapshot writes have finished"""
+        for thread in (self._training, self._snapshotting):
+            if thread is not None:
+                thread.join(timeout)
+
+    # ------------------------------------------------------------------
+    # Inserts
+    # ------------------------------------------------------------------
+    def add(self, vectors: np.ndarray, metadata: List[Dict]) -> List[int]:
+        """
+        Insert embeddings (an image already indexed for the same listing is skipped)
+
+        Args:
+            vectors: (n, dim) L2-normalized embeddings
+            metadata: One dict per vector (image, listing, seller)
+
+        Returns:
+            Ids of the vectors (the existing id for a skipped image)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(vectors) != len(metadata):
+            raise ValueError("vectors and metadata must have the same length")
+
+        with self._log_lock:
+            with self.lock:
+                assigned, new = self._insert(vectors, metadata)
+                start = len(self.metadata) - len(new)
+                path = self.path
+                if path:
+                    self._unsaved += len(new)
+                snapshot = bool(path and self.snapshot_every and self._unsaved >= self.snapshot_every
+                                and self._snapshotting is None)
+                if snapshot:
+                    self._snapshotting = threading.Thread(target=self._background_save, name='embedding-index-save',
+                                                          daemon=True)
+            # The log append happens outside the index lock, so searches do not wait on the disk
+            if path and new:
+                self._append_log(path, start, vectors[new], [metadata[i] for i in new])
+        if snapshot:
+            self._snapshotting.start()
+        return assigned
+
+    def _insert(self, vectors: np.ndarray, metadata: List[Dict]) -> tuple:
+        """In-memory part of add() (caller holds the lock): (ids per input row, positions of new rows)"""
+        assigned, new = [], []
+        for i, meta in enumerate(metadata):
+            key = (meta.get('image'), meta.get('listing'))
+            if key not in self.by_image:
+                self.by_image[key] = len(self.metadata) + len(new)
+                new.append(i)
+            assigned.append(self.by_image[key])
+        if not new:
+            return assigned, new
+
+        vectors = vectors[new]
+        start = len(self.metadata)
+        ids = np.arange(start, start + len(vectors))
+        self.metadata.extend(metadata[i] for i in new)
+
+        if self.trained:
+            self._encode_and_file(vectors, ids)
+        else:
+            self._append_flat(vectors)
+            self._start_training()
+        return assigned, new
+
+    def _start_training(self):
+        """Train in the background once train_size vectors are in (caller holds the lock)"""
+        if self.trained or self._flat_size < self.train_size or self._training is not None:
+            return
+        # Rows [0, n) of the flat buffer never change, so training can read them unlocked
+        self._training = threading.Thread(target=self._train, args=(self.flat,),
+                                          name='embedding-index-train', daemon=True)
+        self._training.start()
+
+    def _append_flat(self, vectors: np.ndarray):
+        end = self._flat_size + len(vectors)
+        if end > len(self._flat):
+            # Preallocate up to train_size (then double) so single-vector inserts do not copy the buffer
+            grown = np.empty((max(end, self.train_size, 2 * len(self._flat)), self.dim), dtype=np.float32)
+            grown[:self._flat_size] = self.flat
+            self._flat = grown
+        self._flat[self._flat_size:end] = vectors
+        self._flat_size = end
+
+    def _train(self, x: np.ndarray):
+        """Train on x (the first len(x) ids) without the lock, then swap the trained index in"""
+        try:
+            logger.info(f"🔧 Training embedding index on {len(x)} vectors ({self.nlist} cells, {self.m} bytes/vector)...")
+            nlist = min(self.nlist, len(x))
+            centroids = _kmeans(x, nlist, iters=10, rng=self.rng, spherical=True)
+
+            residuals = x - centroids[(x @ centroids.T).argmax(axis=1)]
+            sub = residuals.reshape(len(x), self.m, self.dsub)
+            codebooks = np.stack([
+                _kmeans(sub[:, j, :], 256, iters=8, rng=self.rng) for j in range(self.m)
+            ])
+
+            lists = [_InvertedList(self.m) for _ in range(nlist)]
+            self._encode_and_file(x, np.arange(len(x)), centroids, codebooks, lists)
+
+            with self.lock:
+                # Vectors inserted while training ran are still flat (ids from len(x) on)
+                rest = self.flat[len(x):]
+                self.centroids, self.codebooks, self.lists = centroids, codebooks, lists
+                if len(rest):
+                    self._encode_and_file(rest, np.arange(len(x), len(x) + len(rest)))
+                self._flat = np.empty((0, self.dim), dtype=np.float32)
+                self._flat_size = 0
+            logger.info("✅ Embedding index trained")
+        except Exception as e:
+            logger.error(f"❌ Embedding index training failed: {e}")
+        finally:
+            self._training = None
+
+    def _encode(self, residuals: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        sub = residuals.reshape(len(residuals), self.m, self.dsub)
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            cb = codebooks[j]
+            d = -2 * sub[:, j, :] @ cb.T + (cb * cb).sum(1)[None, :]
+            codes[:, j] = d.argmin(axis=1)
+        return codes
+
+    def _encode_and_file(self, vectors: np.ndarray, ids: np.ndarray, centroids=None, codebooks=None, lists=None):
+        """Encode vectors into inverted lists (the index's own unless given)"""
+        if centroids is None:
+            centroids, codebooks, lists = self.centroids, self.codebooks, self.lists
+        cells = (vectors @ centroids.T).argmax(axis=1)
+        codes = self._encode(vectors - centroids[cells], codebooks)
+        order = np.argsort(cells, kind='stable')
+        cells, codes, ids = cells[order], codes[order], ids[order]
+        bounds = np.flatnonzero(np.diff(cells)) + 1
+        for part in np.split(np.arange(len(cells)), bounds):
+            if len(part):
+                lists[cells[part[0]]].add(codes[part], ids[part])
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Dict]:
+        """
+        Top-k most similar stored images
+
+        Args:
+            query: (dim,) L2-normalized embedding
+            k: Number of results
+            nprobe: Override cells scanned (more = better recall, slower)
+
+        Returns:
+            List of metadata dicts with 'id' and approximate cosine 'score', best first
+        """
+        q = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self.lock:
+            if not self.metadata:
+                return []
+
+            if not self.trained:
+                scores = self.flat @ q
+                ids = np.arange(len(scores))
+            else:
+                coarse = self.centroids @ q
+                probe = min(nprobe or self.nprobe, len(self.lists))
+                cells = np.argpartition(-coarse, probe - 1)[:probe]
+                cells = [c for c in cells if self.lists[c].size]
+                if not cells:
+                    return []
+
+                # <q, centroid + residual> = <q, centroid> + sum_j <q_j, codebook_j[code_j]>
+                lut = np.einsum('jd,jkd->jk', q.reshape(self.m, self.dsub), self.codebooks)
+                codes = np.concatenate([self.lists[c].codes[:, :self.lists[c].size] for c in cells], axis=1)
+                ids = np.concatenate([self.lists[c].ids[:self.lists[c].size] for c in cells])
+                scores = np.repeat(coarse[cells], [self.lists[c].size for c in cells])
+                for j in range(self.m):
+                    scores += lut[j].take(codes[j])
+
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {**self.metadata[int(ids[i])], 'id': int(ids[i]), 'score': round(float(scores[i]), 4)}
+                for i in top
+            ]
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self, path: Optional[str] = None):
+        """
+        Write a snapshot (vectors and metadata in one .npz, replaced atomically) and
+        drop the log entries it now contains
+
+        The index lock is only held to take references to the arrays - inserts append
+        past them or replace them, never change them - so searches keep running while
+        the file is written.
+        """
+        path = path or self.path
+        if not path:
+            return
+        own = path == self.path
+        with self._save_lock:
+            with self._log_lock, self.lock:
+                state = self._snapshot()
+                unsaved = self._unsaved if own else 0
+                self._unsaved -= unsaved
+                if own:
+                    # Inserts from now on go to a fresh log; the rotated one is dropped once
+                    # the snapshot that contains it is in place
+                    self._rotate_log(path)
+            try:
+                self._write_snapshot(path, state)
+            except Exception:
+                with self.lock:
+                    self._unsaved += unsaved
+                raise
+            if own and os.path.exists(path + '.log.old'):
+                os.remove(path + '.log.old')
+        logger.info(f"💾 Saved embedding index ({state['rows']} vectors) to {path}")
+
+    def _background_save(self):
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"❌ Saving embedding index failed: {e}")
+        finally:
+            self._snapshotting = None
+
+    def flush(self):
+        """Write a snapshot only if there are inserts since the last one (after any background write)"""
+        thread = self._snapshotting
+        if thread is not None:
+            thread.join()
+        if self._unsaved:
+            self.save()
+
+    def _snapshot(self) -> Dict:
+        """References to the current state (caller holds the lock)"""
+        return {
+            'config': np.array([self.dim, self.nlist, self.m, self.nprobe, self.train_size]),
+            'rows': len(self.metadata),
+            'metadata': self.metadata[:],
+            'flat': self.flat,
+            'centroids': self.centroids,
+            'codebooks': self.codebooks,
+            'lists': [(lst.codes, lst.ids, lst.size) for lst in self.lists] if self.trained else None,
+        }
+
+    def _write_snapshot(self, path: str, state: Dict):
+        arrays = {
+            'config': state['config'],
+            'rows': np.array([state['rows']]),
+            'metadata': np.frombuffer(_json_rows(state['metadata']), dtype=np.uint8),
+            'flat': state['flat'],
+        }
+        if state['lists'] is not None:
+            arrays.update({
+                'centroids': state['centroids'],
+                'codebooks': state['codebooks'],
+                'list_sizes': np.array([size for _, _, size in state['lists']]),
+                'codes': np.concatenate([codes[:, :size].T for codes, _, size in state['lists']]),
+                'ids': np.concatenate([ids[:size] for _, ids, size in state['lists']]),
+            })
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+        # Sidecar of the old two-file layout, now stale
+        if os.path.exists(path + '.meta.json'):
+            os.remove(path + '.meta.json')
+
+    # Insert log: one NDJSON line per vector, {"id", "meta", "vector" (base64 float32)}
+    def _append_log(self, path: str, start: int, vectors: np.ndarray, metadata: List[Dict]):
+        lines = ''.join(
+            json.dumps({'id': start + i, 'meta': meta,
+                        'vector': base64.b64encode(vec.astype('<f4').tobytes()).decode('ascii')}) + '\n'
+            for i, (vec, meta) in enumerate(zip(vectors, metadata))
+        )
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path + '.log', 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError as e:
+            logger.error(f"❌ Could not append to embedding index log {path}.log: {e}")
+
+    def _rotate_log(self, path: str):
+        """Move the log aside (appending to a rotated log a failed save left behind)"""
+        log, old = path + '.log', path + '.log.old'
+        if not os.path.exists(log):
+            return
+        if os.path.exists(old):
+            with open(log, 'rb') as src, open(old, 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(log)
+        else:
+            os.replace(log, old)
+
+    def _replay_log(self, path: str):
+        """Apply logged inserts the snapshot does not contain; returns (applied, dropped)"""
+        entries = []
+        for log in (path + '.log.old', path + '.log'):
+            if not os.path.exists(log):
+                continue
+            with open(log, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        vec = np.frombuffer(base64.b64decode(rec['vector']), dtype='<f4')
+                        if len(vec) != self.dim:
+                            raise ValueError(f"vector of {len(vec)} values")
+                        entries.append((int(rec['id']), rec['meta'], vec))
+                    except (ValueError, KeyError, TypeError) as e:
+                        # A torn last line after a crash - or a damaged log; later ids would not line up
+                        logger.warning(f"⚠️ Bad embedding index log line in {log}: {e}")
+                        entries.append((None, None, None))
+
+        vectors, metadata, dropped = [], [], 0
+        expected = len(self.metadata)
+        for i, (rid, meta, vec) in enumerate(entries):
+            if rid is not None and rid < expected:
+                continue  # already in the snapshot
+            if rid != expected + len(vectors):
+                dropped = len(entries) - i
+                break
+            vectors.append(vec)
+            metadata.append(meta)
+        if vectors:
+            self._insert(np.stack(vectors).astype(np.float32), metadata)
+        return len(vectors), dropped
+
+    def load(self, path: str):
+        """
+        Load an index written by save(), then replay the inserts logged since
+
+        A snapshot whose vectors and metadata do not line up (e.g. an old .npz whose
+        .meta.json sidecar is missing or from another save) is ignored with a
+        warning - the index starts empty and rebuilds from new scans.
+        """
+        try:
+            state = self._read(path)
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring embedding index {path}: {e} - starting empty")
+            state = None
+
+        with self._log_lock, self.lock:
+            if state is not None:
+                self.dim, self.nlist, self.m, self.nprobe, self.train_size = state['config']
+                self.dsub = self.dim // self.m
+                self._flat = state['flat']
+                self._flat_size = len(self._flat)
+                self.centroids, self.codebooks, self.lists = state['centroids'], state['codebooks'], state['lists']
+                self.metadata = state['metadata']
+                self.by_image = {}
+                for i, meta in enumerate(self.metadata):
+                    self.by_image.setdefault((meta.get('image'), meta.get('listing')), i)
+            applied, dropped = self._replay_log(path)
+            if path == self.path:
+                self._unsaved = applied
+            self._start_training()
+        logger.info(f"✅ Loaded embedding index ({len(self.metadata)} vectors, {applied} from the log) from {path}")
+        if dropped:
+            # Log entries that do not follow on from the snapshot: write a clean snapshot
+            # so new inserts are not logged after them
+            logger.warning(f"⚠️ Dropped {dropped} embedding index log entries that do not match the snapshot")
+            if path == self.path:
+                self.save()
+
+    def _read(self, path: str) -> Dict:
+        """Index state from a save() file; raises ValueError if it is inconsistent"""
+        with np.load(path) as z:
+            config = tuple(int(v) for v in z['config'])
+            m = config[2]
+            flat = z['flat'].astype(np.float32)
+            centroids = codebooks = lists = None
+            ids = np.empty(0, dtype=np.int64)
+            if 'centroids' in z:
+                centroids, codebooks = z['centroids'], z['codebooks']
+                lists = [_InvertedList(m) for _ in range(len(centroids))]
+                offsets = np.concatenate(([0], np.cumsum(z['list_sizes'])))
+                codes, ids = z['codes'], z['ids']
+                if offsets[-1] != len(ids) or len(codes) != len(ids):
+                    raise ValueError("inverted lists do not match their codes")
+                for c, lst in enumerate(lists):
+                    a, b = offsets[c], offsets[c + 1]
+                    if b > a:
+                        lst.add(codes[a:b], ids[a:b])
+            if 'metadata' in z:
+                metadata = json.loads(z['metadata'].tobytes().decode('utf-8'))
+                rows = int(z['rows'][0])
+            else:
+                # Older two-file layout: vectors here, metadata in a sidecar replaced separately
+                with open(path + '.meta.json', 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+                rows = len(metadata)
+
+        vectors = len(flat) + len(ids)
+        if not (rows == len(metadata) == vectors) or (len(ids) and int(ids.max()) >= rows):
+            raise ValueError(f"{vectors} vectors but {len(metadata)} metadata rows (expected {rows})")
+        return {'config': config, 'flat': flat, 'centroids': centroids, 'codebooks': codebooks,
+                'lists': lists, 'metadata': metadata}
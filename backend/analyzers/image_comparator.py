@@ -0,0 +1,347 @@
+"""
+image_comparator.py
+Perceptual-hash index over every listing image we have scanned
+
+Flags listings whose product photos already appeared under a different seller
+(stolen or dropshipped images). Each image gets a 64-bit pHash (DCT based, robust
+to resizing and recompression) plus a 64-bit dHash for reporting.
+
+The index stores the pHashes as packed 64-bit integers and answers Hamming-radius
+queries with multi-index hashing: the hash is split into 4 chunks of 16 bits, and
+any hash within radius r must match at least one chunk within r // 4 bits, so a
+query only probes a few dozen buckets instead of scanning every stored image.
+
+Entries are appended to an NDJSON file so the index survives restarts.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import combinations
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+from PIL import Image
+
+from metrics import IMAGE_DOWNLOAD_SECONDS, IMAGE_DOWNLOAD_ERRORS
+from tracing import span, annotate
+from capture import record_image
+from analyzers.utils.seller_key import different_seller, count_sellers
+
+logger = logging.getLogger(__name__)
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), 'big')
+
+
+def phash(img: Image.Image) -> int:
+    """64-bit perceptual hash: sign of the low-frequency DCT coefficients vs their median"""
+    gray = np.asarray(img.convert('L').resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    low = (_DCT_32 @ gray @ _DCT_32.T)[:8, :8]
+    median = np.median(low.ravel()[1:])  # DC term would dominate the median
+    return _bits_to_int(low > median)
+
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash: horizontal brightness gradient signs on a 9x8 thumbnail"""
+    gray = np.asarray(img.convert('L').resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    return _bits_to_int(gray[:, 1:] > gray[:, :-1])
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _chunk_neighbours(value: int, radius: int) -> List[int]:
+    """All CHUNK_BITS-bit values within `radius` bit flips of value"""
+    out = [value]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            flipped = value
+            for b in bits:
+                flipped ^= 1 << b
+            out.append(flipped)
+    return out
+
+
+class PerceptualHashIndex:
+    """
+    Multi-index hash table of 64-bit image hashes with Hamming-radius queries
+    Thread-safe; optionally persisted to an append-only NDJSON file
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.hashes = np.zeros(1024, dtype=np.uint64)
+        self.entries = []  # metadata per id: image, listing, seller, dhash
+        self.tables = [dict() for _ in range(CHUNKS)]
+        self.by_image = {}  # (image url, listing) -> id, so rescans do not duplicate entries
+        self.lock = threading.RLock()
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _load(self):
+        loaded = skipped = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                    self._insert(self._check_record(rec), rec)
+                    loaded += 1
+                except (ValueError, KeyError, TypeError) as e:
+                    skipped += 1
+                    logger.warning(f"⚠️ Skipping bad image hash record: {e}")
+        logger.info(f"✅ Loaded {loaded} image hashes from {self.path}"
+                    + (f" ({skipped} bad records skipped)" if skipped else ""))
+
+    @staticmethod
+    def _check_record(rec) -> int:
+        """pHash of a persisted record; raises if a field check_listing() reads is missing or malformed"""
+        if not isinstance(rec, dict):
+            raise TypeError(f"not a record: {rec!r:.80}")
+        for key in ('image', 'listing', 'phash', 'dhash'):
+            if not isinstance(rec.get(key), str):
+                raise ValueError(f"missing or non-string {key!r}")
+        values = []
+        for key in ('phash', 'dhash'):
+            value = int(rec[key], 16)
+            if not 0 <= value < 1 << 64:
+                raise ValueError(f"{key} out of range: {rec[key]!r:.40}")
+            values.append(value)
+        return values[0]
+
+    def _insert(self, phash_value: int, rec: Dict) -> int:
+        key = (rec.get('image'), rec.get('listing'))
+        if key in self.by_image:
+            return self.by_image[key]
+
+        idx = len(self.entries)
+        if idx >= len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.zeros_like(self.hashes)])
+        self.hashes[idx] = phash_value
+        self.entries.append(rec)
+        self.by_image[key] = idx
+
+        for c in range(CHUNKS):
+            chunk = (phash_value >> (c * CHUNK_BITS)) & CHUNK_MASK
+            self.tables[c].setdefault(chunk, []).append(idx)
+        return idx
+
+    def add(self, phash_value: int, dhash_value: int, image: str, listing: str, seller: Optional[str]) -> int:
+        """Insert one image hash (no-op if this image is already indexed for the listing)"""
+        rec = {
+            'phash': f'{phash_value:016x}',
+            'dhash': f'{dhash_value:016x}',
+            'image': image,
+            'listing': listing,
+            'seller': seller,
+        }
+        with self.lock:
+            before = len(self.entries)
+            idx = self._insert(phash_value, rec)
+            if self.path and len(self.entries) > before:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(rec) + '\n')
+        return idx
+
+    def query(self, phash_value: int, radius: int = 6) -> List[Dict]:
+        """
+        Find every indexed image within `radius` bits of phash_value
+
+        Returns:
+            List of entry dicts with an added 'distance', nearest first
+        """
+        sub_radius = radius // CHUNKS
+        with self.lock:
+            candidates = set()
+            for c in range(CHUNKS):
+                chunk = (phash_value >> (c * CHUNK_BITS)) & CHUNK_MASK
+                table = self.tables[c]
+                for probe in _chunk_neighbours(chunk, sub_radius):
+                    ids = table.get(probe)
+                    if ids:
+                        candidates.update(ids)
+
+            if not candidates:
+                return []
+
+            ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            distances = np.bitwise_count(self.hashes[ids] ^ np.uint64(phash_value))
+            keep = distances <= radius
+            matches = [
+                {**self.entries[i], 'distance': int(d)}
+                for i, d in zip(ids[keep].tolist(), distances[keep].tolist())
+            ]
+
+        return sorted(matches, key=lambda m: m['distance'])
+
+
+class ImageComparator:
+    """
+    Check a listing's images against the perceptual-hash index, then add them to it
+    """
+
+    def __init__(
+        self,
+        index_path: Optional[str] = None,
+        radius: int = 6,
+        max_images: int = 5,
+        timeout: int = 10,
+    ):
+        """
+        Args:
+            index_path: NDJSON file backing the index (None = in-memory only)
+            radius: Max pHash Hamming distance that counts as the same photo
+            max_images: Listing images hashed per scan
+            timeout: Image download timeout in seconds
+        """
+        self.index = PerceptualHashIndex(index_path)
+        self.radius = radius
+        self.max_images = max_images
+        self.timeout = timeout
+        logger.info(f"✅ ImageComparator initialized ({len(self.index)} images indexed)")
+
+    def hash_image_url(self, url: str) -> Optional[Dict]:
+        """Download image URL -> {'phash', 'dhash'} (ints), None on failure"""
+        started, resp = time.perf_counter(), None
+        try:
+            with span('download', source='image_comparator', url=url[:120]) as s, \
+                    IMAGE_DOWNLOAD_SECONDS.time(source='image_comparator'):
+                resp = requests.get(url, timeout=self.timeout, headers={"User-Agent": "Mozilla/5.0"})
+                record_image(url, resp.content, resp.status_code, time.perf_counter() - started, 'image_comparator')
+                resp.raise_for_status()
+                annotate(s, bytes=len(resp.content))
+            return self.hash_pil(Image.open(BytesIO(resp.content)))
+        except Exception as e:
+            if resp is None:
+                record_image(url, None, None, time.perf_counter() - started, 'image_comparator', error=str(e))
+            IMAGE_DOWNLOAD_ERRORS.inc(source='image_comparator')
+            logger.error(f"❌ Error hashing image {url[:80]}: {e}")
+            return None
+
+    def hash_pil(self, img: Image.Image) -> Dict:
+        """Already downloaded image -> {'phash', 'dhash'} (ints)"""
+        return {'phash': phash(img), 'dhash': dhash(img)}
+
+    def check_listing(
+        self,
+        listing_url: str,
+        seller: Optional[str],
+        image_urls: List[str],
+        images: Optional[Dict[str, Optional[Image.Image]]] = None,
+    ) -> Dict:
+        """
+        Look up each listing image in the index, then register the images
+
+        Args:
+            listing_url: Listing URL (query string is ignored)
+            seller: analyzers.utils.seller_key key (shop id and/or seller name); None if unknown
+            image_urls: Valid listing image URLs
+            images: Optional url -> PIL.Image map of images the caller already
+                downloaded (None value = download failed); skips the thread-pool fetch
+
+        Returns:
+            Dict with per-image matches on other listings / other sellers
+        """
+        listing = (listing_url or '').split('?')[0]
+        seller = str(seller) if seller not in (None, '') else None
+        urls = image_urls[:self.max_images]
+
+        if not urls:
+            return {
+                'analyzed': False,
+                'message': 'No listing images to hash',
+                'images_hashed': 0,
+                'matches': [],
+            }
+
+        if images is not None:
+            hashes = [self.hash_pil(images[u]) if images.get(u) is not None else None for u in urls]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(urls), 5)) as pool:
+                # copy_context per download keeps them in the caller's trace
+                hashes = [f.result() for f in [
+                    pool.submit(contextvars.copy_context().run, self.hash_image_url, url) for url in urls
+                ]]
+
+        matches = []
+        other_sellers = set()
+        other_listings = set()
+        hashed = 0
+
+        for url, h in zip(urls, hashes):
+            if h is None:
+                continue
+            hashed += 1
+
+            for m in self.index.query(h['phash'], self.radius):
+                if m['listing'] == listing:
+                    continue
+                other_listings.add(m['listing'])
+                different = different_seller(seller, m.get('seller'))
+                if different:
+                    other_sellers.add(m['seller'])
+                matches.append({
+                    'image_url': url,
+                    'matched_image_url': m['image'],
+                    'matched_listing': m['listing'],
+                    'matched_seller': m.get('seller'),
+                    'different_seller': different,
+                    'distance': m['distance'],
+                    'dhash_distance': hamming(h['dhash'], int(m['dhash'], 16)),
+                })
+
+            self.index.add(h['phash'], h['dhash'], url, listing, seller)
+
+        images_reused = len({m['image_url'] for m in matches if m['different_seller']})
+        other_seller_count = count_sellers(other_sellers)
+
+        if images_reused:
+            message = f"🚩 {images_reused} image(s) also appear under {other_seller_count} other seller(s)"
+        elif other_listings:
+            message = f"ℹ️ Images also appear on {len(other_listings)} other listing(s)"
+        else:
+            message = 'No matching images on other listings'
+
+        return {
+            'analyzed': hashed > 0,
+            'images_hashed': hashed,
+            'images_reused_by_other_sellers': images_reused,
+            'other_seller_count': other_seller_count,
+            'other_listing_count': len(other_listings),
+            'matches': matches[:20],
+            'index_size': len(self.index),
+            'radius': self.radius,
+            'message': message,
+        }
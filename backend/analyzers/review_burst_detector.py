@@ -0,0 +1,120 @@
+"""
+review_burst_detector.py
+Detects suspicious bursts of reviews posted in a short time window
+
+Everything runs on a sorted NumPy array of review days, so the cost is one
+O(n log n) sort plus O(n) vector operations - no pairwise date comparisons.
+  - Sliding window: max number of reviews inside any `window_days` window
+  - Gap statistics: median/mean gap between consecutive reviews, excess same-day share
+  - Histogram: per-window review counts, z-score of the busiest bin
+"""
+
+import logging
+from typing import Dict, Iterable
+
+import numpy as np
+
+from analyzers.utils.date_parser import parse_review_dates
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewBurstDetector:
+    """
+    Score how strongly a listing's reviews are clustered in time
+    Score: 0-100 (0 = spread out naturally, 100 = everything posted at once)
+    """
+
+    def __init__(self, window_days: int = 7, min_reviews: int = 5, min_history_windows: int = 4):
+        """
+        Args:
+            window_days: Width of the sliding window / histogram bins
+            min_reviews: Fewer parsed dates than this are not scored
+            min_history_windows: Shortest history (in windows) assumed when computing
+                the share a uniform review stream would put in one window. Stops a
+                brand-new listing whose reviews all landed this week from looking normal.
+        """
+        self.window_days = window_days
+        self.min_reviews = min_reviews
+        self.min_history_windows = min_history_windows
+
+    def analyze(self, dates: Iterable) -> Dict:
+        """
+        Analyze review dates for bursts
+
+        Args:
+            dates: Review date strings or timestamps (any format date_parser understands)
+
+        Returns:
+            Dict with burst score, window/gap/histogram statistics and a message
+        """
+        parsed = parse_review_dates(list(dates))
+        valid = parsed[~np.isnat(parsed)]
+        n = len(valid)
+
+        if n < self.min_reviews:
+            return {
+                'analyzed': False,
+                'total_dates': len(parsed),
+                'parsed_dates': n,
+                'burst_score': 0,
+                'message': f'Not enough dated reviews ({n}) to check clustering'
+            }
+
+        days = np.sort(valid.astype(np.int64))
+        window = self.window_days
+        span_days = int(days[-1] - days[0]) + 1
+
+        # Sliding window max density - for each review, how many fall in [day, day + window)
+        ends = np.searchsorted(days, days + window, side='left')
+        counts = ends - np.arange(n)
+        best = int(counts.argmax())
+        max_in_window = int(counts[best])
+        window_share = max_in_window / n
+
+        # Share a uniform stream would put in one window over (at least) the minimum history
+        reference_span = max(span_days, window * self.min_history_windows)
+        expected_share = min(1.0, window / reference_span)
+        share_component = float(np.clip((window_share - expected_share) / (1 - expected_share), 0, 1)) \
+            if expected_share < 1 else 0.0
+
+        # Gap statistics
+        gaps = np.diff(days)
+        median_gap = float(np.median(gaps)) if len(gaps) else 0.0
+        mean_gap = float(gaps.mean()) if len(gaps) else 0.0
+        same_day_share = float((gaps == 0).mean()) if len(gaps) else 0.0
+
+        # Large shops post several reviews a day anyway - only same-day sharing beyond that counts
+        expected_same_day = max(0.0, 1 - reference_span / n)
+        same_day_component = float(np.clip((same_day_share - expected_same_day) / (1 - expected_same_day), 0, 1))
+
+        # Histogram anomaly - z-score of the busiest window-sized bin
+        bins = np.bincount((days - days[0]) // window)
+        if len(bins) > 1 and bins.std() > 0:
+            peak_z = float((bins.max() - bins.mean()) / bins.std())
+        else:
+            peak_z = 0.0
+        anomaly_component = float(np.clip((peak_z - 2) / 4, 0, 1))
+
+        burst_score = 100 * (0.5 * share_component + 0.3 * anomaly_component + 0.2 * same_day_component)
+
+        burst_start = np.datetime64(int(days[best]), 'D')
+
+        return {
+            'analyzed': True,
+            'total_dates': len(parsed),
+            'parsed_dates': n,
+            'burst_score': round(float(burst_score), 1),
+            'window_days': window,
+            'max_reviews_in_window': max_in_window,
+            'max_window_share': round(window_share, 3),
+            'expected_window_share': round(expected_share, 3),
+            'burst_start': str(burst_start),
+            'burst_end': str(burst_start + (window - 1)),
+            'span_days': span_days,
+            'median_gap_days': round(median_gap, 2),
+            'mean_gap_days': round(mean_gap, 2),
+            'same_day_share': round(same_day_share, 3),
+            'histogram_peak_z': round(peak_z, 2),
+            'message': f'{max_in_window}/{n} reviews within {window} days starting {burst_start}'
+        }
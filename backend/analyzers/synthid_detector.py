@@ -3,6 +3,7 @@ synthid_detector.py - Complete AI Image Detector
 Using Gemini 1.5 Flash (proven to work)
 """
 
+import asyncio
 import os
 import google.generativeai as genai
 from PIL import Image
@@ -11,8 +12,14 @@ from io import BytesIO
 import logging
 import json
 import re
+import threading
+import time
 from typing import Dict
 
+from metrics import IMAGE_DOWNLOAD_SECONDS, IMAGE_DOWNLOAD_ERRORS, GEMINI_SECONDS, GEMINI_IN_FLIGHT
+from tracing import span, annotate
+from capture import record_image, record_gemini
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,13 +30,61 @@ class SynthIDDetector:
     Complete AI Image Detector - uses proven working models
     """
     
-    def __init__(self, api_key: str = None):
-        """Initialize with Gemini API key"""
+    def __init__(self, api_key: str = None, model=None, model_name: str = None, request_timeout: float = None,
+                 connect: bool = True):
+        """
+        Initialize with Gemini API key
+        
+        Args:
+            api_key: Gemini API key (default: GEMINI_API_KEY)
+            model: Ready model object (generate_content / generate_content_async) -
+                   skips configure + the model probe, e.g. the benchmarks' fake Gemini
+            model_name: Reported as model_used when model is given
+            request_timeout: Seconds a Gemini call may take before it is abandoned
+                             (None = the client library's default)
+            connect: Pick and probe the Gemini model now; False defers it to connect()
+                     or the first analysis - e.g. in a process that forks workers
+                     afterwards (gRPC channels opened before a fork are not fork-safe)
+        """
+        self.request_timeout = request_timeout
+        self._connect_lock = threading.Lock()
+        self._connect_error = None
+        if model is not None:
+            self.api_key = api_key
+            self.model = model
+            self.model_name = model_name or type(model).__name__
+            return
+        
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         
         if not self.api_key:
             raise ValueError("❌ GEMINI_API_KEY not found in .env file!")
         
+        self.model = None
+        self.model_name = None
+        if connect:
+            self.connect()
+    
+    def connect(self):
+        """
+        Configure Gemini and pick the first model that answers a probe (no-op once connected)
+        
+        A failure is remembered and re-raised, like a detector whose constructor failed
+        """
+        if self.model is not None:
+            return
+        with self._connect_lock:
+            if self.model is not None:
+                return
+            if self._connect_error is not None:
+                raise self._connect_error
+            try:
+                self._connect()
+            except ValueError as e:
+                self._connect_error = e
+                raise
+    
+    def _connect(self):
         # Configure Gemini
         genai.configure(api_key=self.api_key)
         
@@ -41,17 +96,15 @@ class SynthIDDetector:
             'gemini-3-flash-preview',  # Try Gemini 3 as last resort
         ]
         
-        self.model = None
-        self.model_name = None
-        
         for model_name in model_names:
             try:
                 logger.info(f"Attempting to load model: {model_name}")
-                self.model = genai.GenerativeModel(model_name)
+                model = genai.GenerativeModel(model_name)
                 # Test the model with a simple prompt
-                test = self.model.generate_content("test")
+                test = model.generate_content("test")
                 logger.info(f"✅ SUCCESS! Using model: {model_name}")
                 self.model_name = model_name
+                self.model = model
                 return
             except Exception as e:
                 logger.warning(f"❌ Failed to load {model_name}: {e}")
@@ -62,56 +115,119 @@ class SynthIDDetector:
         """
         Complete image analysis - AI detection
         """
-        logger.info(f"🔍 Analyzing image: {image_url[:50]}...")
+        logger.debug("🔍 Analyzing image: %.50s...", image_url)
         
+        started, response = time.perf_counter(), None
         try:
             # Download the image with proper headers
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             }
-            response = requests.get(image_url, timeout=15, headers=headers)
+            with span('download', source='synthid', url=image_url[:120]) as s, \
+                    IMAGE_DOWNLOAD_SECONDS.time(source='synthid'):
+                response = requests.get(image_url, timeout=15, headers=headers)
+                record_image(image_url, response.content, response.status_code, time.perf_counter() - started, 'synthid')
+                annotate(s, bytes=len(response.content), http_status=response.status_code)
             
             if response.status_code != 200:
+                IMAGE_DOWNLOAD_ERRORS.inc(source='synthid')
                 return self._error_result(f"HTTP {response.status_code}")
             
             # Open image
             try:
                 img = Image.open(BytesIO(response.content))
-                logger.info(f"Image loaded: {img.size} {img.format}")
+                logger.debug("Image loaded: %s %s", img.size, img.format)
             except Exception as e:
                 return self._error_result(f"Cannot open image: {str(e)}")
             
-            # Resize large images to prevent timeout
-            max_size = 1024
-            if max(img.size) > max_size:
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                logger.info(f"Resized to: {img.size}")
+            return self.analyze_pil(img)
             
-            # Use the prompt that worked in your logs
-            prompt = self._create_full_prompt()
+        except Exception as e:
+            if response is None:
+                record_image(image_url, None, None, time.perf_counter() - started, 'synthid', error=str(e))
+            logger.error(f"Error in analyze_image: {e}")
+            return self._error_result(str(e))
+    
+    def analyze_pil(self, img: Image.Image) -> Dict:
+        """
+        AI detection on an already downloaded image
+        """
+        try:
+            img = self._prepare_image(img)
+            self.connect()
             
             # Send to Gemini
-            response = self.model.generate_content([prompt, img])
+            started = time.perf_counter()
+            try:
+                with span('gemini'), GEMINI_IN_FLIGHT.track(), GEMINI_SECONDS.time(mode='sync'):
+                    response = self.model.generate_content([self._create_full_prompt(), img], **self._request_kwargs())
+            except Exception as e:
+                record_gemini(None, time.perf_counter() - started, 'sync', error=str(e))
+                raise
+            record_gemini(response.text, time.perf_counter() - started, 'sync')
             
-            # Parse the response
-            result = self._parse_response(response.text)
+            return self._finish_result(response.text)
             
-            # Add model info
-            result['model_used'] = self.model_name
+        except Exception as e:
+            logger.error(f"Error in analyze_pil: {e}")
+            return self._error_result(str(e))
+    
+    async def analyze_pil_async(self, img: Image.Image) -> Dict:
+        """
+        Same as analyze_pil, but awaits Gemini instead of blocking a thread
+        """
+        try:
+            img = self._prepare_image(img)
+            if self.model is None:
+                await asyncio.to_thread(self.connect)
             
-            if result['is_ai_generated']:
-                logger.info(f"✅ AI DETECTED! Confidence: {result['confidence']}%")
-                if result.get('indicators'):
-                    logger.info(f"   Indicators: {result['indicators']}")
-            else:
-                logger.info(f"❌ No AI detected")
+            # Send to Gemini
+            started = time.perf_counter()
+            try:
+                with span('gemini'), GEMINI_IN_FLIGHT.track(), GEMINI_SECONDS.time(mode='async'):
+                    response = await self.model.generate_content_async(
+                        [self._create_full_prompt(), img], **self._request_kwargs()
+                    )
+            except Exception as e:
+                record_gemini(None, time.perf_counter() - started, 'async', error=str(e))
+                raise
+            record_gemini(response.text, time.perf_counter() - started, 'async')
             
-            return result
+            return self._finish_result(response.text)
             
         except Exception as e:
-            logger.error(f"Error in analyze_image: {e}")
+            logger.error(f"Error in analyze_pil_async: {e}")
             return self._error_result(str(e))
     
+    def _request_kwargs(self) -> Dict:
+        """generate_content options - a timeout ends calls the pipeline has stopped waiting for"""
+        return {'request_options': {'timeout': self.request_timeout}} if self.request_timeout else {}
+    
+    def _prepare_image(self, img: Image.Image) -> Image.Image:
+        """Resize large images to prevent timeout"""
+        max_size = 1024
+        if max(img.size) > max_size:
+            img = img.copy()
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            logger.debug("Resized to: %s", img.size)
+        return img
+    
+    def _finish_result(self, response_text: str) -> Dict:
+        """Parse Gemini's answer and log the verdict"""
+        result = self._parse_response(response_text)
+        
+        # Add model info
+        result['model_used'] = self.model_name
+        
+        if result['is_ai_generated']:
+            logger.info("✅ AI DETECTED! Confidence: %s%%", result['confidence'])
+            if result.get('indicators'):
+                logger.debug("   Indicators: %s", result['indicators'])
+        else:
+            logger.info(f"❌ No AI detected")
+        
+        return result
+    
     def _create_full_prompt(self) -> str:
         """
         Complete prompt that checks for AI generation signs
@@ -0,0 +1,132 @@
+"""
+date_parser.py
+Fast parsing of Etsy review dates into NumPy datetime64 arrays
+
+Handles the formats seen from the deep_dive_reviews API and the DOM scraper:
+  - "Jan 5, 2024" / "January 5, 2024" / "Sept. 5th, 2024"
+  - "5 Jan, 2024" / "5 January 2024"
+  - "2024-01-05" / "2024-01-05T12:30:00Z"
+  - "01/05/2024" (US month/day/year)
+  - Unix timestamps in seconds or milliseconds (int or float)
+
+Review pages repeat the same date strings many times, so string parsing is
+memoized and each distinct string is only parsed once per process.
+"""
+
+import math
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, Optional
+
+import numpy as np
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+_MONTH_FIRST = re.compile(r'^([a-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})$')
+_DAY_FIRST = re.compile(r'^(\d{1,2})(?:st|nd|rd|th)?\s+([a-z]{3,9})\.?,?\s+(\d{4})$')
+_ISO = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})(?:[t\s].*)?$')
+_SLASH = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Last day a timestamp may fall on (9999-12-31, like the date strings)
+_MAX_DAYS = date(9999, 12, 31).toordinal() - _EPOCH_ORDINAL
+_NAT_INT = np.iinfo(np.int64).min
+
+# Timestamps above this are treated as milliseconds (~ year 5138 in seconds)
+_MS_THRESHOLD = 10 ** 11
+
+
+def _to_epoch_days(year: int, month: int, day: int) -> Optional[int]:
+    """Calendar date -> days since 1970-01-01, None if the date is invalid"""
+    try:
+        return date(year, month, day).toordinal() - _EPOCH_ORDINAL
+    except ValueError:
+        return None
+
+
+def _month_number(name: str) -> Optional[int]:
+    return MONTHS.get(name[:3])
+
+
+@lru_cache(maxsize=16384)
+def parse_date_string(value: str) -> Optional[int]:
+    """
+    Parse one review date string
+
+    Returns:
+        Days since the Unix epoch, or None if the format is not recognized
+    """
+    s = value.strip().lower()
+    if not s:
+        return None
+
+    m = _MONTH_FIRST.match(s)
+    if m:
+        month = _month_number(m.group(1))
+        return _to_epoch_days(int(m.group(3)), month, int(m.group(2))) if month else None
+
+    m = _DAY_FIRST.match(s)
+    if m:
+        month = _month_number(m.group(2))
+        return _to_epoch_days(int(m.group(3)), month, int(m.group(1))) if month else None
+
+    m = _ISO.match(s)
+    if m:
+        return _to_epoch_days(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+
+    m = _SLASH.match(s)
+    if m:
+        return _to_epoch_days(int(m.group(3)), int(m.group(1)), int(m.group(2)))
+
+    if s.isdigit():
+        return _timestamp_to_days(int(s))
+
+    return None
+
+
+def _timestamp_to_days(ts: float) -> Optional[int]:
+    """Unix timestamp (seconds or milliseconds) -> days since epoch, None if NaN / inf / out of range"""
+    try:
+        ts = float(ts)
+    except OverflowError:
+        return None
+    if not math.isfinite(ts) or ts <= 0:
+        return None
+    if ts >= _MS_THRESHOLD:
+        ts = ts / 1000
+    days = int(ts // 86400)
+    return days if days <= _MAX_DAYS else None
+
+
+def parse_review_date(value) -> Optional[int]:
+    """Parse a single string or timestamp value -> days since epoch (or None)"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return _timestamp_to_days(value)
+    if isinstance(value, str):
+        return parse_date_string(value)
+    return None
+
+
+def parse_review_dates(values: Iterable) -> np.ndarray:
+    """
+    Parse a sequence of review dates
+
+    Args:
+        values: Date strings and/or Unix timestamps, in any of the supported formats
+
+    Returns:
+        datetime64[D] array of the same length, NaT where a value could not be parsed
+    """
+    days = [parse_review_date(v) for v in values]
+    out = np.fromiter(
+        (_NAT_INT if d is None else d for d in days),
+        dtype=np.int64,
+        count=len(days),
+    )
+    return out.view('datetime64[D]')
@@ -0,0 +1,73 @@
+"""
+seller_key.py
+One key per seller for the image indexes, with both identifiers the extension may send
+
+The shop_id (data.reviewDebug.shop_id) is missing on some visits and the seller
+name on others, so a key keeps whichever are known, namespaced:
+
+    'shop:12345|name:CoolShop'   both known
+    'shop:12345'                 shop_id only
+    'name:CoolShop'              seller name only
+
+Two keys are the same seller when they share either identifier, and different
+sellers only when they have an identifier of the same kind that differs - a
+shop_id-only key is never "different" from a name-only key. Index entries
+written before keys were namespaced (a bare shop id or name) are only ever
+matched, never counted as a different seller.
+"""
+
+from typing import Dict, Iterable, Optional
+
+NAMESPACES = ('shop', 'name')
+
+
+def seller_key(shop_id=None, seller_name=None) -> Optional[str]:
+    """Key for a seller from its shop_id and/or name, None if neither is known"""
+    parts = [
+        f"{ns}:{str(value).strip()}"
+        for ns, value in zip(NAMESPACES, (shop_id, seller_name))
+        if value not in (None, '') and str(value).strip()
+    ]
+    return '|'.join(parts) or None
+
+
+def _identifiers(key) -> Dict[str, str]:
+    """namespace -> value for a key ({'': value} for a legacy bare id)"""
+    if key in (None, ''):
+        return {}
+    key = str(key)
+    ids = {}
+    for part in key.split('|'):
+        ns, sep, value = part.partition(':')
+        if not sep or ns not in NAMESPACES:
+            return {'': key}
+        ids[ns] = value
+    return ids
+
+
+def same_seller(a, b) -> bool:
+    """Both keys name the same seller (they share a shop_id or a seller name)"""
+    ids_a, ids_b = _identifiers(a), _identifiers(b)
+    if '' in ids_a or '' in ids_b:
+        legacy_a, legacy_b = set(ids_a.values()), set(ids_b.values())
+        return bool(legacy_a & legacy_b)
+    return any(ids_a[ns] == ids_b[ns] for ns in ids_a.keys() & ids_b.keys())
+
+
+def different_seller(a, b) -> bool:
+    """Both keys are known to belong to different sellers (an identifier of the same kind differs)"""
+    ids_a, ids_b = _identifiers(a), _identifiers(b)
+    if not ids_a or not ids_b or '' in ids_a or '' in ids_b:
+        return False
+    shared = ids_a.keys() & ids_b.keys()
+    return bool(shared) and all(ids_a[ns] != ids_b[ns] for ns in shared)
+
+
+def count_sellers(keys: Iterable) -> int:
+    """Distinct sellers among keys (keys sharing an identifier count once)"""
+    # Keys with both identifiers first, so they link a shop's shop_id-only and name-only keys
+    sellers = []
+    for key in sorted(set(keys), key=lambda k: -len(_identifiers(k))):
+        if not any(same_seller(key, seen) for seen in sellers):
+            sellers.append(key)
+    return len(sellers)
@@ -0,0 +1,295 @@
+"""
+app_async.py - asyncio (ASGI) serving mode for the same /analyze pipeline
+
+app.py blocks one thread per scan while it waits on Gemini and image downloads.
+This Quart app runs the same analyzers, but:
+  - every image is downloaded once, concurrently, with a shared httpx.AsyncClient
+  - the Gemini call is awaited (generate_content_async)
+  - CPU stages (CLIP, TextBlob, MinHash, hashing) run in a bounded thread pool
+
+so one process can hold hundreds of in-flight scans that are mostly waiting on I/O.
+The stages come from app.py's pipeline and run through AnalysisPipeline.arun - a
+scan returns exactly what /analyze returns there.
+
+Run:
+    hypercorn app_async:app --bind 0.0.0.0:5000
+    python app_async.py
+"""
+
+import os
+import asyncio
+import logging
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from quart import Quart, request, jsonify
+
+# Same analyzer instances (pipeline stages) as the Flask app
+from app import pipeline, batch_scanner
+from batch_analysis import BatchTooLarge, batch_payloads
+from analysis_pipeline import StreamIngest
+import metrics
+from profiler import PROFILER
+from app_factory import status_payload, stream_format, debug_timing_requested, admin_authorized, start_profile, encode_frame, STREAM_MIMETYPES, STREAM_HEADERS, BATCH_MAX_LISTINGS
+
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+
+# Concurrency limits
+MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', 100))
+GEMINI_CONCURRENCY = int(os.getenv('GEMINI_CONCURRENCY', 16))
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', 15))
+
+http_client = None
+gemini_slots = None
+
+
+@app.before_serving
+async def startup():
+    """Create the shared HTTP client and the CPU thread pool"""
+    global http_client, gemini_slots
+    http_client = httpx.AsyncClient(
+        timeout=DOWNLOAD_TIMEOUT,
+        follow_redirects=True,
+        headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS // 2),
+    )
+    gemini_slots = asyncio.Semaphore(GEMINI_CONCURRENCY)
+    # asyncio.to_thread uses the loop's default executor
+    # The CPU pool only runs scan work - the profiler samples it whenever it runs
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='cpu', initializer=PROFILER.enter)
+    )
+    # The event loop thread serves every request (JSON parsing / serialization)
+    PROFILER.enter()
+    PROFILER.install()
+    logger.info(f"✅ Async app ready ({MAX_CONNECTIONS} connections, {GEMINI_CONCURRENCY} Gemini slots, {CPU_WORKERS} CPU workers)")
+
+
+@app.after_serving
+async def shutdown():
+    if http_client:
+        await http_client.aclose()
+
+
+@app.after_request
+async def add_cors_headers(response):
+    """Allow extension to call you (flask_cors equivalent)"""
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    return response
+
+
+@app.route('/analyze', methods=['POST', 'OPTIONS'])
+async def analyze():
+    """Main endpoint - same request/response as app.py /analyze"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        data = await request.get_json(silent=True)
+        if not data:
+            logger.error("❌ No JSON data received")
+            return jsonify({'success': False, 'error': 'No data received'}), 400
+
+        logger.info(f"📥 Analyzing (async): {data.get('url', 'unknown')}")
+
+        debug_timing = debug_timing_requested(request)
+        fmt = stream_format(request)
+        if fmt:
+            return progressive_scan(data, fmt, debug_timing), 200, {'Content-Type': STREAM_MIMETYPES[fmt], **STREAM_HEADERS}
+
+        response = await pipeline.arun(data, http_client=http_client, gemini_slots=gemini_slots, debug_timing=debug_timing)
+
+        logger.info(f"✅ Response sent successfully")
+        return jsonify(response)
+
+    except Exception as e:
+        logger.error(f"❌ Error in async analyze endpoint: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_type': str(type(e))
+        }), 500
+
+
+def progressive_scan(data, fmt, debug_timing=False):
+    """Frames for ?stream=ndjson|sse - one per finished stage, then the response"""
+    frames = asyncio.Queue()
+
+    async def run_scan():
+        try:
+            response = await pipeline.arun(
+                data, http_client=http_client, gemini_slots=gemini_slots, debug_timing=debug_timing,
+                on_stage=lambda event: frames.put_nowait(('stage', event))
+            )
+            frames.put_nowait(('result', response))
+        except Exception as e:
+            logger.error(f"❌ Error in progressive async analyze: {e}")
+            logger.error(traceback.format_exc())
+            frames.put_nowait(('error', {'success': False, 'error': str(e), 'error_type': str(type(e))}))
+
+    async def generate():
+        task = asyncio.ensure_future(run_scan())
+        try:
+            while True:
+                kind, payload = await frames.get()
+                yield encode_frame(fmt, kind, payload).encode()
+                if kind != 'stage':
+                    return
+        finally:
+            # Client went away - stop the scan
+            task.cancel()
+
+    return generate()
+
+
+@app.route('/analyze/stream', methods=['POST', 'OPTIONS'])
+async def analyze_stream():
+    """NDJSON review pages, same format as app.py /analyze/stream"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        stream = StreamIngest(pipeline)
+        buffer = b''
+        line_no = 0
+        async for chunk in request.body:
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for raw in lines:
+                line_no += 1
+                # Page scoring is CPU work - keep it off the event loop
+                await asyncio.to_thread(stream.feed_line, raw, line_no)
+        if buffer.strip():
+            await asyncio.to_thread(stream.feed_line, buffer, line_no + 1)
+
+        if stream.empty:
+            logger.error("❌ No NDJSON data received")
+            return jsonify({'success': False, 'error': 'No data received'}), 400
+
+        data, precomputed = stream.finish()
+        response = await pipeline.arun(
+            data, http_client=http_client, gemini_slots=gemini_slots,
+            debug_timing=debug_timing_requested(request), **precomputed
+        )
+        response['receipt']['review_pages'] = stream.pages
+
+        logger.info(f"✅ Response sent successfully")
+        return jsonify(response)
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"❌ Error in async analyze stream endpoint: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_type': str(type(e))
+        }), 500
+
+
+@app.route('/analyze/batch', methods=['POST', 'OPTIONS'])
+async def analyze_batch():
+    """Same request/response as app.py /analyze/batch (the batch runs in a worker thread)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        try:
+            payloads = batch_payloads(await request.get_json(silent=True), BATCH_MAX_LISTINGS)
+        except BatchTooLarge as e:
+            return jsonify({'success': False, 'error': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        logger.info(f"📥 Analyzing batch of {len(payloads)} listings (async)")
+        response = await asyncio.to_thread(batch_scanner.run, payloads, debug_timing_requested(request))
+
+        logger.info(f"✅ Response sent successfully")
+        return jsonify(response)
+
+    except Exception as e:
+        logger.error(f"❌ Error in async analyze batch endpoint: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_type': str(type(e))
+        }), 500
+
+
+@app.route('/status', methods=['GET', 'OPTIONS'])
+async def status():
+    """Show which analyzers are ready"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    return jsonify(status_payload(pipeline))
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    """Prometheus text exposition of this process's metrics"""
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+async def admin_profile():
+    """Start a sampling profile / show its status (X-Admin-Token required)"""
+    if not admin_authorized(request):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    if request.method == 'POST':
+        payload, code = start_profile(await request.get_json(silent=True) or {})
+        return jsonify(payload), code
+    return jsonify({'success': True, 'profile': PROFILER.status()})
+
+
+@app.route('/admin/profile/stacks', methods=['GET'])
+async def admin_profile_stacks():
+    """Collapsed stacks of the last profile"""
+    if not admin_authorized(request):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    return PROFILER.collapsed(), 200, {
+        'Content-Type': 'text/plain; charset=utf-8',
+        'Content-Disposition': 'attachment; filename=analyze-profile.folded'
+    }
+
+
+@app.route('/health', methods=['GET', 'OPTIONS'])
+async def health():
+    """Simple health check endpoint"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    return jsonify({
+        'status': 'healthy',
+        'mode': 'async',
+        'timestamp': datetime.now().isoformat(),
+        'synthid_ready': pipeline.analyzer('synthid') is not None
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', 5000))
+
+    print("\n" + "="*70)
+    print("🚀 SYNTHID DETECTOR API RUNNING (async)")
+    print("="*70)
+    print(f"📡 Port: {port}")
+    print(f"🔗 Connections: {MAX_CONNECTIONS}  Gemini slots: {GEMINI_CONCURRENCY}  CPU workers: {CPU_WORKERS}")
+    print("\n📬 Endpoints:")
+    print(f"   POST http://localhost:{port}/analyze")
+    print(f"   POST http://localhost:{port}/analyze/stream  (NDJSON review pages)")
+    print(f"   POST http://localhost:{port}/analyze/batch  (JSON array of listings, one result each)")
+    print(f"   GET  http://localhost:{port}/status")
+    print(f"   GET  http://localhost:{port}/health")
+    print(f"   GET  http://localhost:{port}/metrics")
+    print("="*70 + "\n")
+
+    app.run(host="0.0.0.0", port=port, use_reloader=False)
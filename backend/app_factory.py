@@ -0,0 +1,782 @@
+"""
+app_factory.py - builds the Flask app for each server variant
+
+The variants used to be three copies of the same analyze flow. They are now
+entries in APP_VARIANTS that pick which analyzers (pipeline stages) are loaded
+and whether responses go through the Backboard.io cache:
+
+    full     - app.py: every analyzer, no cache
+    cache    - app_with_cache.py: SynthID + sentiment + Backboard.io cache
+    caching  - app_with_caching.py: cache variant + OpenCLIP image similarity
+"""
+
+import os
+import hmac
+import json
+import queue
+import logging
+import threading
+import traceback
+from flask import Flask, Response, request, jsonify
+from flask_cors import CORS
+from dotenv import load_dotenv
+from datetime import datetime
+
+from analysis_pipeline import (
+    AnalysisPipeline, StreamIngest, ParseInputStage, ShopStage, SentimentStage, DuplicateReviewStage,
+    ImageSimilarityStage, SynthIDStage, ImageReuseStage, SimilarListingsStage, RiskStage,
+)
+from job_queue import JobQueue, QueueFull
+from batch_analysis import BatchScanner, BatchTooLarge, batch_payloads
+from log_setup import configure_logging
+import metrics
+from profiler import PROFILER
+
+load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
+
+APP_VARIANTS = {
+    'full': {
+        'title': 'SYNTHID DETECTOR API RUNNING',
+        'analyzers': ('synthid', 'sentiment', 'risk_calculator', 'image_similarity', 'duplicate_detector', 'image_comparator',
+                      'shop_analyzer'),
+        'embedding_index': True,
+        'cache': False,
+    },
+    'cache': {
+        'title': 'ETSY LISTING ANALYZER API with BACKBOARD.IO CACHING',
+        'analyzers': ('synthid', 'sentiment', 'risk_calculator', 'shop_analyzer'),
+        'embedding_index': False,
+        'cache': True,
+    },
+    'caching': {
+        'title': 'ETSY LISTING ANALYZER API with BACKBOARD.IO CACHING + IMAGE SIMILARITY',
+        'analyzers': ('synthid', 'sentiment', 'risk_calculator', 'image_similarity', 'shop_analyzer'),
+        'embedding_index': False,
+        'cache': True,
+    },
+}
+
+# Display names used in startup logs and the console banner
+ANALYZER_LABELS = {
+    'synthid': 'SynthID detector',
+    'sentiment': 'Sentiment analyzer',
+    'risk_calculator': 'Risk calculator',
+    'image_similarity': 'Image similarity analyzer',
+    'duplicate_detector': 'Duplicate review detector',
+    'image_comparator': 'Image comparator',
+    'shop_analyzer': 'Shop analyzer',
+}
+
+def _parse_timeouts(value):
+    """'synthid=10,image_similarity=15' -> {'synthid': 10.0, 'image_similarity': 15.0}"""
+    timeouts = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, seconds = item.split('=', 1)
+            try:
+                timeouts[name.strip()] = float(seconds)
+            except ValueError:
+                logger.warning(f"⚠️ Ignoring invalid STAGE_TIMEOUTS entry: {item.strip()}")
+    return timeouts
+
+
+# Scan deadline in seconds (0 = wait for every stage) and per-stage overrides (0 = no stage limit)
+ANALYZE_DEADLINE = float(os.getenv('ANALYZE_DEADLINE', 30))
+STAGE_TIMEOUTS = _parse_timeouts(os.getenv('STAGE_TIMEOUTS'))
+# CLIP cosine similarity that maps to a 0 / 100 match score ("lo,hi")
+CLIP_SCORE_BOUNDS = tuple(float(v) for v in os.getenv('CLIP_SCORE_BOUNDS', '0.20,0.80').split(','))
+# Shop-level cache of review results / seller stats by shop_id: shops kept, seconds an entry is used
+SHOP_CACHE_SIZE = int(os.getenv('SHOP_CACHE_SIZE', 512))
+SHOP_CACHE_TTL = float(os.getenv('SHOP_CACHE_TTL', 3600))
+# Threads shared by all sync scans for running stages concurrently
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', 32))
+# Threads for the SynthID stage's Gemini calls (a separate pool, so slow calls cannot starve the others)
+PIPELINE_GEMINI_WORKERS = int(os.getenv('PIPELINE_GEMINI_WORKERS', 8))
+# Pick / probe the Gemini model after startup (connect_gemini() or the first scan) instead of
+# while building the app - gunicorn.conf.py sets it, the app being preloaded before the fork
+GEMINI_LAZY_CONNECT = os.getenv('GEMINI_LAZY_CONNECT', '0') == '1'
+
+# Background scans (POST /jobs): worker threads, queue bound, seconds finished jobs are kept
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 100))
+JOB_TTL = int(os.getenv('JOB_TTL', 600))
+# Bulk scans (POST /analyze/batch): max listings per request, Gemini calls in flight across
+# batches, concurrent image downloads per batch, distinct images held in memory at once
+BATCH_MAX_LISTINGS = int(os.getenv('BATCH_MAX_LISTINGS', 200))
+BATCH_GEMINI_WORKERS = int(os.getenv('BATCH_GEMINI_WORKERS', 4))
+BATCH_DOWNLOAD_WORKERS = int(os.getenv('BATCH_DOWNLOAD_WORKERS', 16))
+BATCH_CHUNK_IMAGES = int(os.getenv('BATCH_CHUNK_IMAGES', 128))
+# Seconds between keep-alive comments on an idle /jobs/<id>/events stream
+SSE_KEEPALIVE = 15
+
+# Shared secret for /admin/* (X-Admin-Token header); unset = admin endpoints disabled
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Longest profile /admin/profile will start, in seconds
+MAX_PROFILE_SECONDS = 300
+
+# Names used in the /status message
+STATUS_NAMES = {
+    'synthid': 'SynthID',
+    'sentiment': 'Sentiment',
+    'image_similarity': 'Image Similarity',
+    'duplicate_detector': 'Duplicate Reviews',
+    'image_comparator': 'Image Reuse',
+    'shop_analyzer': 'Shop Analyzer',
+    'cache': 'Cache',
+}
+
+
+def _new_analyzer(name, config):
+    """Construct one analyzer (imports are local so variants only load what they use)"""
+    if name == 'synthid':
+        from analyzers.synthid_detector import SynthIDDetector
+        return SynthIDDetector(connect=not GEMINI_LAZY_CONNECT)
+    if name == 'sentiment':
+        from review_sentiment_analyzer import ReviewSentimentAnalyzer
+        return ReviewSentimentAnalyzer()
+    if name == 'risk_calculator':
+        from listing_risk_calculator import ListingRiskCalculator
+        return ListingRiskCalculator()
+    if name == 'image_similarity':
+        from image_similarity_clip import ClipImageSimilarityAnalyzer as ImageSimilarityAnalyzer
+        if not config['embedding_index']:
+            return ImageSimilarityAnalyzer(score_bounds=CLIP_SCORE_BOUNDS)
+        # ANN index over its embeddings for cross-shop image search
+        from analyzers.embedding_index import EmbeddingIndex
+        clip_index_path = os.getenv('CLIP_INDEX_PATH', 'data/clip_index.npz') or None
+        return ImageSimilarityAnalyzer(embedding_index=EmbeddingIndex(path=clip_index_path),
+                                       score_bounds=CLIP_SCORE_BOUNDS)
+    if name == 'duplicate_detector':
+        from analyzers.duplicate_detector import DuplicateReviewDetector
+        return DuplicateReviewDetector()
+    if name == 'image_comparator':
+        # Cross-listing image comparator (perceptual-hash index)
+        from analyzers.image_comparator import ImageComparator
+        return ImageComparator(
+            index_path=os.getenv('IMAGE_HASH_INDEX_PATH', 'data/image_hashes.ndjson') or None
+        )
+    if name == 'shop_analyzer':
+        from shop_cache import ShopCache
+        return ShopCache(max_shops=SHOP_CACHE_SIZE, ttl=SHOP_CACHE_TTL)
+    raise ValueError(f"Unknown analyzer: {name}")
+
+
+def init_analyzers(config):
+    """
+    Initialize the analyzers a variant needs - a failed analyzer is None,
+    the rest of the app keeps working without it
+
+    Returns:
+        Dict name -> analyzer instance (or None)
+    """
+    analyzers = {}
+    for name in config['analyzers']:
+        label = ANALYZER_LABELS[name]
+        try:
+            analyzers[name] = _new_analyzer(name, config)
+            logger.info(f"✅ {label} initialized successfully")
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize {label.lower()}: {e}")
+            analyzers[name] = None
+    return analyzers
+
+
+def init_cache():
+    """Backboard.io cache, None when no API key is set or it fails to start"""
+    try:
+        BACKBOARD_API_KEY = os.getenv('BACKBOARD_API_KEY')
+        if BACKBOARD_API_KEY:
+            from backboard_cache import BackboardCache
+            cache = BackboardCache(
+                api_key=BACKBOARD_API_KEY,
+                base_url=os.getenv('BACKBOARD_BASE_URL', 'https://app.backboard.io/api'),
+                assistant_name="Etsy Listing Analyzer Cache",
+                default_ttl=int(os.getenv('CACHE_TTL', 86400))  # 24 hours default
+            )
+            logger.info("✅ Backboard.io cache initialized successfully")
+            logger.info(f"   Assistant ID: {cache.assistant_id}")
+            logger.info(f"   Thread ID: {cache.thread_id}")
+            return cache
+        logger.warning("⚠️ BACKBOARD_API_KEY not set - caching disabled")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize Backboard.io cache: {e}")
+    return None
+
+
+def stream_format(req):
+    """
+    Progressive /analyze mode the client asked for: 'ndjson', 'sse' or None (one JSON body)
+
+    ?stream=ndjson|sse, or an Accept header of application/x-ndjson / text/event-stream
+    """
+    mode = (req.args.get('stream') or '').lower()
+    if mode in ('ndjson', 'sse'):
+        return mode
+    accept = req.headers.get('Accept', '')
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+
+def debug_timing_requested(req):
+    """?debug_timing=1 - span tree in receipt['timing'] (a "debug_timing": true body field works too)"""
+    return req.args.get('debug_timing', '').lower() in ('1', 'true', 'yes')
+
+
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def sse_frame(event, data, event_id=None):
+    frame = f"id: {event_id}\n" if event_id is not None else ''
+    return frame + f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def encode_frame(fmt, kind, payload):
+    """
+    One progressive /analyze frame
+
+    kind is 'stage' (payload = stage_event), 'result' (the usual /analyze response,
+    unchanged) or 'error'. NDJSON stage lines carry "type": "stage"; the last line
+    is the response itself.
+    """
+    if fmt == 'sse':
+        return sse_frame(kind, payload)
+    if kind == 'stage':
+        payload = {'type': 'stage', **payload}
+    return json.dumps(payload, default=str) + '\n'
+
+
+def progressive_scan(run_scan, fmt):
+    """
+    Run run_scan(on_stage) in a background thread and yield a frame per finished stage,
+    then the final response
+
+    Args:
+        run_scan: Callable taking the on_stage listener and returning the response
+        fmt: 'ndjson' or 'sse'
+    """
+    frames = queue.Queue()
+
+    def target():
+        try:
+            frames.put(('result', run_scan(lambda event: frames.put(('stage', event)))))
+        except Exception as e:
+            logger.error(f"❌ Error in progressive analyze: {e}")
+            logger.error(traceback.format_exc())
+            frames.put(('error', {'success': False, 'error': str(e), 'error_type': str(type(e))}))
+
+    threading.Thread(target=target, name='progressive-scan', daemon=True).start()
+    while True:
+        kind, payload = frames.get()
+        yield encode_frame(fmt, kind, payload)
+        if kind != 'stage':
+            return
+
+
+def build_pipeline(analyzers, config, cache=None):
+    """Stage list in the order the analyze flow has always run them"""
+    stages = [ParseInputStage()]
+    if 'shop_analyzer' in analyzers:
+        stages.append(ShopStage(analyzers['shop_analyzer']))
+    if 'sentiment' in analyzers:
+        stages.append(SentimentStage(analyzers['sentiment']))
+    if 'duplicate_detector' in analyzers:
+        stages.append(DuplicateReviewStage(analyzers['duplicate_detector']))
+    if 'image_similarity' in analyzers:
+        stages.append(ImageSimilarityStage(analyzers['image_similarity']))
+    if 'synthid' in analyzers:
+        stages.append(SynthIDStage(analyzers['synthid']))
+    if 'image_comparator' in analyzers:
+        stages.append(ImageReuseStage(analyzers['image_comparator']))
+    if 'image_similarity' in analyzers and config['embedding_index']:
+        stages.append(SimilarListingsStage(analyzers['image_similarity']))
+    if 'risk_calculator' in analyzers:
+        stages.append(RiskStage(analyzers['risk_calculator']))
+
+    for stage in stages:
+        timeout = STAGE_TIMEOUTS.get(stage.name)
+        if timeout is not None:
+            stage.timeout = timeout or None
+        if isinstance(stage, SynthIDStage) and stage.analyzer is not None:
+            # Gemini gives up when the pipeline does, instead of holding a thread after a timeout
+            stage.analyzer.request_timeout = stage.timeout or ANALYZE_DEADLINE or None
+
+    return AnalysisPipeline(
+        stages, cache=cache, use_cache=config['cache'],
+        deadline=ANALYZE_DEADLINE, max_workers=PIPELINE_WORKERS,
+        pool_workers={'gemini': PIPELINE_GEMINI_WORKERS}
+    )
+
+
+def status_payload(pipeline):
+    """Which analyzers are ready"""
+    status = {}
+    for key in ('synthid', 'sentiment', 'image_similarity', 'risk_calculator', 'image_comparator', 'duplicate_detector',
+                'shop_analyzer'):
+        status[key] = pipeline.analyzer(key) is not None
+    if pipeline.use_cache:
+        status['cache'] = pipeline.cache is not None
+
+    synthid = pipeline.analyzer('synthid')
+    status['api_key_loaded'] = synthid is not None and hasattr(synthid, 'api_key') and bool(synthid.api_key)
+
+    ready = [name for key, name in STATUS_NAMES.items() if status.get(key)]
+    if len(ready) > 1:
+        status['message'] = f"{', '.join(ready[:-1])} and {ready[-1]} are ready!"
+    else:
+        status['message'] = f"{ready[0]} is ready!" if ready else 'No analyzers ready'
+    status['metrics'] = metrics.status_summary()
+    return status
+
+
+def create_app(variant='full'):
+    """
+    Build the Flask app for one variant
+
+    The pipeline is available as app.extensions['analysis_pipeline'].
+    """
+    config = APP_VARIANTS[variant]
+
+    app = Flask(__name__)
+    CORS(app)  # Allow extension to call you
+
+    cache = init_cache() if config['cache'] else None
+    analyzers = init_analyzers(config)
+    pipeline = build_pipeline(analyzers, config, cache=cache)
+
+    app.extensions['analysis_pipeline'] = pipeline
+    app.config['VARIANT'] = variant
+    PROFILER.install()
+
+    jobs = JobQueue(pipeline, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, ttl=JOB_TTL)
+    app.extensions['job_queue'] = jobs
+
+    batch_scanner = BatchScanner(pipeline, gemini_workers=BATCH_GEMINI_WORKERS,
+                                 download_workers=BATCH_DOWNLOAD_WORKERS, chunk_images=BATCH_CHUNK_IMAGES)
+    app.extensions['batch_scanner'] = batch_scanner
+
+    @app.route('/analyze', methods=['POST', 'OPTIONS'])
+    def analyze():
+        """
+        Main endpoint - runs the configured analyzer stages
+        (cache variants check the Backboard.io cache first, unless force_refresh)
+
+        With ?stream=ndjson|sse (or the matching Accept header) each stage's result is
+        sent as soon as it finishes, followed by the usual response - see encode_frame.
+        ?debug_timing=1 adds a span tree of where the time went to receipt['timing'].
+        """
+        # Handle CORS preflight requests
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        try:
+            data = request.json
+            if not data:
+                logger.error("❌ No JSON data received")
+                return jsonify({'success': False, 'error': 'No data received'}), 400
+
+            logger.info(f"📥 Analyzing: {data.get('url', 'unknown')}")
+
+            debug_timing = debug_timing_requested(request)
+            fmt = stream_format(request)
+            if fmt:
+                scan = progressive_scan(
+                    lambda on_stage: pipeline.run(data, on_stage=on_stage, debug_timing=debug_timing), fmt
+                )
+                return Response(scan, mimetype=STREAM_MIMETYPES[fmt], headers=STREAM_HEADERS)
+
+            response = pipeline.run(data, debug_timing=debug_timing)
+
+            logger.info(f"✅ Response sent successfully")
+            return jsonify(response)
+
+        except Exception as e:
+            logger.error(f"❌ Error in analyze endpoint: {e}")
+            logger.error(traceback.format_exc())
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'error_type': str(type(e))
+            }), 500
+
+    @app.route('/analyze/stream', methods=['POST', 'OPTIONS'])
+    def analyze_stream():
+        """
+        Streaming variant of /analyze - accepts NDJSON review pages instead of one giant JSON body
+
+        One JSON object per line:
+            {"type": "listing", "url": ..., "data": {...}, "report": ..., "reviewFetch": ...}
+            {"type": "reviews", "page": 1, "reviews": [...]}
+            {"type": "reviews", "page": 2, "reviews": [...]}
+
+        Pages are processed as they arrive (see StreamIngest); the report is returned
+        when the stream closes.
+        """
+        # Handle CORS preflight requests
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        try:
+            stream = StreamIngest(pipeline)
+            for line_no, raw in enumerate(request.stream, start=1):
+                try:
+                    stream.feed_line(raw, line_no)
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+
+            if stream.empty:
+                logger.error("❌ No NDJSON data received")
+                return jsonify({'success': False, 'error': 'No data received'}), 400
+
+            data, precomputed = stream.finish()
+            response = pipeline.run(data, debug_timing=debug_timing_requested(request), **precomputed)
+            response['receipt']['review_pages'] = stream.pages
+
+            logger.info(f"✅ Response sent successfully")
+            return jsonify(response)
+
+        except Exception as e:
+            logger.error(f"❌ Error in analyze stream endpoint: {e}")
+            logger.error(traceback.format_exc())
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'error_type': str(type(e))
+            }), 500
+
+    @app.route('/analyze/batch', methods=['POST', 'OPTIONS'])
+    def analyze_batch():
+        """
+        Score many listings in one call - body is a JSON array of /analyze payloads
+        (or {"listings": [...]}); results[i] is the /analyze response for listing i
+
+        Images and review texts shared between listings are processed once, CLIP
+        encodes in batches and the Gemini checks share a bounded pool - see batch_analysis.py.
+        """
+        # Handle CORS preflight requests
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        try:
+            try:
+                payloads = batch_payloads(request.get_json(silent=True), BATCH_MAX_LISTINGS)
+            except BatchTooLarge as e:
+                return jsonify({'success': False, 'error': str(e)}), 413
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            logger.info(f"📥 Analyzing batch of {len(payloads)} listings")
+            response = batch_scanner.run(payloads, debug_timing=debug_timing_requested(request))
+
+            logger.info(f"✅ Response sent successfully")
+            return jsonify(response)
+
+        except Exception as e:
+            logger.error(f"❌ Error in analyze batch endpoint: {e}")
+            logger.error(traceback.format_exc())
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'error_type': str(type(e))
+            }), 500
+
+    register_job_routes(app, jobs)
+    register_admin_routes(app)
+    if config['cache']:
+        register_cache_routes(app, pipeline)
+
+    @app.route('/status', methods=['GET', 'OPTIONS'])
+    def status():
+        """Show which analyzers are ready"""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        return jsonify(status_payload(pipeline))
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """Prometheus text exposition of this process's metrics"""
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+    @app.route('/health', methods=['GET', 'OPTIONS'])
+    def health():
+        """Simple health check endpoint"""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        payload = {
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'synthid_ready': pipeline.analyzer('synthid') is not None
+        }
+        risk_calculator = pipeline.analyzer('risk_calculator')
+        if risk_calculator is not None and hasattr(risk_calculator.rules, 'status'):
+            payload['risk_rules'] = risk_calculator.rules.status()
+        if config['cache']:
+            payload.update({
+                'sentiment_ready': pipeline.analyzer('sentiment') is not None,
+                'image_similarity_ready': pipeline.analyzer('image_similarity') is not None,
+                'cache_ready': cache is not None
+            })
+        return jsonify(payload)
+
+    return app
+
+
+def register_job_routes(app, jobs):
+    """
+    Background scans: POST /jobs, GET /jobs/<id>, GET /jobs/<id>/events (SSE)
+
+    SSE events: 'stage' (stage_event per finished stage), then 'done' (the /analyze
+    response) or 'error'. Reconnecting with Last-Event-ID resumes after that event.
+    """
+
+    @app.route('/jobs', methods=['POST', 'OPTIONS'])
+    def submit_job():
+        """Queue a scan (same body as /analyze) and return its id immediately"""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        data = request.get_json(silent=True)
+        if not data:
+            logger.error("❌ No JSON data received")
+            return jsonify({'success': False, 'error': 'No data received'}), 400
+
+        try:
+            job = jobs.submit(data)
+        except QueueFull as e:
+            logger.warning(f"⚠️ Job rejected: {e}")
+            return jsonify({'success': False, 'error': 'Too many queued scans, try again shortly'}), 503, {'Retry-After': '5'}
+
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/jobs/{job.id}',
+            'events_url': f'/jobs/{job.id}/events'
+        }), 202
+
+    @app.route('/jobs/<job_id>', methods=['GET', 'OPTIONS'])
+    def get_job(job_id):
+        """Job status, stage results so far and (when done) the full response"""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        job = jobs.get(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+        return jsonify({'success': True, 'job': job.to_dict()})
+
+    @app.route('/jobs/<job_id>/events', methods=['GET', 'OPTIONS'])
+    def job_events(job_id):
+        """Server-Sent Events stream of a job's stage results"""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        job = jobs.get(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+
+        try:
+            since = int(request.headers.get('Last-Event-ID', -1)) + 1
+        except ValueError:
+            since = 0
+
+        def stream(since):
+            while True:
+                events = job.wait_events(since, SSE_KEEPALIVE)
+                if not events:
+                    if job.finished:
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                for event in events:
+                    yield sse_frame(event['event'], event['data'], event['id'])
+                since += len(events)
+                if events[-1]['event'] in ('done', 'error'):
+                    return
+
+        return Response(stream(since), mimetype='text/event-stream', headers=STREAM_HEADERS)
+
+
+def admin_authorized(req) -> bool:
+    """X-Admin-Token matches ADMIN_TOKEN (always False when no token is configured)"""
+    token = req.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def start_profile(body):
+    """
+    Start PROFILER from a /admin/profile body: {"seconds": 30, "interval_ms": 10}
+
+    Returns:
+        (payload, HTTP status)
+    """
+    try:
+        seconds = min(float(body.get('seconds', 30)), MAX_PROFILE_SECONDS)
+        interval = max(float(body.get('interval_ms', 10)), 1) / 1000
+    except (TypeError, ValueError):
+        return {'success': False, 'error': 'seconds and interval_ms must be numbers'}, 400
+    try:
+        PROFILER.start(seconds, interval)
+    except RuntimeError as e:
+        return {'success': False, 'error': str(e)}, 409
+    return {'success': True, 'profile': PROFILER.status()}, 202
+
+
+def register_admin_routes(app):
+    """
+    Sampling profiler across /analyze calls (see profiler.py):
+
+        POST /admin/profile          {"seconds": 30, "interval_ms": 10} - start
+        GET  /admin/profile          status + hottest frames
+        GET  /admin/profile/stacks   collapsed stacks (flamegraph.pl / speedscope)
+
+    Every request needs X-Admin-Token: $ADMIN_TOKEN.
+    """
+
+    @app.before_request
+    def track_analyze_thread():
+        if request.path.startswith('/analyze'):
+            PROFILER.enter()
+            request.environ['profiler.tracked'] = True
+
+    @app.teardown_request
+    def untrack_analyze_thread(exc=None):
+        if request.environ.pop('profiler.tracked', False):
+            PROFILER.exit()
+
+    @app.route('/admin/profile', methods=['GET', 'POST'])
+    def admin_profile():
+        if not admin_authorized(request):
+            return jsonify({'success': False, 'error': 'Forbidden'}), 403
+        if request.method == 'POST':
+            payload, code = start_profile(request.get_json(silent=True) or {})
+            return jsonify(payload), code
+        return jsonify({'success': True, 'profile': PROFILER.status()})
+
+    @app.route('/admin/profile/stacks', methods=['GET'])
+    def admin_profile_stacks():
+        if not admin_authorized(request):
+            return jsonify({'success': False, 'error': 'Forbidden'}), 403
+        return Response(PROFILER.collapsed(), mimetype='text/plain', headers={
+            'Content-Disposition': 'attachment; filename=analyze-profile.folded'
+        })
+
+
+def register_cache_routes(app, pipeline):
+    """/cache/stats and /cache/clear for the Backboard.io cache variants"""
+    cache = pipeline.cache
+
+    @app.route('/cache/stats', methods=['GET', 'OPTIONS'])
+    def cache_stats():
+        """Get Backboard.io cache statistics"""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        if not cache:
+            return jsonify({
+                'success': False,
+                'message': 'Cache not initialized'
+            }), 503
+
+        try:
+            stats = cache.get_stats()
+            return jsonify({
+                'success': True,
+                'stats': stats,
+                'metrics': metrics.cache_summary()
+            })
+        except Exception as e:
+            logger.error(f"Error getting cache stats: {e}")
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @app.route('/cache/clear', methods=['POST', 'OPTIONS'])
+    def cache_clear():
+        """Clear cache for specific URL or all"""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        if not cache:
+            return jsonify({
+                'success': False,
+                'message': 'Cache not initialized'
+            }), 503
+
+        try:
+            data = request.json or {}
+            url = data.get('url')
+
+            if url:
+                success = cache.delete(url)
+                return jsonify({
+                    'success': success,
+                    'message': f'Cache cleared for {url}' if success else 'Failed to clear cache'
+                })
+            else:
+                success = cache.clear_all()
+                return jsonify({
+                    'success': success,
+                    'message': 'All cache cleared' if success else 'Failed to clear all cache'
+                })
+        except Exception as e:
+            logger.error(f"Error clearing cache: {e}")
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+
+def run_dev_server(app):
+    """Print the startup banner and run the Werkzeug development server"""
+    port = int(os.getenv('PORT', 5000))
+    pipeline = app.extensions['analysis_pipeline']
+    config = APP_VARIANTS[app.config['VARIANT']]
+    synthid = pipeline.analyzer('synthid')
+
+    print("\n" + "="*70)
+    print(f"🚀 {config['title']}")
+    print("="*70)
+    print(f"📡 Port: {port}")
+    print(f"🔑 API Key: {'✅ Loaded' if synthid and hasattr(synthid, 'api_key') and synthid.api_key else '❌ Missing'}")
+
+    if pipeline.use_cache and pipeline.cache:
+        cache = pipeline.cache
+        print(f"\n💾 BACKBOARD.IO CACHE:")
+        print(f"   Assistant ID: {cache.assistant_id}")
+        print(f"   Thread ID: {cache.thread_id}")
+        print(f"   TTL: {cache.default_ttl}s ({cache.default_ttl/3600:.1f} hours)")
+
+    print("\n📊 ANALYZER STATUS:")
+    for name, label in ANALYZER_LABELS.items():
+        if name in config['analyzers']:
+            state = '✅ READY' if pipeline.analyzer(name) is not None else '❌ ERROR'
+        else:
+            state = '⏳ Not in this variant'
+        print(f"   {label + ':':<28}{state}")
+    if pipeline.use_cache:
+        print(f"   {'Cache:':<28}{'✅ READY' if pipeline.cache else '❌ DISABLED'}")
+    print("\n📬 Endpoints:")
+    print(f"   POST http://localhost:{port}/analyze  (?stream=ndjson|sse for per-stage results)")
+    print(f"   POST http://localhost:{port}/analyze/stream  (NDJSON review pages)")
+    print(f"   POST http://localhost:{port}/analyze/batch  (JSON array of listings, one result each)")
+    print(f"   POST http://localhost:{port}/jobs  (background scan, then GET /jobs/<id> or /jobs/<id>/events)")
+    print(f"   GET  http://localhost:{port}/status")
+    print(f"   GET  http://localhost:{port}/health")
+    print(f"   GET  http://localhost:{port}/metrics")
+    if pipeline.use_cache:
+        print(f"   GET  http://localhost:{port}/cache/stats")
+        print(f"   POST http://localhost:{port}/cache/clear")
+    print("\n🎯 Test with curl:")
+    print(f'   curl -X POST http://localhost:{port}/analyze -H "Content-Type: application/json" -d "{{\\"url\\":\\"test\\",\\"data\\":{{\\"images\\":[\\"https://images.unsplash.com/photo-1542291026-7eec264c27ff?w=400\\"]}}}}"')
+    print("="*70 + "\n")
+
+    app.run(host="0.0.0.0", port=port, debug=True, use_reloader=False)
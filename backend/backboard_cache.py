@@ -10,6 +10,8 @@ from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from metrics import CACHE_EVICTIONS
+
 load_dotenv()
 
 
@@ -168,6 +170,7 @@ class BackboardCache:
                     return entry.get('data')
                 else:
                     del self.cache[cache_key]
+                    CACHE_EVICTIONS.inc(cache='response')
         
         print(f"⊗ Cache MISS for {url}")
         return None
@@ -235,6 +238,7 @@ class BackboardCache:
         
         for key in expired_keys:
             del self.cache[key]
+        CACHE_EVICTIONS.inc(len(expired_keys), cache='response')
         
         return {
             'cache_type': 'backboard.io (memory fallback)',
@@ -0,0 +1,322 @@
+"""
+batch_analysis.py - score many listings in one call (POST /analyze/batch)
+
+Scanning N listings one /analyze at a time repeats work whenever listings share
+inputs (the same shop's photos, copy-pasted reviews) and sends CLIP one image at a
+time. BatchScanner runs a batch in chunks:
+
+  - identical payloads are scanned once, cached listings come from the cache
+  - every image the chunk needs is downloaded once, in a thread pool
+  - the chunk's CLIP inputs are encoded in batched forward passes into the
+    analyzer's embedding cache, while the Gemini checks (one per distinct first
+    image) run in a bounded pool shared by all batches
+  - review texts are scored once per batch (a shared polarity memo)
+
+Each listing then goes through AnalysisPipeline.run with those results passed in
+as precomputed stage outputs, so every entry of 'results' is exactly what /analyze
+returns for that payload (the stages done up front report status 'precomputed').
+Listings finish in input order, so the cross-listing indexes (image reuse,
+similar listings) see them in the same order as sequential /analyze calls.
+
+Batch scans are not recorded by capture.py with their upstreams - the downloads
+and Gemini calls happen before the per-listing scans start.
+
+    scanner = BatchScanner(pipeline, gemini_workers=4)
+    report = scanner.run([payload1, payload2, ...])
+    report['results'][0]  # same dict /analyze returns for payload1
+"""
+
+import json
+import logging
+import math
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import requests
+from PIL import Image
+
+from metrics import IMAGE_DOWNLOAD_SECONDS, IMAGE_DOWNLOAD_ERRORS, BATCH_SECONDS, BATCH_LISTINGS
+from profiler import PROFILER
+
+logger = logging.getLogger(__name__)
+
+
+class BatchTooLarge(Exception):
+    """Raised by batch_payloads when a request carries more than max_listings listings"""
+
+
+def batch_payloads(body, max_listings: int) -> List:
+    """
+    Listing payloads of a /analyze/batch request body
+
+    Args:
+        body: Either a JSON array of /analyze payloads or {"listings": [...]}
+        max_listings: Largest batch accepted
+
+    Returns:
+        The payload list
+
+    Raises:
+        ValueError: Body is not one of the accepted shapes
+        BatchTooLarge: More than max_listings payloads
+    """
+    listings = body.get('listings') if isinstance(body, dict) else body
+    if not isinstance(listings, list) or not listings:
+        raise ValueError('Expected a JSON array of listings or {"listings": [...]}')
+    if len(listings) > max_listings:
+        raise BatchTooLarge(f'{len(listings)} listings in one batch (max {max_listings})')
+    return listings
+
+
+class BatchScanner:
+    """Runs batches of /analyze payloads through one AnalysisPipeline"""
+
+    def __init__(self, pipeline, gemini_workers: int = 4, download_workers: int = 16,
+                 chunk_images: int = 128, download_timeout: float = 15):
+        """
+        Args:
+            pipeline: AnalysisPipeline the listings are scanned with
+            gemini_workers: Gemini calls in flight at once, across all batches
+            download_workers: Concurrent image downloads per batch
+            chunk_images: Distinct images held in memory per chunk (also capped by
+                the CLIP embedding cache size, so primed embeddings are not evicted)
+            download_timeout: Seconds per image download
+        """
+        self.pipeline = pipeline
+        self.gemini_workers = gemini_workers
+        self.download_workers = download_workers
+        self.chunk_images = chunk_images
+        self.download_timeout = download_timeout
+        self.gemini_pool = ThreadPoolExecutor(max_workers=gemini_workers, thread_name_prefix='batch-gemini',
+                                              initializer=PROFILER.enter)
+
+    # ------------------------------------------------------------------
+    # Planning
+    # ------------------------------------------------------------------
+    def _ready(self, name: str):
+        """Stage instance if the pipeline has it and its analyzer loaded, else None"""
+        stage = self.pipeline.stage(name)
+        return stage if stage is not None and stage.ready else None
+
+    def _plan(self, payload: Dict) -> Dict:
+        """Parsed payload + the image URLs each up-front step needs"""
+        parsed = self.pipeline.stage('parse_input').run({'data': payload})
+        valid_images = parsed['valid_images']
+        plan = {'data': payload, 'parsed': parsed, 'clip': [], 'gemini': None, 'reuse': []}
+
+        similarity = self._ready('image_similarity')
+        if similarity is not None and similarity.analyzer.embedding_cache_size:
+            pairs = similarity._pairs(parsed)
+            if pairs:
+                plan['clip'] += [u for u in pairs[0] + pairs[1] if isinstance(u, str)]
+            if self._ready('similar_listings') is not None:
+                plan['clip'] += valid_images[:3]
+        if self._ready('synthid') is not None and valid_images:
+            plan['gemini'] = valid_images[0]
+        reuse = self._ready('image_reuse')
+        if reuse is not None:
+            plan['reuse'] = valid_images[:reuse.analyzer.max_images]
+        return plan
+
+    @staticmethod
+    def _image_urls(plan: Dict) -> List[str]:
+        urls = plan['clip'] + plan['reuse'] + ([plan['gemini']] if plan['gemini'] else [])
+        return list(dict.fromkeys(urls))
+
+    def _chunks(self, plans: List[Dict]) -> List[List[Dict]]:
+        """Consecutive plans whose distinct images fit in one chunk (at least one plan each)"""
+        limit = self.chunk_images
+        similarity = self._ready('image_similarity')
+        if similarity is not None and similarity.analyzer.embedding_cache_size:
+            limit = min(limit, similarity.analyzer.embedding_cache_size)
+
+        chunks, current, urls = [], [], set()
+        for plan in plans:
+            plan_urls = set(self._image_urls(plan))
+            if current and len(urls | plan_urls) > limit:
+                chunks.append(current)
+                current, urls = [], set()
+            current.append(plan)
+            urls |= plan_urls
+        if current:
+            chunks.append(current)
+        return chunks
+
+    # ------------------------------------------------------------------
+    # Shared work
+    # ------------------------------------------------------------------
+    def _download(self, session, url: str) -> Optional[Image.Image]:
+        try:
+            with IMAGE_DOWNLOAD_SECONDS.time(source='batch'):
+                resp = session.get(url, timeout=self.download_timeout, headers={'User-Agent': 'Mozilla/5.0'})
+                resp.raise_for_status()
+            img = Image.open(BytesIO(resp.content))
+            img.load()
+            return img
+        except Exception as e:
+            IMAGE_DOWNLOAD_ERRORS.inc(source='batch')
+            logger.error(f"❌ Error downloading image {url[:80]}: {e}")
+            return None
+
+    def _download_all(self, urls: List[str]) -> Dict[str, Optional[Image.Image]]:
+        """url -> PIL.Image (None if the download failed)"""
+        if not urls:
+            return {}
+        with requests.Session() as session, \
+                ThreadPoolExecutor(max_workers=min(self.download_workers, len(urls)),
+                                   thread_name_prefix='batch-download') as pool:
+            return dict(zip(urls, pool.map(lambda u: self._download(session, u), urls)))
+
+    def _gemini(self, analyzer, img: Optional[Image.Image]) -> Dict:
+        if img is None:
+            return analyzer._error_result("Image download failed")
+        return analyzer.analyze_pil(img)
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+    def run(self, payloads: List[Dict], debug_timing: bool = False) -> Dict:
+        """
+        Scan every payload
+
+        Args:
+            payloads: /analyze request bodies
+            debug_timing: Add the span tree to each result's receipt['timing']
+
+        Returns:
+            {'success': True, 'count': n, 'results': [response per payload, in order],
+             'batch': {what was shared: unique listings / images / review texts, ...}}
+            A payload that fails gets the /analyze error body in its slot.
+        """
+        started = time.perf_counter()
+        results = [None] * len(payloads)
+        stats = {
+            'listings': len(payloads), 'unique_listings': 0, 'repeated': 0, 'cache_hits': 0, 'errors': 0,
+            'image_refs': 0, 'images_downloaded': 0, 'images_encoded': 0,
+            'gemini_calls': 0, 'review_texts': 0, 'unique_review_texts': 0, 'chunks': 0,
+        }
+
+        # Identical payloads are scanned once
+        first_index, slots, plans = {}, {}, []
+        for i, payload in enumerate(payloads):
+            if not isinstance(payload, dict) or not payload:
+                results[i] = {'success': False, 'error': 'No data received'}
+                stats['errors'] += 1
+                continue
+            key = json.dumps(payload, sort_keys=True, default=str)
+            if key in first_index:
+                slots[first_index[key]].append(i)
+                stats['repeated'] += 1
+                continue
+            first_index[key] = i
+            slots[i] = [i]
+
+            cached = self.pipeline.cache_lookup(payload)
+            if cached:
+                results[i] = cached
+                stats['cache_hits'] += 1
+                continue
+            try:
+                plan = self._plan(payload)
+            except Exception as e:
+                results[i] = self._error(payload, e)
+                stats['errors'] += 1
+                continue
+            plan['index'] = i
+            plans.append(plan)
+        stats['unique_listings'] = len(slots)
+
+        logger.info(f"📦 Batch of {len(payloads)} listings: {len(plans)} to scan, "
+                    f"{stats['cache_hits']} cached, {stats['repeated']} repeated")
+
+        scores = {}
+        for chunk in self._chunks(plans):
+            stats['chunks'] += 1
+            self._run_chunk(chunk, results, scores, stats, debug_timing)
+        stats['unique_review_texts'] = len(scores)
+
+        for i, copies in slots.items():
+            for j in copies[1:]:
+                results[j] = results[i]
+
+        elapsed = time.perf_counter() - started
+        stats['duration_ms'] = round(elapsed * 1000, 1)
+        BATCH_SECONDS.observe(elapsed)
+        BATCH_LISTINGS.inc(len(payloads))
+        logger.info(f"✅ Batch done in {elapsed:.1f}s: {stats['images_downloaded']} images downloaded for "
+                    f"{stats['image_refs']} references, {stats['gemini_calls']} Gemini calls, "
+                    f"{stats['images_encoded']} CLIP encodes")
+        return {'success': True, 'count': len(payloads), 'results': results, 'batch': stats}
+
+    def _run_chunk(self, chunk: List[Dict], results: List, scores: Dict, stats: Dict, debug_timing: bool):
+        """Shared downloads, Gemini and CLIP work for a chunk, then each listing's scan"""
+        urls = list(dict.fromkeys(u for plan in chunk for u in self._image_urls(plan)))
+        stats['image_refs'] += sum(len(self._image_urls(plan)) for plan in chunk)
+        images = self._download_all(urls)
+        stats['images_downloaded'] += len(urls)
+
+        # Gemini first (slow, I/O bound), CLIP encodes while it is in flight
+        synthid = self._ready('synthid')
+        gemini = {}
+        if synthid is not None:
+            for url in dict.fromkeys(plan['gemini'] for plan in chunk if plan['gemini']):
+                gemini[url] = self.gemini_pool.submit(self._gemini, synthid.analyzer, images.get(url))
+            stats['gemini_calls'] += len(gemini)
+
+        similarity = self._ready('image_similarity')
+        clip_urls = list(dict.fromkeys(u for plan in chunk for u in plan['clip']))
+        if similarity is not None and clip_urls:
+            try:
+                stats['images_encoded'] += similarity.analyzer.prime_embeddings({u: images.get(u) for u in clip_urls})
+            except Exception as e:
+                # The stage encodes on its own (one image at a time) if priming fails
+                logger.warning(f"⚠️ Batched CLIP encode failed: {e}")
+
+        # Every call of the chunk queues behind the others in the shared pool
+        gemini_deadline = None
+        if synthid is not None and synthid.timeout:
+            rounds = math.ceil(len(gemini) / self.gemini_workers) if gemini else 0
+            gemini_deadline = time.monotonic() + synthid.timeout * max(rounds, 1)
+
+        sentiment = self._ready('sentiment')
+        reuse = self._ready('image_reuse')
+        for plan in chunk:
+            parsed = plan['parsed']
+            stats['review_texts'] += sum(1 for r in parsed['reviews'] if r.get('text'))
+            try:
+                precomputed = dict(parsed)
+                if sentiment is not None:
+                    precomputed.update(sentiment.run(parsed, scores=scores))
+                if reuse is not None:
+                    precomputed.update(reuse.run(parsed, {u: images.get(u) for u in plan['reuse']}))
+                if synthid is not None:
+                    precomputed.update(self._synthid(synthid, parsed, gemini.get(plan['gemini']), gemini_deadline))
+                results[plan['index']] = self.pipeline.run(plan['data'], debug_timing=debug_timing, **precomputed)
+            except Exception as e:
+                results[plan['index']] = self._error(plan['data'], e)
+                stats['errors'] += 1
+
+    def _synthid(self, stage, parsed: Dict, future, deadline: Optional[float]) -> Dict:
+        """SynthID stage output for one listing from its (shared) Gemini call"""
+        synthid_results = stage._base(parsed)
+        if future is None:
+            # No valid image - same output as the stage
+            return stage.run(parsed)
+        try:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline else None
+            return stage._record(synthid_results, future.result(timeout=timeout))
+        except FutureTimeout:
+            return stage._failed(synthid_results, TimeoutError('Gemini did not answer in time'))
+        except Exception as e:
+            return stage._failed(synthid_results, e)
+
+    def _error(self, payload: Dict, e: Exception) -> Dict:
+        logger.error(f"❌ Error in batch scan of {payload.get('url', 'unknown')}: {e}")
+        logger.error(traceback.format_exc())
+        return {'success': False, 'error': str(e), 'error_type': str(type(e))}
+
+    def shutdown(self):
+        self.gemini_pool.shutdown(wait=False)
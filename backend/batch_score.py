@@ -0,0 +1,338 @@
+"""
+batch_score.py - score a JSONL dump of scraped listings offline
+
+Streams a file of /analyze payloads (one JSON object per line, .gz ok) through
+the same analyzers as the HTTP service, without the Flask app in the way:
+
+  - the input is read in windows of --window listings; at most two windows per
+    worker process are in flight, so memory stays flat however long the file is
+  - each worker process loads its own analyzers and scores a window with
+    BatchScanner (shared downloads, batched CLIP, deduped reviews - see
+    batch_analysis.py); --gemini-concurrency is split between the processes
+  - results are written in input order, one row per input line, as JSONL (the
+    /analyze response plus "line") or as a directory of Parquet parts (summary
+    columns plus the response as JSON; needs pyarrow)
+  - after every window the output is flushed and a checkpoint records how far it
+    got; --resume continues from there after a crash or Ctrl-C
+
+With more than one process, the cross-listing indexes (image reuse, CLIP search)
+are kept in memory per process - concurrent writers would corrupt the files.
+Use --processes 1 to check against and extend IMAGE_HASH_INDEX_PATH / CLIP_INDEX_PATH.
+
+Usage (from backend/):
+    python batch_score.py listings.jsonl.gz -o scores.jsonl --processes 4
+    python batch_score.py listings.jsonl.gz -o scores.parquet --resume
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import logging
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------
+# Worker processes
+# ---------------------------------------------------------------------
+_scanner = None
+
+
+def _init_worker(variant: str, gemini_workers: int, deadline: float, memory_indexes: bool, torch_threads: int):
+    """Load the analyzers once per worker process"""
+    global _scanner
+    if memory_indexes:
+        os.environ['IMAGE_HASH_INDEX_PATH'] = ''
+        os.environ['CLIP_INDEX_PATH'] = ''
+    # Results go to the output file, not to a capture of the HTTP service
+    os.environ['CAPTURE_FILE'] = ''
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from app_factory import APP_VARIANTS, init_analyzers, build_pipeline
+    from batch_analysis import BatchScanner
+
+    config = dict(APP_VARIANTS[variant], cache=False)
+    pipeline = build_pipeline(init_analyzers(config), config)
+    pipeline.deadline = deadline or None
+    _scanner = BatchScanner(pipeline, gemini_workers=gemini_workers)
+
+
+def worker_scanner():
+    """The BatchScanner of this worker process (set up by _init_worker)"""
+    return _scanner
+
+
+def _score_window(lines: List[Tuple[int, str]]) -> List[Dict]:
+    """Rows for one window of (line number, raw JSON) - invalid lines get an error row"""
+    rows = [None] * len(lines)
+    payloads, slots = [], []
+    for i, (line_no, raw) in enumerate(lines):
+        try:
+            payload = json.loads(raw)
+        except ValueError as e:
+            rows[i] = {'line': line_no, 'success': False, 'error': f'Invalid JSON: {e}'}
+            continue
+        payloads.append(payload)
+        slots.append(i)
+
+    if payloads:
+        results = _scanner.run(payloads)['results']
+        for i, result in zip(slots, results):
+            rows[i] = {'line': lines[i][0], **result}
+    # The pipeline's index writes are buffered; a window is the unit of progress
+    _scanner.pipeline.flush()
+    return rows
+
+
+# ---------------------------------------------------------------------
+# Input / output
+# ---------------------------------------------------------------------
+def read_windows(path: str, window: int, skip_lines: int = 0,
+                 stop_line: Optional[int] = None) -> Iterator[Tuple[int, List[Tuple[int, str]]]]:
+    """
+    (last line number consumed, [(line number, raw JSON), ...]) per window
+
+    Line numbers are 1-based physical lines; blank lines are consumed but not scored.
+    Lines up to skip_lines are skipped, reading stops after stop_line.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    batch, line_no, yielded = [], skip_lines, skip_lines
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line_no, raw in enumerate(f, start=1):
+            if line_no <= skip_lines:
+                continue
+            if stop_line and line_no > stop_line:
+                line_no -= 1
+                break
+            if raw.strip():
+                batch.append((line_no, raw))
+            if len(batch) >= window:
+                yield line_no, batch
+                batch, yielded = [], line_no
+    if line_no > yielded:
+        yield line_no, batch
+
+
+class JsonlOutput:
+    """Appends rows to a JSONL file; a checkpoint stores its size"""
+
+    def __init__(self, path: str, resume_state: Optional[Dict]):
+        self.path = path
+        self.f = open(path, 'a' if resume_state else 'w', encoding='utf-8')
+        if resume_state:
+            # Drop rows written after the last checkpoint
+            self.f.truncate(resume_state['output_bytes'])
+            self.f.seek(resume_state['output_bytes'])
+
+    def write(self, rows: List[Dict]):
+        for row in rows:
+            self.f.write(json.dumps(row, default=str, ensure_ascii=False) + '\n')
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def state(self) -> Dict:
+        return {'output_bytes': self.f.tell()}
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetOutput:
+    """One Parquet file per window in a directory (readable as one dataset)"""
+
+    def __init__(self, path: str, resume_state: Optional[Dict]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("❌ Parquet output needs pyarrow (pip install pyarrow) - or write .jsonl")
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.path = path
+        self.parts = resume_state['parts'] if resume_state else 0
+        os.makedirs(path, exist_ok=True)
+        # Drop parts written after the last checkpoint (or all of them on a fresh run)
+        for name in os.listdir(path):
+            if name.startswith('part-') and name.endswith('.parquet') and int(name[5:-8]) >= self.parts:
+                os.remove(os.path.join(path, name))
+
+    @staticmethod
+    def _columns(row: Dict) -> Dict:
+        """Summary columns; the full response is kept as JSON in 'response'"""
+        risk = row.get('risk') or {}
+        return {
+            'line': row['line'],
+            'url': row.get('url'),
+            'success': bool(row.get('success')),
+            'error': row.get('error'),
+            'risk_score': risk.get('score'),
+            'risk_level': risk.get('level'),
+            'partial': bool(row.get('partial', False)),
+            'response': json.dumps(row, default=str, ensure_ascii=False),
+        }
+
+    def write(self, rows: List[Dict]):
+        if not rows:
+            return
+        table = self.pa.Table.from_pylist([self._columns(r) for r in rows])
+        final = os.path.join(self.path, f'part-{self.parts:06d}.parquet')
+        self.pq.write_table(table, final + '.tmp')
+        os.replace(final + '.tmp', final)
+        self.parts += 1
+
+    def state(self) -> Dict:
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, state: Dict):
+    """Atomic rewrite, so a crash leaves either the old or the new checkpoint"""
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+# ---------------------------------------------------------------------
+# Main loop
+# ---------------------------------------------------------------------
+def map_windows(windows: Iterator[Tuple[int, List]], work: Callable, worker_args: tuple,
+                processes: int) -> Iterator[Tuple[int, List[Dict]]]:
+    """
+    (last line, work(window)) per window, in input order
+
+    Args:
+        windows: read_windows() output
+        work: Module-level function run in a worker (after _init_worker(*worker_args))
+        worker_args: _init_worker arguments
+        processes: Worker processes (0 = run in this process)
+    """
+    if processes == 0:
+        _init_worker(*worker_args)
+        for last_line, batch in windows:
+            yield last_line, work(batch)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=_init_worker, initargs=worker_args) as pool:
+        in_flight = deque()
+        for last_line, batch in windows:
+            in_flight.append((last_line, pool.submit(work, batch)))
+            # Bounded memory: wait for the oldest window before reading further
+            while len(in_flight) >= 2 * processes:
+                last, future = in_flight.popleft()
+                yield last, future.result()
+        while in_flight:
+            last, future = in_flight.popleft()
+            yield last, future.result()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Score a JSONL dump of listings offline')
+    parser.add_argument('input', help='JSONL of /analyze payloads, one per line (.gz ok)')
+    parser.add_argument('-o', '--output', required=True, help='.jsonl file or .parquet directory')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'],
+                        help='Output format (default: from the output extension)')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint.json)')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint')
+    parser.add_argument('--variant', choices=['full', 'cache', 'caching'], default='full',
+                        help='Analyzer set (as app_factory.APP_VARIANTS, never with the response cache)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (0 = score in this process)')
+    parser.add_argument('--window', type=int, default=50, help='Listings per task')
+    parser.add_argument('--gemini-concurrency', type=int, default=int(os.getenv('BATCH_GEMINI_WORKERS', 4)),
+                        help='Gemini calls in flight in total, split between the processes')
+    parser.add_argument('--deadline', type=float, default=0,
+                        help='Per-listing scan deadline in seconds (0 = wait for every stage)')
+    parser.add_argument('--limit', type=int, help='Stop after this many input lines')
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fmt = args.format or ('parquet' if args.output.rstrip('/').endswith('.parquet') else 'jsonl')
+    checkpoint_path = args.checkpoint or args.output.rstrip('/') + '.checkpoint.json'
+
+    os.environ['LOG_LEVEL'] = args.log_level
+    from log_setup import configure_logging
+    configure_logging(args.log_level)
+
+    state = load_checkpoint(checkpoint_path)
+    if state and not args.resume:
+        sys.stderr.write(f"❌ {checkpoint_path} exists - pass --resume to continue or delete it to start over\n")
+        return 1
+    if state and os.path.abspath(state['input']) != os.path.abspath(args.input):
+        sys.stderr.write(f"❌ Checkpoint is for {state['input']}, not {args.input}\n")
+        return 1
+    if args.resume and not state:
+        logger.warning(f"⚠️ No checkpoint at {checkpoint_path} - starting from the first line")
+
+    processes = max(args.processes, 0)
+    pool_size = max(processes, 1)
+    gemini_workers = max(1, args.gemini_concurrency // pool_size)
+    worker_args = (args.variant, gemini_workers, args.deadline, processes > 1,
+                   max(1, (os.cpu_count() or 1) // pool_size) if processes > 1 else 0)
+    if processes > 1:
+        logger.warning(f"⚠️ {processes} processes: image reuse / CLIP indexes are kept in memory per process")
+
+    output = (ParquetOutput if fmt == 'parquet' else JsonlOutput)(args.output, state)
+    lines_done = state['lines_done'] if state else 0
+    totals = dict(state['totals']) if state else {'listings': 0, 'errors': 0}
+    started, scored_here = time.monotonic(), 0
+
+    def commit(last_line, rows):
+        nonlocal lines_done, scored_here
+        output.write(rows)
+        lines_done = last_line
+        scored_here += len(rows)
+        totals['listings'] += len(rows)
+        totals['errors'] += sum(1 for r in rows if not r.get('success'))
+        save_checkpoint(checkpoint_path, {
+            'input': args.input, 'output': args.output, 'format': fmt,
+            'lines_done': lines_done, 'totals': totals,
+            'updated_at': datetime.now().isoformat(), **output.state(),
+        })
+        rate = scored_here / max(time.monotonic() - started, 1e-9)
+        sys.stderr.write(f"✅ line {lines_done}: {totals['listings']} listings scored "
+                         f"({rate:.1f}/s), {totals['errors']} errors\n")
+
+    windows = read_windows(args.input, args.window, skip_lines=lines_done, stop_line=args.limit)
+
+    interrupted = False
+    try:
+        for last_line, rows in map_windows(windows, _score_window, worker_args, processes):
+            commit(last_line, rows)
+    except KeyboardInterrupt:
+        interrupted = True
+        sys.stderr.write(f"⚠️ Interrupted - rerun with --resume to continue after line {lines_done}\n")
+    finally:
+        output.close()
+
+    summary = {'input': args.input, 'output': args.output, 'format': fmt, 'lines_done': lines_done,
+               **totals, 'seconds': round(time.monotonic() - started, 1), 'interrupted': interrupted}
+    print(json.dumps(summary, indent=2))
+    return 130 if interrupted else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
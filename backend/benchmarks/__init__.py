@@ -0,0 +1,12 @@
+"""
+benchmarks - reproducible performance numbers for the backend
+
+Everything runs offline: images come from a local HTTP server and Gemini is
+replaced by a fake model with configurable latency (see fakes.py), so two runs
+on the same machine are comparable. Run from backend/:
+
+    python -m benchmarks.e2e --sizes small,medium,large --requests 30 --concurrency 8
+    python -m benchmarks.e2e --server async --output results/e2e.json
+
+Results are JSON (throughput, p50/p95/p99 latency, per-stage timings).
+"""
@@ -0,0 +1,282 @@
+"""
+e2e.py - end-to-end /analyze benchmark, fully offline
+
+Starts the local image server, builds the app (app.py, or app_async.py with
+--server async) with the fake Gemini installed on its SynthID stage, serves it on
+a local port and posts synthetic listings of each size with N concurrent
+clients. Every listing is new (fresh URL and images), so each request is a full
+scan. Stages whose analyzer cannot start here (e.g. CLIP weights not downloaded)
+are listed under 'stages_ready' and show up as not_ready.
+
+Usage (from backend/):
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --sizes large --requests 50 --concurrency 16 --gemini-latency-ms 1500
+    python -m benchmarks.e2e --server async --output results/e2e-async.json
+
+Output (stdout or --output):
+    {"config": {...}, "environment": {...}, "stages_ready": {...},
+     "results": {"small": {"throughput_rps", "latency": {p50/p95/p99...},
+                           "stages": {"synthid": {p50/p95/p99..., "statuses": {...}}}}, ...}}
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from benchmarks.fakes import ImageServer, FakeGeminiModel, install_fake_gemini
+from benchmarks.listings import SIZES, make_listing
+from benchmarks.stats import summarize
+
+# Keep the run offline and side-effect free: no real Gemini / Backboard, no index, trace or capture files
+OFFLINE_ENV = {
+    'GEMINI_API_KEY': '',
+    'BACKBOARD_API_KEY': '',
+    'IMAGE_HASH_INDEX_PATH': '',
+    'CLIP_INDEX_PATH': '',
+    'TRACE_FILE': '',
+    'CAPTURE_FILE': '',
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline end-to-end /analyze benchmark')
+    parser.add_argument('--server', choices=['flask', 'async'], default='flask',
+                        help='flask: app.py (threaded WSGI), async: app_async.py (hypercorn)')
+    parser.add_argument('--sizes', default='small,medium,large',
+                        help=f'Comma-separated listing sizes ({", ".join(SIZES)})')
+    parser.add_argument('--requests', type=int, default=20, help='Measured requests per size')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per size')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients')
+    parser.add_argument('--gemini-latency-ms', type=float, default=800.0)
+    parser.add_argument('--jitter', type=float, default=0.25, help='+/- share of the Gemini / CDN latency')
+    parser.add_argument('--cdn-latency-ms', type=float, default=30.0, help='Image server delay per download')
+    parser.add_argument('--image-size', type=int, default=512, help='Edge of the served images in pixels')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=120.0, help='Client timeout per request (s)')
+    parser.add_argument('--log-level', default='ERROR', help='Backend LOG_LEVEL during the run')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    args.sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in args.sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+    return args
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """The backend app served on 127.0.0.1 from a background thread"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.port = _free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self._thread = None
+        self._stop = None
+
+        if kind == 'async':
+            from app_async import app
+        else:
+            from app import app
+        from app import pipeline
+        self.app = app
+        self.pipeline = pipeline
+
+    def start(self):
+        if self.kind == 'async':
+            self._thread = threading.Thread(target=self._serve_async, name='app-server', daemon=True)
+        else:
+            from werkzeug.serving import make_server
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log line per request
+            self._wsgi = make_server('127.0.0.1', self.port, self.app, threaded=True)
+            self._thread = threading.Thread(target=self._wsgi.serve_forever, name='app-server', daemon=True)
+        self._thread.start()
+        self._wait_ready()
+        return self
+
+    def _serve_async(self):
+        from hypercorn.config import Config
+        from hypercorn.asyncio import serve
+
+        config = Config()
+        config.bind = [f'127.0.0.1:{self.port}']
+        config.accesslog = None
+
+        async def main():
+            self._loop = asyncio.get_running_loop()
+            self._stop = asyncio.Event()
+            await serve(self.app, config, shutdown_trigger=self._stop.wait)
+
+        asyncio.run(main())
+
+    def _wait_ready(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f'{self.base_url}/health', timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError(f'{self.kind} server did not come up on {self.base_url}')
+
+    def stop(self):
+        if self.kind == 'async':
+            if self._stop is not None:
+                self._loop.call_soon_threadsafe(self._stop.set)
+        else:
+            self._wsgi.shutdown()
+        self._thread.join(timeout=10)
+
+
+class Client:
+    """Posts payloads to /analyze from a pool of threads, one requests.Session each"""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.url = f'{base_url}/analyze'
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def post(self, payload):
+        """
+        Returns:
+            {'latency_ms', 'ok', 'status_code', 'stages', 'partial'} for one request
+        """
+        started = time.perf_counter()
+        try:
+            resp = self._session().post(self.url, json=payload, timeout=self.timeout)
+            body = resp.json()
+            ok = resp.ok and body.get('success', False)
+            return {
+                'latency_ms': (time.perf_counter() - started) * 1000,
+                'ok': ok,
+                'status_code': resp.status_code,
+                'stages': body.get('stages', {}),
+                'partial': body.get('partial', False),
+                'error': None if ok else body.get('error'),
+            }
+        except (requests.RequestException, ValueError) as e:
+            return {'latency_ms': (time.perf_counter() - started) * 1000, 'ok': False, 'status_code': None,
+                    'stages': {}, 'partial': False, 'error': str(e)}
+
+
+def run_size(client: Client, cdn: ImageServer, size: str, args, seed_base: int):
+    """Warm up, then run args.requests scans of one listing size"""
+    def payload(n):
+        listing_id = f'{size}-{seed_base + n}'
+        return make_listing(size, cdn.url, seed=seed_base + n, listing_id=listing_id)
+
+    for n in range(args.warmup):
+        client.post(payload(-1 - n))
+
+    payloads = [payload(n) for n in range(args.requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(client.post, payloads))
+    wall = time.perf_counter() - started
+
+    ok = [o for o in outcomes if o['ok']]
+    stage_times = defaultdict(list)
+    stage_statuses = defaultdict(Counter)
+    for outcome in ok:
+        for stage, info in outcome['stages'].items():
+            stage_statuses[stage][info.get('status')] += 1
+            if info.get('duration_ms') is not None:
+                stage_times[stage].append(info['duration_ms'])
+
+    errors = Counter(str(o['error'])[:200] for o in outcomes if not o['ok'])
+    return {
+        'shape': SIZES[size],
+        'requests': len(outcomes),
+        'ok': len(ok),
+        'errors': len(outcomes) - len(ok),
+        'error_samples': dict(errors.most_common(5)),
+        'partial': sum(1 for o in ok if o['partial']),
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(ok) / wall, 3) if wall else None,
+        'latency': summarize([o['latency_ms'] for o in ok]),
+        'stages': {
+            stage: dict(summarize(stage_times[stage]), statuses=dict(stage_statuses[stage]))
+            for stage in sorted(stage_statuses)
+        },
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    os.environ.update(OFFLINE_ENV)
+    os.environ['LOG_LEVEL'] = args.log_level
+    sys.stderr.write(f"🔍 Building the {args.server} app (offline)...\n")
+
+    with ImageServer(latency_ms=args.cdn_latency_ms, jitter=args.jitter, size=args.image_size,
+                     seed=args.seed) as cdn:
+        server = AppServer(args.server)
+        gemini = FakeGeminiModel(latency_ms=args.gemini_latency_ms, jitter=args.jitter, seed=args.seed)
+        install_fake_gemini(server.pipeline, gemini)
+        server.start()
+
+        client = Client(server.base_url, args.timeout)
+        results = {}
+        try:
+            for i, size in enumerate(args.sizes):
+                result = run_size(client, cdn, size, args, seed_base=args.seed * 100000 + i * 10000)
+                results[size] = result
+                latency = result['latency']
+                sys.stderr.write(
+                    f"✅ {size}: {result['ok']}/{result['requests']} ok, {result['throughput_rps']} req/s, "
+                    f"p50 {latency.get('p50_ms')}ms p95 {latency.get('p95_ms')}ms p99 {latency.get('p99_ms')}ms\n"
+                )
+        finally:
+            server.stop()
+
+        report = {
+            'benchmark': 'e2e',
+            'timestamp': datetime.now().isoformat(),
+            'config': {k: v for k, v in vars(args).items() if k != 'output'},
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'stages_ready': {stage.name: stage.ready for stage in server.pipeline.stages},
+            'fakes': {'gemini': gemini.stats(), 'image_server': cdn.stats()},
+            'results': results,
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        sys.stderr.write(f"✅ Report written to {args.output}\n")
+    else:
+        print(text)
+    return 0 if all(r['errors'] == 0 for r in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
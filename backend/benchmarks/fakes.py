@@ -0,0 +1,216 @@
+"""
+fakes.py - local stand-ins for the Etsy CDN and Gemini
+
+ImageServer serves a deterministic JPEG for every path (same path -> same bytes),
+after an optional per-request delay, so image downloads go through the real
+HTTP code without touching the network. A URL can ask for extra delay
+(url(key, delay_ms=5000)) to simulate a slow upstream for some listings.
+
+FakeGeminiModel takes the place of the genai.GenerativeModel the SynthID
+detector holds: generate_content / generate_content_async wait for the configured
+latency and answer with the JSON verdict the real prompt asks for.
+
+    with ImageServer(latency_ms=40) as cdn:
+        url = cdn.url('listing-1-0')
+        install_fake_gemini(pipeline, FakeGeminiModel(latency_ms=800))
+"""
+
+import io
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def _jittered(latency_ms: float, jitter: float, rng: random.Random) -> float:
+    """Seconds to wait: latency_ms +/- jitter (share of latency)"""
+    if latency_ms <= 0:
+        return 0.0
+    return max(0.0, latency_ms * (1 + rng.uniform(-jitter, jitter))) / 1000
+
+
+def render_image(key: str, size: int = 512) -> bytes:
+    """
+    Deterministic JPEG for a key - a smooth colour field, so it compresses like a
+    product photo and different keys give different perceptual hashes
+    """
+    seed = int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], 'big')
+    rng = random.Random(seed)
+    small = Image.frombytes('RGB', (8, 8), bytes(rng.randrange(256) for _ in range(8 * 8 * 3)))
+    image = small.resize((size, size), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class ImageServer:
+    """Threaded HTTP server on 127.0.0.1 answering GET /img/<key>.jpg[?size=N][&delay_ms=N]"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0.0,
+                 jitter: float = 0.25, size: int = 512, seed: int = 0):
+        """
+        Args:
+            host, port: Bind address (port 0 = any free port)
+            latency_ms: Delay before each response (CDN round trip)
+            jitter: +/- share of latency_ms, drawn per request
+            size: Default image edge in pixels
+            seed: Seed for the latency jitter
+        """
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.size = size
+        self.requests = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._images = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def url(self, key: str, size: int = None, delay_ms: float = None) -> str:
+        """URL of the image for key (delay_ms: served that much slower than the rest)"""
+        query = urlencode({k: v for k, v in (('size', size), ('delay_ms', delay_ms)) if v})
+        url = f'{self.base_url}/img/{key}.jpg'
+        return f'{url}?{query}' if query else url
+
+    def start(self) -> 'ImageServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='image-server', daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Image server on {self.base_url} ({self.latency_ms}ms latency)")
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        return {'requests': self.requests, 'bytes_sent': self.bytes_sent}
+
+    def _image(self, key: str, size: int) -> bytes:
+        with self._lock:
+            body = self._images.get((key, size))
+        if body is None:
+            body = render_image(key, size)
+            with self._lock:
+                self._images[(key, size)] = body
+        return body
+
+    def _delay(self) -> float:
+        with self._lock:
+            return _jittered(self.latency_ms, self.jitter, self._rng)
+
+    def _respond(self, key: str, query: Dict):
+        """(status, body, seconds to wait) for GET /img/<key>.jpg - override to serve other content"""
+        size = int(query.get('size', [self.size])[0])
+        return 200, self._image(key, size), self._delay() + float(query.get('delay_ms', [0])[0]) / 1000
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if not parts.path.startswith('/img/'):
+                    self.send_error(404)
+                    return
+                key = parts.path[len('/img/'):].rsplit('.', 1)[0]
+                status, body, delay = server._respond(key, parse_qs(parts.query))
+                time.sleep(delay)
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'max-age=31536000')
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class FakeGeminiModel:
+    """Drop-in for genai.GenerativeModel with a configurable response time"""
+
+    def __init__(self, latency_ms: float = 800.0, jitter: float = 0.25, ai_rate: float = 0.2, seed: int = 0):
+        """
+        Args:
+            latency_ms: Time generate_content takes
+            jitter: +/- share of latency_ms, drawn per call
+            ai_rate: Share of calls answered "AI generated"
+            seed: Seed for jitter and verdicts (same seed -> same sequence)
+        """
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.ai_rate = ai_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _next(self):
+        """(delay seconds, response) for one call"""
+        with self._lock:
+            self.calls += 1
+            delay = _jittered(self.latency_ms, self.jitter, self._rng)
+            ai = self._rng.random() < self.ai_rate
+            confidence = self._rng.randint(70, 95) if ai else self._rng.randint(5, 30)
+        verdict = {
+            'is_ai_generated': ai,
+            'confidence': confidence,
+            'indicators': ['smooth waxy textures', 'inconsistent lighting'] if ai else [],
+            'explanation': 'Synthetic verdict from the benchmark fake',
+        }
+        return delay, SimpleNamespace(text=json.dumps(verdict))
+
+    def generate_content(self, contents, **kwargs):
+        delay, response = self._next()
+        time.sleep(delay)
+        return response
+
+    async def generate_content_async(self, contents, **kwargs):
+        delay, response = self._next()
+        await asyncio.sleep(delay)
+        return response
+
+    def stats(self):
+        return {'calls': self.calls}
+
+
+def install_fake_gemini(pipeline, model, model_name: str = 'fake-gemini'):
+    """Point the pipeline's SynthID stage at a detector backed by a fake model"""
+    from analyzers.synthid_detector import SynthIDDetector
+
+    stage = pipeline.stage('synthid')
+    if stage is None:
+        logger.warning("⚠️ Pipeline has no synthid stage - fake Gemini not installed")
+        return
+    stage.analyzer = SynthIDDetector(model=model, model_name=model_name)
@@ -0,0 +1,87 @@
+"""
+listings.py - synthetic /analyze payloads shaped like the extension's scrape
+
+A listing has `images` product photos and `reviews` reviews, `review_photos` of
+which carry a photo. Review text, ratings and dates are drawn from a seeded RNG,
+with a few copy-pasted reviews so the duplicate detector has work to do.
+"""
+
+import random
+from datetime import date, timedelta
+from typing import Callable, Dict
+
+# Listing shapes the suite runs by default
+SIZES = {
+    'small': {'images': 3, 'reviews': 10, 'review_photos': 2},
+    'medium': {'images': 8, 'reviews': 100, 'review_photos': 15},
+    'large': {'images': 15, 'reviews': 1000, 'review_photos': 60},
+}
+
+_OPENERS = ['Absolutely love', 'Really happy with', 'Not impressed by', 'Pretty good', 'Disappointed with',
+            'Beautiful', 'Decent', 'Amazing quality on', 'Okay', 'Terrible']
+_SUBJECTS = ['this necklace', 'the print', 'my order', 'the mug', 'this ring', 'the sweater', 'the candle',
+             'this bag', 'the poster', 'the earrings']
+_DETAILS = ['shipping was fast', 'it arrived damaged', 'the colors are exactly like the photos',
+            'the seller answered all my questions', 'it looks cheaper than pictured', 'packaging was lovely',
+            'it took three weeks to arrive', 'great gift for my sister', 'the size runs small',
+            'would buy again', 'the material feels flimsy', 'five stars all the way']
+
+
+def review_text(rng: random.Random) -> str:
+    """One review: an opener sentence plus 1-4 detail sentences"""
+    sentences = [f"{rng.choice(_OPENERS)} {rng.choice(_SUBJECTS)}."]
+    sentences += [f"{rng.choice(_DETAILS).capitalize()}." for _ in range(rng.randint(1, 4))]
+    return ' '.join(sentences)
+
+
+def make_listing(size, image_url: Callable[[str], str], seed: int = 0, listing_id: str = None) -> Dict:
+    """
+    Build one /analyze payload
+
+    Args:
+        size: Key of SIZES or a dict with images / reviews / review_photos counts
+        image_url: Maps an image key to a URL (e.g. ImageServer.url)
+        seed: RNG seed - the same seed gives the same payload
+        listing_id: Used in the listing URL and image keys (default: derived from seed)
+
+    Returns:
+        Payload as the extension posts it ({'url', 'data': {...}})
+    """
+    shape = SIZES[size] if isinstance(size, str) else size
+    rng = random.Random(seed)
+    listing_id = listing_id or f'{seed}'
+    shop_id = f'shop-{rng.randrange(1000)}'
+
+    images = [{'url': image_url(f'{listing_id}-{i}')} for i in range(shape['images'])]
+
+    photo_reviews = set(rng.sample(range(shape['reviews']), min(shape['review_photos'], shape['reviews'])))
+    start = date(2024, 1, 1)
+    reviews = []
+    for i in range(shape['reviews']):
+        # ~5% copy an earlier review word for word
+        if reviews and rng.random() < 0.05:
+            text = rng.choice(reviews)['text']
+        else:
+            text = review_text(rng)
+        review = {
+            'text': text,
+            'rating': rng.choices([5, 4, 3, 2, 1], weights=[55, 20, 10, 5, 10])[0],
+            'date': (start + timedelta(days=rng.randrange(365))).strftime('%b %d, %Y'),
+            'images': [],
+        }
+        if i in photo_reviews:
+            review['images'] = [image_url(f'{listing_id}-review-{i}')]
+        reviews.append(review)
+
+    return {
+        'url': f'https://www.etsy.com/listing/{listing_id}/benchmark-item',
+        'data': {
+            'images': images,
+            'reviews': reviews,
+            'sellerName': shop_id,
+            'sellerAgeMonths': rng.randint(1, 120),
+            'salesCount': rng.randint(0, 50000),
+            'listingAgeDays': rng.randint(1, 2000),
+            'reviewDebug': {'shop_id': shop_id},
+        },
+    }
@@ -0,0 +1,403 @@
+"""
+loadgen.py - load generator + capacity planning for /analyze
+
+Sends a mix of /analyze payloads to a backend at each load level of a sweep and
+measures what it sustains:
+
+    --rps 1,2,4,8           open loop: requests are scheduled as a Poisson process at
+                            each rate, whether or not earlier ones came back; latency
+                            is measured from the scheduled send time (no coordinated omission)
+    --concurrency 1,4,16    closed loop: N clients each send the next request when the last returns
+
+Workload knobs:
+    --mix small:0.6,medium:0.3,large:0.1   listing sizes (benchmarks/listings.py)
+    --payloads captured.jsonl              replay real payloads instead (one JSON per line)
+    --cache-hit-ratio 0.3                  share of requests that repeat an already-sent listing
+    --burst-rate 0.05 --burst-size 8       share of requests that arrive as a burst of the
+                                           same listing (a trending listing opened by many users)
+    --slow-share 0.1 --slow-ms 8000        share of listings whose images download slowly
+
+Images are served by a local image server started here (--image-host must be
+reachable from the backend). Gemini latency can only be set with --local, which
+starts the backend in this process with the fake Gemini (see e2e.py).
+
+The report has, per level, offered / achieved throughput and p50/p95/p99; the
+knee is the first level where the backend stops keeping up (achieved < 90% of
+offered, p95 over --slo-p95-ms, or errors over 1%). With --scans-per-minute it
+also estimates the replicas needed: target rate x (1 + headroom) / best healthy
+throughput of the measured deployment.
+
+Usage (from backend/):
+    python -m benchmarks.loadgen --url http://127.0.0.1:5000 --rps 1,2,4,8,16 --duration 30
+    python -m benchmarks.loadgen --local flask --concurrency 1,2,4,8,16 --scans-per-minute 600 --plot knee.png
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from benchmarks.fakes import ImageServer, FakeGeminiModel, install_fake_gemini
+from benchmarks.listings import SIZES, make_listing
+from benchmarks.stats import summarize
+
+
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(','):
+        size, _, weight = part.partition(':')
+        size = size.strip()
+        if size not in SIZES:
+            raise argparse.ArgumentTypeError(f"unknown size '{size}' (choose from {', '.join(SIZES)})")
+        mix[size] = float(weight or 1)
+    return mix
+
+
+def _parse_levels(value: str) -> List[float]:
+    return [float(v) for v in value.split(',') if v.strip()]
+
+
+class Workload:
+    """Yields the next batch of payloads (one, or a burst of copies of the same listing)"""
+
+    def __init__(self, cdn: ImageServer, mix: Dict[str, float], cache_hit_ratio: float = 0.0,
+                 burst_rate: float = 0.0, burst_size: int = 5, slow_share: float = 0.0,
+                 slow_ms: float = 5000.0, payloads: Optional[List[Dict]] = None, seed: int = 0):
+        """
+        Args:
+            cdn: Image server the synthetic listings point at
+            mix: Size name -> weight
+            cache_hit_ratio: Share of requests that resend an earlier listing
+            burst_rate: Share of requests that become a burst of burst_size copies
+            slow_share: Share of new listings whose images are served slow_ms late
+            payloads: Recorded payloads to use instead of synthetic listings
+        """
+        self.cdn = cdn
+        self.sizes = list(mix)
+        self.weights = [mix[s] for s in self.sizes]
+        self.cache_hit_ratio = cache_hit_ratio
+        self.burst_rate = burst_rate
+        self.burst_size = burst_size
+        self.slow_share = slow_share
+        self.slow_ms = slow_ms
+        self.payloads = payloads
+        self.sent = []
+        self.counter = 0
+        self.kinds = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> Dict:
+        self.counter += 1
+        if self.payloads:
+            payload = self.payloads[(self.counter - 1) % len(self.payloads)]
+            self.kinds['replayed'] += 1
+            return payload
+
+        size = self._rng.choices(self.sizes, weights=self.weights)[0]
+        slow = self._rng.random() < self.slow_share
+        listing_id = f'load-{size}-{self.counter}'
+        if slow:
+            def image_url(key):
+                return self.cdn.url(key, delay_ms=self.slow_ms)
+            self.kinds['slow'] += 1
+        else:
+            image_url = self.cdn.url
+        self.kinds[size] += 1
+        return make_listing(size, image_url, seed=self.counter, listing_id=listing_id)
+
+    def next_batch(self) -> List[Dict]:
+        with self._lock:
+            if self.sent and self._rng.random() < self.cache_hit_ratio:
+                payload = self._rng.choice(self.sent)
+                self.kinds['repeat'] += 1
+            else:
+                payload = self._fresh()
+                self.sent.append(payload)
+            if self._rng.random() < self.burst_rate:
+                self.kinds['burst'] += 1
+                return [payload] * self.burst_size
+            return [payload]
+
+
+def _post_timed(client, payload, scheduled_at: float) -> Dict:
+    """client.post, with latency counted from when the request was due"""
+    outcome = client.post(payload)
+    outcome['latency_ms'] = (time.perf_counter() - scheduled_at) * 1000
+    outcome['finished_at'] = time.perf_counter()
+    return outcome
+
+
+def run_open_loop(client, workload: Workload, rps: float, duration: float, max_in_flight: int, seed: int) -> Dict:
+    """Poisson arrivals at `rps` for `duration` seconds"""
+    rng = random.Random(seed)
+    futures, dropped = [], 0
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def send(payload, due):
+        try:
+            return _post_timed(client, payload, due)
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='load') as pool:
+        started = time.perf_counter()
+        due = started
+        while due < started + duration:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for payload in workload.next_batch():
+                if in_flight.acquire(blocking=False):
+                    futures.append(pool.submit(send, payload, due))
+                else:
+                    dropped += 1
+            due += rng.expovariate(rps)
+        outcomes = [f.result() for f in futures]
+    return _level_result('rps', rps, outcomes, started, duration, dropped)
+
+
+def run_closed_loop(client, workload: Workload, concurrency: int, duration: float) -> Dict:
+    """`concurrency` clients sending back to back for `duration` seconds"""
+    outcomes, lock = [], threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            for payload in workload.next_batch():
+                outcome = _post_timed(client, payload, time.perf_counter())
+                with lock:
+                    outcomes.append(outcome)
+
+    threads = [threading.Thread(target=worker, name=f'load-{i}', daemon=True) for i in range(int(concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _level_result('concurrency', concurrency, outcomes, started, duration, dropped=0)
+
+
+def _level_result(mode: str, level: float, outcomes: List[Dict], started: float, duration: float, dropped: int) -> Dict:
+    ok = [o for o in outcomes if o['ok']]
+    finished = max((o['finished_at'] for o in outcomes), default=started + duration)
+    elapsed = max(finished - started, duration)
+    errors = Counter(str(o['error'])[:200] for o in outcomes if not o['ok'])
+    return {
+        'mode': mode,
+        'level': level,
+        'sent': len(outcomes),
+        'dropped': dropped,
+        'ok': len(ok),
+        'errors': len(outcomes) - len(ok),
+        'error_rate': round((len(outcomes) - len(ok)) / len(outcomes), 4) if outcomes else 0.0,
+        'error_samples': dict(errors.most_common(3)),
+        'partial': sum(1 for o in ok if o['partial']),
+        'offered_rps': round((len(outcomes) + dropped) / duration, 3),
+        'achieved_rps': round(len(ok) / elapsed, 3),
+        'latency': summarize([o['latency_ms'] for o in ok]),
+    }
+
+
+def find_knee(levels: List[Dict], slo_p95_ms: Optional[float]) -> Dict:
+    """
+    Best healthy level and the first level where the backend saturates
+
+    A level is healthy when achieved >= 90% of offered throughput, errors <= 1%
+    and p95 is within the SLO (when one is given).
+    """
+    def healthy(level):
+        if level['error_rate'] > 0.01 or not level['ok']:
+            return False
+        if level['mode'] == 'rps' and level['achieved_rps'] < 0.9 * level['offered_rps']:
+            return False
+        if slo_p95_ms and level['latency'].get('p95_ms', math.inf) > slo_p95_ms:
+            return False
+        return True
+
+    knee, best = None, None
+    for level in levels:
+        if healthy(level):
+            if knee is None and (best is None or level['achieved_rps'] > best['achieved_rps']):
+                best = level
+        elif knee is None:
+            knee = level
+    return {
+        'knee_level': knee['level'] if knee else None,
+        'max_healthy_level': best['level'] if best else None,
+        'max_healthy_rps': best['achieved_rps'] if best else None,
+        'p95_at_max_healthy_ms': best['latency'].get('p95_ms') if best else None,
+    }
+
+
+def plan_capacity(knee: Dict, scans_per_minute: float, headroom: float) -> Dict:
+    """Replicas of the measured deployment needed for scans_per_minute"""
+    per_replica = knee['max_healthy_rps']
+    target_rps = scans_per_minute / 60
+    plan = {'scans_per_minute': scans_per_minute, 'target_rps': round(target_rps, 3), 'headroom': headroom,
+            'rps_per_replica': per_replica}
+    if per_replica:
+        plan['replicas'] = max(1, math.ceil(target_rps * (1 + headroom) / per_replica))
+    else:
+        plan['replicas'] = None
+        plan['note'] = 'No healthy level measured - rerun with lower load levels'
+    return plan
+
+
+def plot_levels(levels: List[Dict], knee: Dict, path: str):
+    """Latency (p50/p95/p99) against achieved throughput; needs matplotlib"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        sys.stderr.write("⚠️ matplotlib not installed - skipping the plot (the JSON has the same numbers)\n")
+        return
+
+    measured = [lv for lv in levels if lv['ok']]
+    x = [lv['achieved_rps'] for lv in measured]
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        ax.plot(x, [lv['latency'][key] for lv in measured], marker='o', label=key.replace('_ms', ''))
+    if knee['max_healthy_rps']:
+        ax.axvline(knee['max_healthy_rps'], color='grey', linestyle='--', label='max healthy')
+    ax.set_xlabel('achieved throughput (req/s)')
+    ax.set_ylabel('latency (ms)')
+    ax.set_yscale('log')
+    ax.set_title('/analyze latency vs throughput')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    sys.stderr.write(f"✅ Plot written to {path}\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='/analyze load generator and capacity planner')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://127.0.0.1:5000', help='Backend base URL')
+    target.add_argument('--local', choices=['flask', 'async'],
+                        help='Start the backend in this process, offline, with the fake Gemini')
+    levels = parser.add_mutually_exclusive_group(required=True)
+    levels.add_argument('--rps', type=_parse_levels, help='Open-loop request rates to sweep, e.g. 1,2,4,8')
+    levels.add_argument('--concurrency', type=_parse_levels, help='Closed-loop client counts to sweep, e.g. 1,4,16')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per level')
+    parser.add_argument('--cooldown', type=float, default=2.0, help='Pause between levels (s)')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Open loop: requests beyond this are dropped')
+    parser.add_argument('--mix', type=_parse_mix, default=_parse_mix('small:0.6,medium:0.3,large:0.1'))
+    parser.add_argument('--payloads', help='JSONL file of recorded /analyze payloads to replay')
+    parser.add_argument('--cache-hit-ratio', type=float, default=0.0)
+    parser.add_argument('--burst-rate', type=float, default=0.0)
+    parser.add_argument('--burst-size', type=int, default=5)
+    parser.add_argument('--slow-share', type=float, default=0.0)
+    parser.add_argument('--slow-ms', type=float, default=5000.0)
+    parser.add_argument('--cdn-latency-ms', type=float, default=30.0)
+    parser.add_argument('--gemini-latency-ms', type=float, default=800.0, help='--local only')
+    parser.add_argument('--image-host', default='127.0.0.1', help='Address the image server binds and advertises')
+    parser.add_argument('--slo-p95-ms', type=float, help='p95 above this marks a level unhealthy')
+    parser.add_argument('--scans-per-minute', type=float, help='Expected peak load, for the replica estimate')
+    parser.add_argument('--headroom', type=float, default=0.3, help='Spare capacity on top of the peak (0.3 = 30%%)')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--plot', help='PNG of latency vs throughput (needs matplotlib)')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def _load_payloads(path: str) -> List[Dict]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from benchmarks.e2e import AppServer, Client, OFFLINE_ENV
+
+    server = None
+    if args.local:
+        os.environ.update(OFFLINE_ENV)
+        os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+    with ImageServer(host=args.image_host, latency_ms=args.cdn_latency_ms, seed=args.seed) as cdn:
+        if args.local:
+            server = AppServer(args.local)
+            install_fake_gemini(server.pipeline, FakeGeminiModel(latency_ms=args.gemini_latency_ms, seed=args.seed))
+            server.start()
+            base_url = server.base_url
+        else:
+            base_url = args.url.rstrip('/')
+
+        workload = Workload(
+            cdn, args.mix, cache_hit_ratio=args.cache_hit_ratio, burst_rate=args.burst_rate,
+            burst_size=args.burst_size, slow_share=args.slow_share, slow_ms=args.slow_ms,
+            payloads=_load_payloads(args.payloads) if args.payloads else None, seed=args.seed,
+        )
+        client = Client(base_url, args.timeout)
+
+        mode, sweep = ('rps', args.rps) if args.rps else ('concurrency', args.concurrency)
+        levels = []
+        try:
+            for i, level in enumerate(sweep):
+                if i:
+                    time.sleep(args.cooldown)
+                sys.stderr.write(f"🔍 {mode}={level:g} for {args.duration:g}s against {base_url}...\n")
+                if mode == 'rps':
+                    result = run_open_loop(client, workload, level, args.duration, args.max_in_flight, args.seed + i)
+                else:
+                    result = run_closed_loop(client, workload, int(level), args.duration)
+                levels.append(result)
+                latency = result['latency']
+                sys.stderr.write(
+                    f"   offered {result['offered_rps']} req/s, achieved {result['achieved_rps']} req/s, "
+                    f"p50 {latency.get('p50_ms')}ms p95 {latency.get('p95_ms')}ms p99 {latency.get('p99_ms')}ms, "
+                    f"{result['errors']} errors, {result['dropped']} dropped\n"
+                )
+        finally:
+            if server is not None:
+                server.stop()
+
+    knee = find_knee(levels, args.slo_p95_ms)
+    report = {
+        'benchmark': 'loadgen',
+        'timestamp': datetime.now().isoformat(),
+        'target': base_url if not args.local else f'local:{args.local}',
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'plot')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count()},
+        'workload': dict(workload.kinds),
+        'levels': levels,
+        'knee': knee,
+    }
+    if args.scans_per_minute:
+        report['capacity'] = plan_capacity(knee, args.scans_per_minute, args.headroom)
+        replicas = report['capacity']['replicas']
+        if replicas:
+            sys.stderr.write(f"✅ {args.scans_per_minute:g} scans/min needs ~{replicas} replica(s) "
+                             f"({knee['max_healthy_rps']} req/s each, {args.headroom:.0%} headroom)\n")
+    if knee['knee_level'] is not None:
+        sys.stderr.write(f"⚠️ Saturated at {mode}={knee['knee_level']:g}\n")
+
+    if args.plot:
+        plot_levels(levels, knee, args.plot)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        sys.stderr.write(f"✅ Report written to {args.output}\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+micro.py - microbenchmarks for the CPU hot paths, with stored baselines
+
+Cases (name[param=value]):
+    risk.calculate_risk[reviews=N]                 ListingRiskCalculator, 0 .. 50k reviews
+    risk.calculate_risk_batch[rows=N]              vectorized scoring of N precomputed feature rows
+    sentiment.analyze_reviews[reviews=N,length=L]  ReviewSentimentAnalyzer, short / long texts
+    cache.get / cache.set / cache.get_stats[entries=N]
+                                                   BackboardCache (in-memory store), 10^3 .. 10^6 entries
+
+Each case is calibrated so one run takes at least --min-time, then run --repeat
+times; the median time per call is what gets compared. BackboardCache prints on
+every get/set - stdout goes to os.devnull while it is measured, so the print
+calls are counted but the terminal is not.
+
+Usage (from backend/):
+    python -m benchmarks.micro --save                # record the baseline for this machine
+    python -m benchmarks.micro --compare             # exit 1 if a case got >10% slower
+    python -m benchmarks.micro --compare --threshold 0.2 --filter cache
+    python -m benchmarks.micro --quick               # smaller sizes, for a fast check
+
+Baselines are machine specific; the default file lives under data/ (not committed).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+from contextlib import redirect_stdout, nullcontext
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.listings import make_listing, review_text
+
+DEFAULT_BASELINE = os.path.join('data', 'benchmarks', 'micro-baseline.json')
+
+RISK_REVIEWS = (0, 100, 1000, 10000, 50000)
+SENTIMENT_REVIEWS = (10, 100, 1000)
+SENTIMENT_LENGTHS = {'short': 1, 'long': 8}  # paragraphs of generated review text
+CACHE_ENTRIES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+
+RISK_BATCH_ROWS = (100, 10000, 100000)
+
+QUICK_RISK_REVIEWS = (0, 100, 1000)
+QUICK_RISK_BATCH_ROWS = (100, 10000)
+QUICK_SENTIMENT_REVIEWS = (10, 100)
+QUICK_CACHE_ENTRIES = (10 ** 3, 10 ** 4)
+
+
+# ---------------------------------------------------------------------
+# Cases: (name, make) - make() does the setup and returns the function to time
+# ---------------------------------------------------------------------
+
+def _stage_results(review_count: int) -> Dict:
+    """Plausible upstream stage outputs, so every branch of calculate_risk runs"""
+    return {
+        'sentiment': {
+            'total_reviews': review_count,
+            'sentiment_rating_mismatch_count': review_count // 20,
+            'average_sentiment': 0.31,
+            'sentiment_percentages': {'positive': 71.0, 'negative': 9.0, 'neutral': 20.0},
+        },
+        'synthid': {'any_ai': True, 'results': [{'is_ai_generated': True, 'confidence': 82}]},
+        'image_similarity': {'analyzed': True, 'verified_authentic': False, 'average_match_score': 41.5,
+                             'high_confidence_matches': 1, 'total_comparisons': 12},
+        'duplicates': {'analyzed': True, 'duplicate_review_count': review_count // 25,
+                       'duplicate_ratio': 0.04, 'largest_group_size': 3, 'duplicate_group_count': 2},
+        'image_reuse': {'analyzed': True, 'images_reused_by_other_sellers': 1, 'other_seller_count': 1},
+    }
+
+
+def risk_cases(review_counts) -> List[Tuple[str, Callable]]:
+    def make(n):
+        def setup():
+            from listing_risk_calculator import ListingRiskCalculator
+            calculator = ListingRiskCalculator()
+            shape = {'images': 5, 'reviews': n, 'review_photos': n // 20}
+            data = make_listing(shape, lambda key: f'https://i.etsystatic.com/{key}.jpg', seed=n)
+            data['results'] = _stage_results(n)
+            return lambda: calculator.calculate_risk(data)
+        return setup
+
+    return [(f'risk.calculate_risk[reviews={n}]', make(n)) for n in review_counts]
+
+
+def risk_batch_cases(row_counts) -> List[Tuple[str, Callable]]:
+    def make(n):
+        def setup():
+            from listing_risk_calculator import ListingRiskCalculator
+            calculator = ListingRiskCalculator()
+            rows = []
+            for i in range(min(n, 50)):
+                data = make_listing({'images': 5, 'reviews': 20 * (i % 5), 'review_photos': i % 5},
+                                    lambda key: f'https://i.etsystatic.com/{key}.jpg', seed=i)
+                data['results'] = _stage_results(20 * (i % 5))
+                rows.append(data)
+            sample = calculator.risk_features(rows)
+            features = {name: values[[i % len(rows) for i in range(n)]] for name, values in sample.items()}
+            return lambda: calculator.calculate_risk_batch(features)
+        return setup
+
+    return [(f'risk.calculate_risk_batch[rows={n}]', make(n)) for n in row_counts]
+
+
+def sentiment_cases(review_counts) -> List[Tuple[str, Callable]]:
+    def make(n, paragraphs):
+        def setup():
+            from review_sentiment_analyzer import ReviewSentimentAnalyzer
+            analyzer = ReviewSentimentAnalyzer()
+            rng = random.Random(n)
+            reviews = [{'text': ' '.join(review_text(rng) for _ in range(paragraphs)),
+                        'rating': rng.choice([1, 2, 3, 4, 5])} for _ in range(n)]
+            return lambda: analyzer.analyze_reviews(reviews)
+        return setup
+
+    return [(f'sentiment.analyze_reviews[reviews={n},length={length}]', make(n, paragraphs))
+            for n in review_counts for length, paragraphs in SENTIMENT_LENGTHS.items()]
+
+
+def _filled_cache(entries: int):
+    """BackboardCache with `entries` live entries; the API is unreachable, so it runs on its memory store"""
+    from backboard_cache import BackboardCache
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        # Port 9 (discard) refuses connections at once: init fails fast and falls back to memory
+        cache = BackboardCache(api_key='benchmark', base_url='http://127.0.0.1:9')
+        payload = {'success': True, 'risk': {'score': 42.0, 'level': 'MEDIUM'}, 'results': {}}
+        for i in range(entries):
+            cache.set(f'https://www.etsy.com/listing/{i}/item', payload)
+    return cache, payload
+
+
+def cache_cases(entry_counts) -> List[Tuple[str, Callable]]:
+    cases = []
+    for n in entry_counts:
+        def get(n=n):
+            cache, _ = _filled_cache(n)
+            urls = [f'https://www.etsy.com/listing/{i}/item' for i in random.Random(n).sample(range(n), min(n, 1000))]
+            state = {'i': 0}
+
+            def fn():
+                state['i'] = (state['i'] + 1) % len(urls)
+                return cache.get(urls[state['i']])
+            return fn
+
+        def set_(n=n):
+            cache, payload = _filled_cache(n)
+            state = {'i': n}
+
+            def fn():
+                state['i'] += 1
+                return cache.set(f'https://www.etsy.com/listing/{state["i"]}/item', payload)
+            return fn
+
+        def get_stats(n=n):
+            cache, _ = _filled_cache(n)
+            return cache.get_stats
+
+        cases += [
+            (f'cache.get[entries={n}]', get),
+            (f'cache.set[entries={n}]', set_),
+            (f'cache.get_stats[entries={n}]', get_stats),
+        ]
+    return cases
+
+
+def all_cases(quick: bool) -> List[Tuple[str, Callable]]:
+    if quick:
+        return (risk_cases(QUICK_RISK_REVIEWS) + risk_batch_cases(QUICK_RISK_BATCH_ROWS)
+                + sentiment_cases(QUICK_SENTIMENT_REVIEWS) + cache_cases(QUICK_CACHE_ENTRIES))
+    return (risk_cases(RISK_REVIEWS) + risk_batch_cases(RISK_BATCH_ROWS)
+            + sentiment_cases(SENTIMENT_REVIEWS) + cache_cases(CACHE_ENTRIES))
+
+
+# ---------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------
+
+def measure(fn: Callable, repeat: int, min_time: float, quiet_stdout: bool) -> Dict:
+    """
+    Time fn the way timeit does: pick a loop count so one run lasts >= min_time,
+    then take `repeat` runs
+
+    Returns:
+        Seconds per call: median / mean / stdev / min, plus loops and runs
+    """
+    with open(os.devnull, 'w') as devnull, (redirect_stdout(devnull) if quiet_stdout else nullcontext()):
+        fn()  # warm-up
+
+        loops = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time or loops >= 10 ** 6:
+                break
+            loops *= 2 if elapsed > min_time / 10 else 10
+
+        timings = [elapsed / loops]
+        for _ in range(repeat - 1):
+            started = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            timings.append((time.perf_counter() - started) / loops)
+
+    return {
+        'median_s': statistics.median(timings),
+        'mean_s': statistics.fmean(timings),
+        'stdev_s': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'min_s': min(timings),
+        'loops': loops,
+        'runs': len(timings),
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> Dict:
+    """
+    Median vs baseline median for every case in the current run
+
+    Returns:
+        name -> {'baseline_s', 'current_s', 'ratio', 'verdict'}; verdict is
+        regression / improvement (beyond threshold), same, or new (no baseline)
+    """
+    comparison = {}
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            comparison[name] = {'baseline_s': None, 'current_s': result['median_s'], 'ratio': None, 'verdict': 'new'}
+            continue
+        ratio = result['median_s'] / base['median_s'] if base['median_s'] else float('inf')
+        if ratio > 1 + threshold:
+            verdict = 'regression'
+        elif ratio < 1 - threshold:
+            verdict = 'improvement'
+        else:
+            verdict = 'same'
+        comparison[name] = {'baseline_s': base['median_s'], 'current_s': result['median_s'],
+                            'ratio': round(ratio, 3), 'verdict': verdict}
+    return comparison
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f}{unit}'
+    return f'{seconds / 1e-9:.0f}ns'
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks for risk, sentiment and cache hot paths')
+    parser.add_argument('--filter', help='Only run cases whose name contains this text')
+    parser.add_argument('--quick', action='store_true', help='Smaller sizes (no 10k+ reviews / 10^5+ entries)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per run (sets the loop count)')
+    parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help=f'Store the results as the baseline (default {DEFAULT_BASELINE})')
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help='Compare with a stored baseline; exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slow-down that counts as a regression (0.10 = 10%%)')
+    parser.add_argument('--log-level', default='WARNING', help='Root log level while measuring')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--list', action='store_true', help='List case names and exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    cases = [(name, make) for name, make in all_cases(args.quick) if not args.filter or args.filter in name]
+    if args.list:
+        print('\n'.join(name for name, _ in cases))
+        return 0
+
+    from log_setup import configure_logging
+    configure_logging(args.log_level)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    for name, make in cases:
+        fn = make()
+        results[name] = measure(fn, args.repeat, args.min_time, quiet_stdout=name.startswith('cache.'))
+        del fn
+        sys.stderr.write(f"✅ {name}: {_format_seconds(results[name]['median_s'])} per call "
+                         f"({results[name]['loops']} loops x {results[name]['runs']})\n")
+
+    report = {
+        'benchmark': 'micro',
+        'timestamp': datetime.now().isoformat(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'list')},
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+    regressions = []
+    if baseline is not None:
+        report['comparison'] = compare(results, baseline, args.threshold)
+        for name, entry in report['comparison'].items():
+            if entry['verdict'] in ('regression', 'improvement'):
+                icon = '❌' if entry['verdict'] == 'regression' else '✅'
+                sys.stderr.write(f"{icon} {entry['verdict']}: {name} {_format_seconds(entry['baseline_s'])} -> "
+                                 f"{_format_seconds(entry['current_s'])} (x{entry['ratio']})\n")
+        regressions = [name for name, entry in report['comparison'].items() if entry['verdict'] == 'regression']
+        if not regressions:
+            sys.stderr.write(f"✅ No regressions beyond {args.threshold:.0%}\n")
+
+    text = json.dumps(report, indent=2)
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        sys.stderr.write(f"✅ Baseline saved to {args.save}\n")
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    elif not args.save:
+        print(text)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+replay.py - re-run captured /analyze scans offline against the current code
+
+Reads a CAPTURE_FILE (see capture.py), serves each scan's recorded upstreams
+locally - image bytes (or a stand-in when only the digest was captured) with the
+recorded status and download time, Gemini replies with the recorded text and
+latency - rewrites the payload's image URLs to the local server and runs the
+scan through the pipeline in this process. The report puts recorded and
+replayed stage timings and risk scores side by side.
+
+Cross-listing state (perceptual-hash / CLIP indexes) starts empty, so the image
+reuse stages can differ from production; everything else sees the same inputs.
+Capture with CAPTURE_IMAGE_BYTES=1 for an exact replay of the image stages.
+
+Usage (from backend/):
+    python -m benchmarks.replay data/captures.ndjson.gz --list
+    python -m benchmarks.replay data/captures.ndjson.gz --id 3f2a... --profile slow.stacks
+    python -m benchmarks.replay data/captures.ndjson.gz --last 20 --no-latency --server async
+
+--profile writes collapsed stacks (flamegraph.pl / speedscope) from the sampling
+profiler, covering the request thread and the stage pool.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import base64
+import asyncio
+import argparse
+import threading
+from types import SimpleNamespace
+from typing import Dict, List
+
+from benchmarks.fakes import ImageServer, install_fake_gemini
+
+
+class RecordedImageServer(ImageServer):
+    """Serves recorded image downloads: same status, bytes (or stand-in) and timing"""
+
+    def __init__(self, latency: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.entries = {}
+        self.exact = 0
+        self.stand_ins = 0
+        self._served = {}
+
+    def add(self, url: str, entry: Dict) -> str:
+        """Register a recorded download; returns the local URL to use instead"""
+        key = f'c{len(self.entries)}'
+        self.entries[key] = entry
+        if 'data_b64' in entry:
+            self.exact += 1
+        elif 'sha256' in entry:
+            self.stand_ins += 1
+        return self.url(key)
+
+    def _respond(self, key, query):
+        entry = self.entries.get(key)
+        if entry is None:
+            return 404, b'', 0.0
+        with self._lock:
+            n = self._served[key] = self._served.get(key, -1) + 1
+        fetches = entry.get('fetches') or [{'duration_ms': 0}]
+        delay = fetches[min(n, len(fetches) - 1)]['duration_ms'] / 1000 if self.latency else 0.0
+
+        if 'data_b64' in entry:
+            body = base64.b64decode(entry['data_b64'])
+        elif 'sha256' in entry:
+            body = self._image(entry['sha256'], self.size)
+        else:
+            # The download itself failed (timeout, connection error)
+            return 502, b'', delay
+        return entry.get('status') or 200, body, delay
+
+
+class RecordedGeminiModel:
+    """Answers with the recorded Gemini replies, in order, after the recorded latency"""
+
+    def __init__(self, calls: List[Dict], latency: bool = True):
+        self.calls = calls
+        self.latency = latency
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            call = self.calls[min(self.served, len(self.calls) - 1)] if self.calls else \
+                {'text': '{}', 'duration_ms': 0, 'error': None}
+            self.served += 1
+        return call, (call['duration_ms'] / 1000 if self.latency else 0.0)
+
+    def _reply(self, call):
+        if call.get('error'):
+            raise RuntimeError(call['error'])
+        return SimpleNamespace(text=call['text'])
+
+    def generate_content(self, contents, **kwargs):
+        call, delay = self._next()
+        time.sleep(delay)
+        return self._reply(call)
+
+    async def generate_content_async(self, contents, **kwargs):
+        call, delay = self._next()
+        await asyncio.sleep(delay)
+        return self._reply(call)
+
+
+def rewrite_urls(value, mapping: Dict[str, str]):
+    """Copy of the payload with every recorded image URL replaced by its local URL"""
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, list):
+        return [rewrite_urls(v, mapping) for v in value]
+    if isinstance(value, dict):
+        return {k: rewrite_urls(v, mapping) for k, v in value.items()}
+    return value
+
+
+def _stage_durations(stages: Dict) -> Dict:
+    return {name: {'status': info.get('status'), 'duration_ms': info.get('duration_ms')}
+            for name, info in (stages or {}).items()}
+
+
+def replay_one(pipeline, record: Dict, args) -> Dict:
+    """Serve one capture's upstreams, run it `args.repeat` times, compare with the recording"""
+    upstreams = record.get('upstreams') or {}
+    with RecordedImageServer(latency=not args.no_latency) as cdn:
+        mapping = {url: cdn.add(url, entry) for url, entry in (upstreams.get('images') or {}).items()}
+        payload = rewrite_urls(copy.deepcopy(record['payload']), mapping)
+        payload.pop('force_refresh', None)
+
+        runs = []
+        for _ in range(args.repeat):
+            gemini = RecordedGeminiModel(upstreams.get('gemini') or [], latency=not args.no_latency)
+            install_fake_gemini(pipeline, gemini, model_name='recorded-gemini')
+            started = time.perf_counter()
+            if args.server == 'async':
+                response = asyncio.run(_arun(pipeline, payload, args.timing))
+            else:
+                response = pipeline.run(payload, debug_timing=args.timing)
+            run = {
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                'stages': _stage_durations(response.get('stages')),
+                'risk': {k: response['risk'].get(k) for k in ('score', 'level')},
+                'partial': response.get('partial', False),
+                'gemini_calls': gemini.served,
+            }
+            if args.timing:
+                run['timing'] = response['receipt'].get('timing')
+            runs.append(run)
+
+        return {
+            'capture_id': record.get('capture_id'),
+            'url': record.get('url'),
+            'captured_at': record.get('timestamp'),
+            'upstreams': {'images': len(mapping), 'exact_images': cdn.exact, 'stand_in_images': cdn.stand_ins,
+                          'gemini_calls': len(upstreams.get('gemini') or [])},
+            'recorded': {
+                'duration_ms': record.get('duration_ms'),
+                'stages': _stage_durations(record.get('stages')),
+                'risk': record.get('risk'),
+                'partial': record.get('partial', False),
+            },
+            'replayed': runs,
+            'risk_matches': all(run['risk'] == record.get('risk') for run in runs),
+        }
+
+
+async def _arun(pipeline, payload, debug_timing):
+    import httpx
+    async with httpx.AsyncClient(timeout=30) as client:
+        return await pipeline.arun(payload, http_client=client, debug_timing=debug_timing)
+
+
+def select(records: List[Dict], args) -> List[Dict]:
+    if args.id:
+        records = [r for r in records if r.get('capture_id', '').startswith(args.id)]
+    if args.match:
+        records = [r for r in records if args.match in (r.get('url') or '')]
+    if args.last:
+        records = records[-args.last:]
+    return records
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Replay captured /analyze scans offline')
+    parser.add_argument('capture_file', help='CAPTURE_FILE written by the backend (.ndjson or .ndjson.gz)')
+    parser.add_argument('--list', action='store_true', help='List the captured scans and exit')
+    parser.add_argument('--id', help='Replay the capture whose id starts with this')
+    parser.add_argument('--match', help='Only captures whose listing URL contains this')
+    parser.add_argument('--last', type=int, help='Only the last N captures')
+    parser.add_argument('--server', choices=['sync', 'async'], default='sync',
+                        help='AnalysisPipeline.run (app.py) or .arun (app_async.py)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per capture')
+    parser.add_argument('--no-latency', action='store_true', help='Serve upstreams instantly (CPU time only)')
+    parser.add_argument('--timing', action='store_true', help='Include the debug_timing span tree of each run')
+    parser.add_argument('--profile', metavar='PATH', help='Write collapsed stacks of the replay here')
+    parser.add_argument('--interval', type=float, default=0.005, help='Profiler sampling interval (s)')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from capture import read_captures
+
+    records = select(list(read_captures(args.capture_file)), args)
+    if args.list:
+        for r in records:
+            stages = r.get('stages') or {}
+            slowest = max(stages.items(), key=lambda kv: kv[1].get('duration_ms') or 0, default=(None, {}))
+            print(f"{r.get('capture_id')}  {r.get('timestamp')}  {r.get('duration_ms')}ms  "
+                  f"slowest={slowest[0]}  {r.get('url')}")
+        return 0
+    if not records:
+        sys.stderr.write("❌ No captures match\n")
+        return 1
+
+    from benchmarks.e2e import OFFLINE_ENV
+    os.environ.update(OFFLINE_ENV)
+    os.environ['LOG_LEVEL'] = args.log_level
+    from app import pipeline
+    from profiler import PROFILER
+
+    if args.profile:
+        PROFILER.install()
+        PROFILER.enter()
+        PROFILER.start(seconds=24 * 3600, interval=args.interval)
+
+    results = []
+    try:
+        for record in records:
+            result = replay_one(pipeline, record, args)
+            results.append(result)
+            replayed = result['replayed'][-1]
+            sys.stderr.write(
+                f"✅ {result['capture_id'][:12]} recorded {result['recorded']['duration_ms']}ms -> "
+                f"replayed {replayed['duration_ms']}ms, risk {result['recorded']['risk']} -> {replayed['risk']}\n"
+            )
+    finally:
+        if args.profile:
+            PROFILER.stop()
+            os.makedirs(os.path.dirname(args.profile) or '.', exist_ok=True)
+            with open(args.profile, 'w', encoding='utf-8') as f:
+                f.write(PROFILER.collapsed())
+            sys.stderr.write(f"✅ {PROFILER.samples} samples written to {args.profile}\n")
+
+    text = json.dumps({'benchmark': 'replay', 'capture_file': args.capture_file, 'server': args.server,
+                       'latency': not args.no_latency, 'results': results}, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
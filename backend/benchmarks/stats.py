@@ -0,0 +1,37 @@
+"""
+stats.py - latency summaries shared by the benchmark scripts
+"""
+
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Linear-interpolated percentile
+
+    Args:
+        sorted_values: Samples in ascending order (not empty)
+        q: 0..1
+    """
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = q * (len(sorted_values) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize(values_ms: List[float]) -> Dict:
+    """{'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'min_ms', 'max_ms'} of millisecond samples"""
+    if not values_ms:
+        return {'count': 0}
+    values = sorted(values_ms)
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 2),
+        'p50_ms': round(percentile(values, 0.50), 2),
+        'p95_ms': round(percentile(values, 0.95), 2),
+        'p99_ms': round(percentile(values, 0.99), 2),
+        'min_ms': round(values[0], 2),
+        'max_ms': round(values[-1], 2),
+    }
@@ -0,0 +1,509 @@
+"""
+calibrate_risk.py - tune the risk rules and CLIP score bounds against labeled listings
+
+Two steps, so the analyzers run once however many settings are tried:
+
+  extract   scans a JSONL of labeled /analyze payloads (a "label" field per line:
+            scam / legit, 1 / 0, true / false) with the batch scorer and caches, per
+            listing, the risk features (ListingRiskCalculator.risk_features) and the
+            CLIP cosine similarity of every review photo / listing image pair the
+            image-similarity stage compared. Checkpointed like batch_score.py.
+
+  sweep     loads the cache and scores every combination of the given parameters
+            with calculate_risk_batch(): risk rule values (paths into the rule file)
+            and clip/lo, clip/hi (CLIP_SCORE_BOUNDS - the cached cosines are rescored
+            the way analyze_review_photos does). Reports ROC / PR curves, AUCs, the
+            best F1 cutoff and confusion matrices at the risk level edges, for the
+            current settings and the best combinations.
+
+Parameter paths are '/'-separated keys and list indexes into risk_rules.json:
+    rules/seller.age_months/below/0/threshold    rules/review_photos.clip/tiers/2/points
+    levels/2/below                               clip/lo   clip/hi
+
+Usage (from backend/):
+    python calibrate_risk.py extract labeled.jsonl.gz -o stages.jsonl --processes 4
+    python calibrate_risk.py sweep stages.jsonl --param clip/lo=0.15,0.2,0.25 \\
+        --param rules/seller.age_months/below/0/threshold=3,6,9 --metric pr_auc
+    python calibrate_risk.py sweep stages.jsonl --grid grid.json --write-rules tuned_rules.json
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+import itertools
+from datetime import datetime
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batch_score import (read_windows, map_windows, worker_scanner, JsonlOutput,
+                         load_checkpoint, save_checkpoint)
+
+logger = logging.getLogger(__name__)
+
+SCAM_LABELS = {'scam', 'fraud', 'fake', '1', 'true', 'yes'}
+LEGIT_LABELS = {'legit', 'legitimate', 'genuine', '0', 'false', 'no'}
+
+# analyze_review_photos(): up to 3 review photos, each against up to 3 listing images
+CLIP_REVIEWS, CLIP_LISTINGS = 3, 3
+CLIP_HIGH_MATCH = 70
+
+METRICS = ('roc_auc', 'pr_auc', 'best_f1')
+
+
+def parse_label(value) -> Optional[int]:
+    """1 = scam, 0 = legit, None = unlabeled / unknown"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in SCAM_LABELS:
+            return 1
+        if text in LEGIT_LABELS:
+            return 0
+    return None
+
+
+# ---------------------------------------------------------------------
+# extract: run the analyzers once, cache what the risk score is built from
+# ---------------------------------------------------------------------
+def _cosines(pipeline, payload: Dict) -> List[List[Optional[float]]]:
+    """
+    Cosine similarity per (review photo, listing image) pair the image-similarity
+    stage compared - None where compare_images() failed (scored 0)
+    """
+    clip = pipeline.analyzer('image_similarity')
+    parsed = pipeline.stage('parse_input').run({'data': payload})
+    listing_images = parsed['images'][:CLIP_LISTINGS]
+
+    matrix = []
+    for review_image in parsed['review_images'][:CLIP_REVIEWS]:
+        row = []
+        for listing_image in listing_images:
+            try:
+                emb1, emb2 = clip.embed_image(listing_image), clip.embed_image(review_image)
+                row.append(None if emb1 is None or emb2 is None else clip.cosine_similarity(emb1, emb2))
+            except Exception:
+                row.append(None)
+        matrix.append(row)
+    return matrix
+
+
+def _extract_window(lines: List[Tuple[int, str]], label_field: str) -> List[Dict]:
+    """Cache rows for one window of (line number, raw JSON); unusable lines get an error row"""
+    from analysis_pipeline import RiskStage
+
+    scanner = worker_scanner()
+    pipeline = scanner.pipeline
+    calculator = pipeline.analyzer('risk_calculator')
+
+    rows = [None] * len(lines)
+    payloads, labels, slots = [], [], []
+    for i, (line_no, raw) in enumerate(lines):
+        try:
+            payload = json.loads(raw)
+        except ValueError as e:
+            rows[i] = {'line': line_no, 'error': f'Invalid JSON: {e}'}
+            continue
+        label = parse_label(payload.pop(label_field, None)) if isinstance(payload, dict) else None
+        if label is None:
+            rows[i] = {'line': line_no, 'error': f'No usable "{label_field}"'}
+            continue
+        payloads.append(payload)
+        labels.append(label)
+        slots.append(i)
+
+    if payloads:
+        responses = scanner.run(payloads)['results']
+        scanned = [(i, p, l, r) for i, p, l, r in zip(slots, payloads, labels, responses) if r.get('success')]
+        for i, payload, label, response in zip(slots, payloads, labels, responses):
+            if not response.get('success'):
+                rows[i] = {'line': lines[i][0], 'error': response.get('error', 'scan failed')}
+
+        # The risk stage's inputs: the listing plus each stage result
+        risk_inputs = [{
+            'data': payload.get('data') if isinstance(payload.get('data'), dict) else {},
+            'results': {key: response['results'].get(key) for key in RiskStage.optional_inputs},
+        } for _, payload, _, response in scanned]
+        features = calculator.risk_features(risk_inputs) if scanned else {}
+
+        for n, (i, payload, label, response) in enumerate(scanned):
+            row = {
+                'line': lines[i][0],
+                'url': payload.get('url'),
+                'label': label,
+                'risk_score': response['risk'].get('score'),
+                'features': {name: (None if np.isnan(values[n]) else float(values[n]))
+                             if values.dtype.kind == 'f' else bool(values[n])
+                             for name, values in features.items()},
+            }
+            if (response['results'].get('image_similarity') or {}).get('analyzed'):
+                row['clip_cosines'] = _cosines(pipeline, payload)
+            rows[i] = row
+
+    pipeline.flush()
+    return rows
+
+
+def extract(args) -> int:
+    checkpoint_path = args.checkpoint or args.output + '.checkpoint.json'
+    state = load_checkpoint(checkpoint_path)
+    if state and not args.resume:
+        sys.stderr.write(f"❌ {checkpoint_path} exists - pass --resume to continue or delete it to start over\n")
+        return 1
+    if args.resume and not state:
+        logger.warning(f"⚠️ No checkpoint at {checkpoint_path} - starting from the first line")
+
+    processes = max(args.processes, 0)
+    pool_size = max(processes, 1)
+    worker_args = (args.variant, max(1, args.gemini_concurrency // pool_size), args.deadline, processes > 1,
+                   max(1, (os.cpu_count() or 1) // pool_size) if processes > 1 else 0)
+
+    output = JsonlOutput(args.output, state)
+    lines_done = state['lines_done'] if state else 0
+    totals = dict(state['totals']) if state else {'listings': 0, 'scam': 0, 'errors': 0}
+    started = time.monotonic()
+    windows = read_windows(args.input, args.window, skip_lines=lines_done, stop_line=args.limit)
+
+    try:
+        for last_line, rows in map_windows(windows, partial(_extract_window, label_field=args.label_field),
+                                           worker_args, processes):
+            output.write(rows)
+            lines_done = last_line
+            for row in rows:
+                if 'error' in row:
+                    totals['errors'] += 1
+                else:
+                    totals['listings'] += 1
+                    totals['scam'] += row['label']
+            save_checkpoint(checkpoint_path, {'input': args.input, 'output': args.output, 'lines_done': lines_done,
+                                              'totals': totals, 'updated_at': datetime.now().isoformat(),
+                                              **output.state()})
+            sys.stderr.write(f"✅ line {lines_done}: {totals['listings']} listings cached "
+                             f"({totals['scam']} scam), {totals['errors']} skipped\n")
+    except KeyboardInterrupt:
+        sys.stderr.write(f"⚠️ Interrupted - rerun with --resume to continue after line {lines_done}\n")
+        return 130
+    finally:
+        output.close()
+
+    print(json.dumps({'input': args.input, 'output': args.output, 'lines_done': lines_done, **totals,
+                      'seconds': round(time.monotonic() - started, 1)}, indent=2))
+    return 0
+
+
+# ---------------------------------------------------------------------
+# sweep: re-score the cache under many settings
+# ---------------------------------------------------------------------
+def load_stages(path: str) -> Dict:
+    """The extract cache as arrays: feature columns, labels, CLIP cosines (NaN = no score)"""
+    import gzip
+    from risk_rules import RISK_FEATURES
+
+    opener = gzip.open if path.endswith('.gz') else open
+    rows = []
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for raw in f:
+            if raw.strip():
+                row = json.loads(raw)
+                if 'error' not in row:
+                    rows.append(row)
+    if not rows:
+        raise SystemExit(f"❌ No cached listings in {path}")
+
+    names = list(rows[0]['features'])
+    features = {}
+    for name in names:
+        values = [row['features'].get(name) for row in rows]
+        is_flag = name.endswith('_error') or isinstance(RISK_FEATURES.get(name), bool)
+        features[name] = np.array(values, dtype=bool if is_flag else float)
+
+    cosines = np.full((len(rows), CLIP_REVIEWS, CLIP_LISTINGS), np.nan)
+    compared = np.zeros(len(rows), dtype=int)
+    for n, row in enumerate(rows):
+        matrix = row.get('clip_cosines') or []
+        compared[n] = len(matrix)
+        for r, values in enumerate(matrix):
+            cosines[n, r, :len(values)] = [np.nan if v is None else v for v in values]
+
+    return {
+        'features': features,
+        'labels': np.array([row['label'] for row in rows], dtype=int),
+        'recorded_scores': np.array([row.get('risk_score') for row in rows], dtype=float),
+        'cosines': cosines,
+        'compared': compared,
+    }
+
+
+def _round1(values: np.ndarray) -> np.ndarray:
+    """round(v, 1) element-wise - Python's rounding, which np.round differs from on halves"""
+    return np.frompyfunc(lambda v: round(v, 1), 1, 1)(values).astype(float)
+
+
+def clip_columns(cosines: np.ndarray, compared: np.ndarray, lo: float, hi: float) -> Dict[str, np.ndarray]:
+    """
+    clip_avg_match / clip_verified as analyze_review_photos() reports them for other
+    score bounds: best match per review photo, averaged, verified on high matches
+    """
+    scores = _round1((np.clip(cosines, lo, hi) - lo) / (hi - lo) * 100.0)
+    best = np.nan_to_num(scores, nan=0.0).max(axis=2)
+    counted = np.arange(CLIP_REVIEWS)[None, :] < compared[:, None]
+    best = np.where(counted, best, 0.0)
+
+    average = best.sum(axis=1) / np.maximum(compared, 1)
+    high = (counted & (best >= CLIP_HIGH_MATCH)).sum(axis=1)
+    return {
+        'clip_avg_match': _round1(average),
+        'clip_verified': ((high >= 1) & (average >= 60)) | (high >= 2),
+    }
+
+
+def parse_params(items: List[str], grid_file: Optional[str]) -> Dict[str, list]:
+    """{path: [values]} from --grid (JSON object) and --param path=v1,v2,..."""
+    grid = {}
+    if grid_file:
+        with open(grid_file, encoding='utf-8') as f:
+            grid.update(json.load(f))
+    for item in items or []:
+        path, _, values = item.partition('=')
+        if not values:
+            raise SystemExit(f"❌ --param needs path=value[,value...]: {item}")
+        grid[path.strip()] = [json.loads(v) for v in values.split(',')]
+    for path, values in grid.items():
+        if not isinstance(values, list) or not values:
+            raise SystemExit(f"❌ {path}: needs a non-empty list of values")
+    return grid
+
+
+def set_path(raw: Dict, path: str, value):
+    """Set a '/'-separated path (keys and list indexes) in the raw rule file"""
+    *parents, last = path.split('/')
+    node = raw
+    try:
+        for key in parents:
+            node = node[int(key)] if isinstance(node, list) else node[key]
+        if isinstance(node, list):
+            node[int(last)] = value
+        elif last in node:
+            node[last] = value
+        else:
+            raise KeyError(last)
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise SystemExit(f"❌ {path} is not a value in the rule file")
+
+
+def curves(scores: np.ndarray, labels: np.ndarray) -> Dict:
+    """ROC and precision/recall at every distinct score (flagged = score >= cutoff)"""
+    order = np.argsort(-scores, kind='mergesort')
+    scores, labels = scores[order], labels[order]
+    # Last index of each run of equal scores
+    ends = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tp = np.cumsum(labels)[ends]
+    fp = (ends + 1) - tp
+    positives, negatives = labels.sum(), len(labels) - labels.sum()
+
+    tpr = np.r_[0.0, tp / positives]
+    fpr = np.r_[0.0, fp / negatives]
+    precision = tp / (tp + fp)
+    recall = tp / positives
+    f1 = np.where(precision + recall > 0, 2 * precision * recall / np.maximum(precision + recall, 1e-12), 0.0)
+    best = int(np.argmax(f1))
+    return {
+        'cutoffs': scores[ends],
+        'tpr': tpr, 'fpr': fpr, 'precision': precision, 'recall': recall,
+        'roc_auc': float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)),
+        'pr_auc': float(np.sum(np.diff(np.r_[0.0, recall]) * precision)),  # average precision
+        'best_f1': float(f1[best]),
+        'best_f1_cutoff': float(scores[ends][best]),
+    }
+
+
+def confusion(scores: np.ndarray, labels: np.ndarray, cutoff: float) -> Dict:
+    flagged = scores >= cutoff
+    tp = int((flagged & (labels == 1)).sum())
+    fp = int((flagged & (labels == 0)).sum())
+    fn = int((~flagged & (labels == 1)).sum())
+    tn = int((~flagged & (labels == 0)).sum())
+    return {'cutoff': cutoff, 'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+            'precision': round(tp / (tp + fp), 4) if tp + fp else None,
+            'recall': round(tp / (tp + fn), 4) if tp + fn else None}
+
+
+def evaluate(scores: np.ndarray, labels: np.ndarray, rules, full: bool = False) -> Dict:
+    """Metrics of one setting (full: with the curves and confusion matrices per level edge)"""
+    c = curves(scores, labels)
+    result = {name: round(c[name], 4) for name in METRICS}
+    result['best_f1_cutoff'] = c['best_f1_cutoff']
+    if full:
+        result['confusion'] = {f'>= {rules.levels[i + 1]}': confusion(scores, labels, edge)
+                               for i, edge in enumerate(rules.level_edges)}
+        result['confusion']['best_f1'] = confusion(scores, labels, c['best_f1_cutoff'])
+        result['roc'] = [[round(float(x), 4), round(float(y), 4)] for x, y in zip(c['fpr'], c['tpr'])]
+        result['pr'] = [[round(float(r), 4), round(float(p), 4), float(t)]
+                        for r, p, t in zip(c['recall'], c['precision'], c['cutoffs'])]
+    return result
+
+
+def sweep(args) -> int:
+    from risk_rules import RiskRules, RiskRulesError, DEFAULT_RULES_FILE
+    from listing_risk_calculator import ListingRiskCalculator
+
+    rules_path = args.rules or os.getenv('RISK_RULES_FILE') or DEFAULT_RULES_FILE
+    with open(rules_path, encoding='utf-8') as f:
+        base_raw = json.load(f)
+    base_rules = RiskRules(base_raw, source=rules_path)
+    bounds = tuple(float(v) for v in (args.clip_bounds or os.getenv('CLIP_SCORE_BOUNDS', '0.20,0.80')).split(','))
+
+    grid = parse_params(args.param, args.grid)
+    paths = list(grid)
+    total = int(np.prod([len(grid[p]) for p in paths])) if paths else 1
+    if total > args.max_combinations:
+        sys.stderr.write(f"❌ {total} combinations (over --max-combinations {args.max_combinations})\n")
+        return 1
+
+    data = load_stages(args.stages)
+    labels = data['labels']
+    if labels.min() == labels.max():
+        sys.stderr.write("❌ Need both scam and legit listings to calibrate\n")
+        return 1
+    calculator = ListingRiskCalculator(rules=base_rules)
+    clip_cache = {}
+
+    def columns_for(lo, hi):
+        if (lo, hi) not in clip_cache:
+            clip_cache[(lo, hi)] = dict(data['features'], **clip_columns(data['cosines'], data['compared'], lo, hi))
+        return clip_cache[(lo, hi)]
+
+    started = time.monotonic()
+    baseline_scores = calculator.calculate_risk_batch(columns_for(*bounds))['score']
+    recorded = data['recorded_scores']
+    reproduced = int(np.sum(np.isclose(baseline_scores, recorded)))
+    if reproduced < len(recorded):
+        logger.warning(f"⚠️ Current settings reproduce {reproduced}/{len(recorded)} recorded risk scores "
+                       f"(rules or CLIP bounds changed since extract?)")
+    baseline = evaluate(baseline_scores, labels, base_rules, full=True)
+
+    def build(params):
+        """(compiled rules, raw rule file, clip lo, clip hi) for one combination"""
+        raw = copy.deepcopy(base_raw)
+        lo, hi = bounds
+        for path, value in params.items():
+            if path == 'clip/lo':
+                lo = value
+            elif path == 'clip/hi':
+                hi = value
+            else:
+                set_path(raw, path, value)
+        if not lo < hi:
+            raise RiskRulesError("clip/lo must be below clip/hi")
+        return RiskRules(raw), raw, lo, hi
+
+    def score(rules, lo, hi):
+        return calculator.calculate_risk_batch(columns_for(lo, hi), rules=rules)['score']
+
+    # Only the metric is kept per combination - the top ones are re-scored for the report
+    results, invalid = [], 0
+    for values in itertools.product(*(grid[p] for p in paths)):
+        params = dict(zip(paths, values))
+        try:
+            rules, _, lo, hi = build(params)
+        except RiskRulesError as e:
+            invalid += 1
+            logger.debug(f"Skipping {params}: {e}")
+            continue
+        results.append((evaluate(score(rules, lo, hi), labels, rules)[args.metric], params))
+
+    results.sort(key=lambda r: r[0], reverse=True)
+    seconds = time.monotonic() - started
+    sys.stderr.write(f"✅ {len(results)} combinations scored over {len(labels)} listings in {seconds:.1f}s "
+                     f"({invalid} invalid); baseline {args.metric} {baseline[args.metric]}\n")
+
+    top = []
+    for _, params in results[:args.top]:
+        rules, _, lo, hi = build(params)
+        top.append({'params': params, **evaluate(score(rules, lo, hi), labels, rules)})
+    best = None
+    if results:
+        params = results[0][1]
+        rules, raw, lo, hi = build(params)
+        best = {'params': params, 'clip_bounds': [lo, hi], **evaluate(score(rules, lo, hi), labels, rules, full=True)}
+        sys.stderr.write(f"✅ best {args.metric} {best[args.metric]}: {params}\n")
+        if args.write_rules:
+            raw['version'] = f"{base_raw.get('version', 'unversioned')}+calibrated"
+            with open(args.write_rules, 'w', encoding='utf-8') as f:
+                json.dump(raw, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            sys.stderr.write(f"✅ Rules written to {args.write_rules} (CLIP_SCORE_BOUNDS={lo},{hi})\n")
+
+    report = {
+        'stages': args.stages, 'rules': rules_path, 'clip_bounds': list(bounds),
+        'listings': int(len(labels)), 'scam': int(labels.sum()), 'legit': int(len(labels) - labels.sum()),
+        'recorded_scores_reproduced': reproduced,
+        'combinations': len(results), 'invalid': invalid, 'metric': args.metric,
+        'seconds': round(seconds, 1),
+        'baseline': baseline, 'best': best, 'top': top,
+    }
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Calibrate risk thresholds against labeled listings')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ex = commands.add_parser('extract', help='Scan labeled listings once and cache their stage outputs')
+    ex.add_argument('input', help='JSONL of /analyze payloads with a label field (.gz ok)')
+    ex.add_argument('-o', '--output', required=True, help='Cache file (.jsonl)')
+    ex.add_argument('--label-field', default='label', help='Payload key holding scam / legit')
+    ex.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint.json)')
+    ex.add_argument('--resume', action='store_true', help='Continue from the checkpoint')
+    ex.add_argument('--variant', choices=['full', 'cache', 'caching'], default='full')
+    ex.add_argument('--processes', type=int, default=0, help='Worker processes (0 = this process)')
+    ex.add_argument('--window', type=int, default=20,
+                    help='Listings per task (small enough that their images stay in the CLIP embedding cache)')
+    ex.add_argument('--gemini-concurrency', type=int, default=int(os.getenv('BATCH_GEMINI_WORKERS', 4)))
+    ex.add_argument('--deadline', type=float, default=0, help='Per-listing scan deadline (0 = none)')
+    ex.add_argument('--limit', type=int, help='Stop after this many input lines')
+
+    sw = commands.add_parser('sweep', help='Score the cache under every parameter combination')
+    sw.add_argument('stages', help='Cache written by extract')
+    sw.add_argument('--param', action='append', metavar='PATH=V1,V2,...', help='Values to try for one parameter')
+    sw.add_argument('--grid', help='JSON object {path: [values]} (combined with --param)')
+    sw.add_argument('--rules', help='Base rule file (default: RISK_RULES_FILE / risk_rules.json)')
+    sw.add_argument('--clip-bounds', help='Base CLIP score bounds "lo,hi" (default: CLIP_SCORE_BOUNDS)')
+    sw.add_argument('--metric', choices=METRICS, default='roc_auc', help='What "best" means')
+    sw.add_argument('--top', type=int, default=20, help='Combinations listed in the report')
+    sw.add_argument('--max-combinations', type=int, default=100000)
+    sw.add_argument('--write-rules', metavar='PATH', help='Write the rule file of the best combination here')
+    sw.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    for sub in (ex, sw):
+        sub.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ['LOG_LEVEL'] = args.log_level
+    from log_setup import configure_logging
+    configure_logging(args.log_level)
+    return extract(args) if args.command == 'extract' else sweep(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
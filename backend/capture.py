@@ -0,0 +1,157 @@
+"""
+capture.py - opt-in recording of /analyze scans for offline replay
+
+A captured scan stores the payload as received, the stage timings of the
+response, and what the upstreams answered: every image download (status,
+size, sha256, how long it took - and the bytes themselves with
+CAPTURE_IMAGE_BYTES=1) and every Gemini reply (text, latency). The replayer
+(python -m benchmarks.replay) serves those back locally, so a slow production
+scan can be re-run and profiled on a laptop.
+
+    CAPTURE_FILE=data/captures.ndjson.gz   gzip NDJSON, one scan per line (empty = off, the default)
+    CAPTURE_SAMPLE=1.0                     share of scans recorded
+    CAPTURE_IMAGE_BYTES=0                  1: store image bytes (base64) - needed for an exact replay
+
+Like tracing.py, the recording follows the request through a ContextVar, so
+upstream calls record into it from pool threads and asyncio tasks alike;
+outside a captured scan record_image() / record_gemini() do nothing.
+
+Each scan is appended as its own gzip member with a single write() on an
+O_APPEND file, so several gunicorn workers can share one file.
+"""
+
+import os
+import json
+import gzip
+import time
+import uuid
+import base64
+import random
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FILE = os.getenv('CAPTURE_FILE', '')
+CAPTURE_SAMPLE = float(os.getenv('CAPTURE_SAMPLE', 1.0))
+CAPTURE_IMAGE_BYTES = os.getenv('CAPTURE_IMAGE_BYTES', '0').lower() in ('1', 'true', 'yes')
+
+_current = ContextVar('capture_recording', default=None)
+_file_lock = threading.Lock()
+
+
+class Recording:
+    """Upstream traffic of one scan; filled from several threads"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now().isoformat()
+        self.images = {}  # url -> {'status', 'bytes', 'sha256', 'fetches': [...], 'data_b64'?}
+        self.gemini = []
+        self.lock = threading.Lock()
+
+    def add_image(self, url, content, status, seconds, source, error=None):
+        fetch = {'source': source, 'duration_ms': round(seconds * 1000, 1)}
+        with self.lock:
+            entry = self.images.get(url)
+            if entry is None:
+                entry = self.images[url] = {'status': status, 'error': error, 'fetches': []}
+                if content is not None:
+                    entry['bytes'] = len(content)
+                    entry['sha256'] = hashlib.sha256(content).hexdigest()
+                    if CAPTURE_IMAGE_BYTES:
+                        entry['data_b64'] = base64.b64encode(content).decode('ascii')
+            entry['fetches'].append(fetch)
+
+    def add_gemini(self, text, seconds, mode, error=None):
+        with self.lock:
+            self.gemini.append({'mode': mode, 'text': text, 'error': error, 'duration_ms': round(seconds * 1000, 1)})
+
+    def to_record(self, data: Dict, response: Dict) -> Dict:
+        with self.lock:
+            images, gemini = dict(self.images), list(self.gemini)
+        return {
+            'capture_id': self.id,
+            'timestamp': self.timestamp,
+            'url': data.get('url'),
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'payload': data,
+            'stages': response.get('stages', {}),
+            'partial': response.get('partial', False),
+            'from_cache': response.get('from_cache', False),
+            'risk': {k: (response.get('risk') or {}).get(k) for k in ('score', 'level')},
+            'upstreams': {'images': images, 'gemini': gemini},
+        }
+
+
+@contextmanager
+def start_capture(enabled: Optional[bool] = None):
+    """
+    Record the scan run inside the block
+
+    Args:
+        enabled: Force on / off (default: CAPTURE_FILE is set and the scan is sampled)
+
+    Yields:
+        Recording, or None when this scan is not captured
+    """
+    if enabled is None:
+        enabled = bool(CAPTURE_FILE) and random.random() < CAPTURE_SAMPLE
+    if not enabled:
+        yield None
+        return
+    recording = Recording()
+    token = _current.set(recording)
+    try:
+        yield recording
+    finally:
+        _current.reset(token)
+
+
+def record_image(url: str, content: Optional[bytes], status, seconds: float, source: str, error: str = None):
+    """An image download of the current scan (content None when it failed)"""
+    recording = _current.get()
+    if recording is not None:
+        recording.add_image(url, content, status, seconds, source, error)
+
+
+def record_gemini(text: Optional[str], seconds: float, mode: str, error: str = None):
+    """A Gemini reply of the current scan (text None when the call raised)"""
+    recording = _current.get()
+    if recording is not None:
+        recording.add_gemini(text, seconds, mode, error)
+
+
+def save(recording: Optional[Recording], data: Dict, response: Dict, path: str = None):
+    """Append the scan to CAPTURE_FILE (no-op for an uncaptured scan)"""
+    if recording is None:
+        return
+    path = path or CAPTURE_FILE
+    try:
+        line = json.dumps(recording.to_record(data, response), default=str, ensure_ascii=False) + '\n'
+        member = gzip.compress(line.encode('utf-8'))
+        with _file_lock:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, member)
+            finally:
+                os.close(fd)
+        logger.info(f"📼 Captured scan {recording.id} ({len(recording.images)} images, {len(recording.gemini)} Gemini calls)")
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"⚠️ Could not write capture to {path}: {e}")
+
+
+def read_captures(path: str) -> Iterator[Dict]:
+    """Captured scans from a CAPTURE_FILE, oldest first"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,73 @@
+"""
+gunicorn.conf.py - production settings for the Flask app
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python serve.py               (same settings, falls back to waitress on Windows)
+
+preload_app loads app.py - and with it the CLIP ViT-B-32 weights and the image
+indexes - once in the master process. Workers are forked afterwards and share
+those memory pages copy-on-write instead of each loading its own model copy.
+
+Note: the perceptual-hash and CLIP indexes are per-process after the fork. Every
+worker appends to the hash NDJSON file, but only sees other workers' images after
+a restart. The CLIP index .npz is a snapshot of one process, so with more than one
+worker it is loaded but never saved (each worker's copy would overwrite the
+others'); run a single worker (WEB_WORKERS=1) to keep growing it on disk.
+
+The Gemini client is the exception to preloading: gRPC channels opened before a
+fork are not fork-safe, so the master builds the SynthID detector without
+connecting (GEMINI_LAZY_CONNECT) and every worker connects in post_fork.
+"""
+
+import gc
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}"
+
+# Each worker holds a full set of analyzers; threads share them inside a worker.
+# Scans mostly wait on Gemini / image downloads, so a few workers with several
+# threads each beats many single-threaded workers.
+workers = int(os.getenv('WEB_WORKERS', 2))
+threads = int(os.getenv('WEB_THREADS', 8))
+worker_class = 'gthread'
+
+preload_app = True
+# Read by app_factory when the preloaded app is built - no Gemini gRPC channel before the fork
+os.environ['GEMINI_LAZY_CONNECT'] = '1'
+
+# A full scan (Gemini + CLIP + downloads) can take a while
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+# Time given to in-flight scans after SIGTERM before workers are killed
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the GC's reach, so collections in the
+    # workers do not touch (and copy) the shared model pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Split the CPU between workers instead of every worker's torch using all cores
+    try:
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // server.cfg.workers))
+    except ImportError:
+        pass
+    from app import connect_gemini
+    connect_gemini()
+    if server.cfg.workers > 1:
+        from app import memory_only_indexes
+        memory_only_indexes()
+    server.log.info(f"✅ Worker {worker.pid} ready ({server.cfg.threads} threads)")
+
+
+def worker_exit(server, worker):
+    # Persist anything this worker added to the CLIP index
+    from app import flush_indexes
+    flush_indexes()
@@ -11,12 +11,20 @@ Core idea:
 """
 
 import logging
+import threading
+import time
+from collections import OrderedDict
 import requests
 from PIL import Image
 from io import BytesIO
 import torch
 import open_clip
 
+from metrics import IMAGE_DOWNLOAD_SECONDS, IMAGE_DOWNLOAD_ERRORS, CLIP_ENCODE_SECONDS, CACHE_EVICTIONS
+from tracing import span, annotate
+from capture import record_image
+from analyzers.utils.seller_key import same_seller
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,10 +38,23 @@ class ClipImageSimilarityAnalyzer:
         model_name: str = "ViT-B-32",
         pretrained: str = "laion2b_s34b_b79k",
         timeout: int = 10,
+        embedding_index=None,
+        embedding_cache_size: int = 256,
+        score_bounds: tuple = (0.20, 0.80),
     ):
         self.timeout = timeout
+        # Cosine similarity mapped to 0 / 100 (see similarity_to_score); tune with calibrate_risk.py
+        self.score_lo, self.score_hi = score_bounds
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
+        # Optional analyzers.embedding_index.EmbeddingIndex for cross-shop search
+        self.embedding_index = embedding_index
+
+        # Recent URL -> embedding, so a listing image is encoded once per scan
+        self.embedding_cache_size = embedding_cache_size
+        self._embedding_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
         logger.info("🔧 Loading OpenCLIP model...")
         self.model, _, self.preprocess = open_clip.create_model_and_transforms(
             model_name, pretrained=pretrained
@@ -46,33 +67,105 @@ class ClipImageSimilarityAnalyzer:
 
     def download_pil(self, url: str) -> Image.Image | None:
         """Download image URL -> PIL.Image (RGB)."""
+        started, resp = time.perf_counter(), None
         try:
-            resp = requests.get(
-                url,
-                timeout=self.timeout,
-                headers={"User-Agent": "Mozilla/5.0"},
-            )
-            resp.raise_for_status()
+            with span('download', source='clip', url=url[:120]) as s, IMAGE_DOWNLOAD_SECONDS.time(source='clip'):
+                resp = requests.get(
+                    url,
+                    timeout=self.timeout,
+                    headers={"User-Agent": "Mozilla/5.0"},
+                )
+                record_image(url, resp.content, resp.status_code, time.perf_counter() - started, 'clip')
+                resp.raise_for_status()
+                annotate(s, bytes=len(resp.content))
             img = Image.open(BytesIO(resp.content))
             if img.mode != "RGB":
                 img = img.convert("RGB")
             return img
         except Exception as e:
+            if resp is None:
+                record_image(url, None, None, time.perf_counter() - started, 'clip', error=str(e))
+            IMAGE_DOWNLOAD_ERRORS.inc(source='clip')
             logger.error(f"❌ Error downloading image {url[:80]}: {e}")
             return None
 
     @torch.no_grad()
-    def embed_image(self, url: str):
-        """Encode image URL -> normalized embedding tensor [1, d]."""
-        img = self.download_pil(url)
+    def embed_pil(self, img: Image.Image):
+        """Encode PIL.Image -> normalized embedding tensor [1, d]."""
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        with span('clip_encode'), CLIP_ENCODE_SECONDS.time():
+            x = self.preprocess(img).unsqueeze(0).to(self.device)
+            feat = self.model.encode_image(x)
+        return feat / feat.norm(dim=-1, keepdim=True)
+
+    def embed_image(self, url: str, img: Image.Image | None = None):
+        """
+        Encode image URL -> normalized embedding tensor [1, d].
+        Pass img when the caller already downloaded it (e.g. the async app).
+        """
+        with self._cache_lock:
+            cached = self._embedding_cache.get(url)
+            if cached is not None:
+                self._embedding_cache.move_to_end(url)
+        if cached is not None:
+            with span('embedding_cache', cache='hit'):
+                return cached
+
+        if img is None:
+            img = self.download_pil(url)
         if img is None:
             return None
 
-        x = self.preprocess(img).unsqueeze(0).to(self.device)
-        feat = self.model.encode_image(x)
-        feat = feat / feat.norm(dim=-1, keepdim=True)
+        feat = self.embed_pil(img)
+        self._remember(url, feat)
         return feat
 
+    @torch.no_grad()
+    def embed_pils(self, imgs: list, batch_size: int = 32):
+        """Encode several PIL.Images, batch_size per forward pass -> normalized embeddings [n, d]."""
+        feats = []
+        for start in range(0, len(imgs), batch_size):
+            chunk = [img if img.mode == "RGB" else img.convert("RGB") for img in imgs[start:start + batch_size]]
+            with span('clip_encode', images=len(chunk)), CLIP_ENCODE_SECONDS.time():
+                x = torch.stack([self.preprocess(img) for img in chunk]).to(self.device)
+                feat = self.model.encode_image(x)
+            feats.append(feat / feat.norm(dim=-1, keepdim=True))
+        return torch.cat(feats)
+
+    def prime_embeddings(self, images: dict, batch_size: int = 32) -> int:
+        """
+        Encode already downloaded images into the embedding cache in batches, so
+        embed_image() / compare_images() on those URLs are cache hits.
+
+        Args:
+            images: url -> PIL.Image (None entries and cached URLs are skipped)
+            batch_size: Images per forward pass
+
+        Returns:
+            Number of images encoded
+        """
+        if not self.embedding_cache_size:
+            return 0
+        with self._cache_lock:
+            todo = [(u, img) for u, img in images.items() if img is not None and u not in self._embedding_cache]
+        if not todo:
+            return 0
+        feats = self.embed_pils([img for _, img in todo], batch_size=batch_size)
+        for i, (url, _) in enumerate(todo):
+            self._remember(url, feats[i:i + 1])
+        return len(todo)
+
+    def _remember(self, url: str, feat):
+        """Add an embedding to the LRU cache."""
+        if self.embedding_cache_size:
+            with self._cache_lock:
+                self._embedding_cache[url] = feat
+                self._embedding_cache.move_to_end(url)
+                while len(self._embedding_cache) > self.embedding_cache_size:
+                    self._embedding_cache.popitem(last=False)
+                    CACHE_EVICTIONS.inc(cache='clip_embedding')
+
     def cosine_similarity(self, emb1, emb2) -> float:
         """Cosine similarity of normalized embeddings."""
         return float((emb1 @ emb2.T).item())
@@ -83,12 +176,12 @@ class ClipImageSimilarityAnalyzer:
 
         CLIP cosine sim is usually ~[0.15..0.85] in practice for images.
         We use a piecewise mapping with clipping:
-          - sim <= 0.20 -> 0
-          - sim >= 0.80 -> 100
+          - sim <= lo (0.20) -> 0
+          - sim >= hi (0.80) -> 100
           - linear in between
-        Tune these bounds if needed.
+        Tune these bounds with score_bounds (CLIP_SCORE_BOUNDS).
         """
-        lo, hi = 0.20, 0.80
+        lo, hi = self.score_lo, self.score_hi
         sim_clamped = max(lo, min(hi, sim))
         score = (sim_clamped - lo) / (hi - lo) * 100.0
         return float(score)
@@ -115,9 +208,7 @@ class ClipImageSimilarityAnalyzer:
         Compare two images via OpenCLIP cosine similarity.
         """
         try:
-            logger.info("Comparing images (OpenCLIP)...")
-            logger.info(f"  Listing: {str(listing_image_url)[:80]}...")
-            logger.info(f"  Review:  {str(review_image_url)[:80]}...")
+            logger.debug("Comparing images (OpenCLIP): %.80s... vs %.80s...", listing_image_url, review_image_url)
 
             emb1 = self.embed_image(listing_image_url)
             emb2 = self.embed_image(review_image_url)
@@ -145,7 +236,7 @@ class ClipImageSimilarityAnalyzer:
                 "explanation": explanation,
                 "details": {
                     "clip_cosine_similarity": round(sim, 6),
-                    "score_mapping": {"lo": 0.20, "hi": 0.80},
+                    "score_mapping": {"lo": self.score_lo, "hi": self.score_hi},
                 },
             }
 
@@ -232,6 +323,59 @@ class ClipImageSimilarityAnalyzer:
             "model": "ViT-B-32 / laion2b_s34b_b79k",
         }
 
+    def find_similar_images(self, listing_url: str, seller, listing_images: list, k: int = 5, max_images: int = 3) -> dict:
+        """
+        Search the embedding index for images from OTHER shops that look like this
+        listing's photos, then add the listing's embeddings to the index.
+
+        Returns:
+            Dict with the nearest other-shop images per listing image
+        """
+        if self.embedding_index is None:
+            return {"analyzed": False, "message": "Embedding index not configured", "neighbours": []}
+
+        listing = (listing_url or "").split("?")[0]
+        seller = str(seller) if seller not in (None, "") else None
+
+        neighbours = []
+        new_vectors, new_meta = [], []
+        best_score = 0.0
+
+        for url in listing_images[:max_images]:
+            emb = self.embed_image(url)
+            if emb is None:
+                continue
+            vec = emb[0].float().cpu().numpy()
+
+            # Ask for extra hits so results from this listing/shop (and repeats of one
+            # image, e.g. from an index saved before inserts were deduplicated) can be dropped
+            hits, seen = [], set()
+            for h in self.embedding_index.search(vec, k + 10):
+                key = (h.get("image"), h.get("listing"))
+                if h.get("listing") == listing or (seller and same_seller(seller, h.get("seller"))) or key in seen:
+                    continue
+                seen.add(key)
+                hits.append(h)
+            hits = hits[:k]
+            if hits:
+                best_score = max(best_score, hits[0]["score"])
+            neighbours.append({"image_url": url, "similar": hits})
+
+            new_vectors.append(vec)
+            new_meta.append({"image": url, "listing": listing, "seller": seller})
+
+        if new_vectors:
+            self.embedding_index.add(new_vectors, new_meta)
+
+        return {
+            "analyzed": bool(new_vectors),
+            "images_searched": len(new_vectors),
+            "neighbours": neighbours,
+            "best_other_shop_similarity": round(float(best_score), 4),
+            "index_size": len(self.embedding_index),
+            "message": f"Best match from another shop: cosine {best_score:.3f}" if best_score else "No similar images from other shops",
+        }
+
     def _get_message(self, avg_score: float, high_matches: int, total: int) -> str:
         if high_matches >= 2:
             return f"✅ Strong verification: {high_matches}/{total} review photos match"
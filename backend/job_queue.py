@@ -0,0 +1,199 @@
+"""
+job_queue.py - background scans for the /jobs API
+
+POST /jobs puts the payload on a bounded queue and returns a job id straight away;
+worker threads run the scans through the same AnalysisPipeline as /analyze. Every
+stage that finishes is appended to the job's event list, which GET /jobs/<id> and
+the /jobs/<id>/events Server-Sent Events stream read from.
+
+Jobs live in the process that accepted them. Under gunicorn with several workers,
+the poll / events requests can land on a worker that never saw the job - run
+the job API with WEB_WORKERS=1 (scale with WEB_THREADS) or with sticky routing.
+"""
+
+import queue
+import logging
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when max_queued jobs are already waiting"""
+
+
+class Job:
+    """One submitted scan and the events it has produced so far"""
+
+    def __init__(self, data: Dict):
+        self.id = uuid.uuid4().hex
+        self.data = data
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.finished_monotonic = None
+        self.result = None
+        self.error = None
+        # [{'id': n, 'event': 'stage' | 'done' | 'error', 'data': {...}}]
+        self.events = []
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def add_event(self, event: str, data: Dict):
+        with self._changed:
+            self.events.append({'id': len(self.events), 'event': event, 'data': data})
+            self._changed.notify_all()
+
+    def finish(self, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Store the outcome and publish the final 'done' / 'error' event"""
+        with self._changed:
+            self.result = result
+            self.error = error
+            self.finished_at = datetime.now().isoformat()
+            self.finished_monotonic = time.monotonic()
+            if error is None:
+                self.add_event('done', result)
+                self.status = 'done'
+            else:
+                self.add_event('error', {'success': False, 'error': error})
+                self.status = 'failed'
+
+    def wait_events(self, since: int, timeout: float) -> List[Dict]:
+        """
+        Events after index `since`, waiting up to `timeout` seconds for new ones
+
+        Returns:
+            New events (empty if none arrived in time or the job is finished)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > since or self.finished, timeout)
+            return self.events[since:]
+
+    def to_dict(self) -> Dict:
+        """GET /jobs/<id> payload: status, stage results so far and the final response"""
+        with self._changed:
+            stage_events = [e['data'] for e in self.events if e['event'] == 'stage']
+        job = {
+            'id': self.id,
+            'status': self.status,
+            'url': self.data.get('url'),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'stages': {e['stage']: {k: v for k, v in e.items() if k not in ('stage', 'results', 'risk')}
+                       for e in stage_events},
+            'results': {k: v for e in stage_events for k, v in e.get('results', {}).items()},
+        }
+        risk = next((e['risk'] for e in stage_events if 'risk' in e), None)
+        if risk:
+            job['risk'] = risk
+        if self.result is not None:
+            job['result'] = self.result
+        if self.error:
+            job['error'] = self.error
+        return job
+
+
+class JobQueue:
+    """
+    Bounded in-process queue of scans + the worker threads running them
+
+    Workers start on the first submit, so a preloaded gunicorn master (which
+    builds the app before forking) does not start threads the workers would lose.
+    """
+
+    def __init__(self, pipeline, workers: int = 2, max_queued: int = 100, ttl: int = 600):
+        """
+        Args:
+            pipeline: AnalysisPipeline the scans run through
+            workers: Worker threads (concurrent scans)
+            max_queued: Jobs that may wait for a worker before submit() raises QueueFull
+            ttl: Seconds a finished job stays available to GET /jobs/<id>
+        """
+        self.pipeline = pipeline
+        self.workers = workers
+        self.ttl = ttl
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, data: Dict) -> Job:
+        """Queue a scan; raises QueueFull when the queue is at capacity"""
+        self._start_workers()
+        self._expire()
+        job = Job(data)
+        with self._lock:
+            self.jobs[job.id] = job
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self.jobs[job.id]
+            raise QueueFull(f'{self.queue.maxsize} jobs already queued')
+        logger.info(f"📥 Job {job.id} queued: {data.get('url', 'unknown')} ({self.queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            'workers': self.workers,
+            'queued': self.queue.qsize(),
+            'max_queued': self.queue.maxsize,
+            'running': statuses.count('running'),
+            'jobs': len(statuses),
+        }
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"✅ Job queue started ({self.workers} workers, up to {self.queue.maxsize} queued)")
+
+    def _expire(self):
+        """Forget finished jobs older than ttl"""
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished and job.finished_monotonic < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._run(job)
+            finally:
+                self.queue.task_done()
+
+    def _run(self, job: Job):
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        logger.info(f"🔍 Job {job.id} started")
+        try:
+            result = self.pipeline.run(job.data, on_stage=lambda event: job.add_event('stage', event))
+            logger.info(f"✅ Job {job.id} done")
+            job.finish(result=result)
+        except Exception as e:
+            logger.error(f"❌ Job {job.id} failed: {e}")
+            logger.error(traceback.format_exc())
+            job.finish(error=str(e))
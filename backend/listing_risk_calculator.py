@@ -797,15 +797,55 @@
 listing_risk_calculator.py
 Comprehensive risk scoring system for Etsy listings
 Considers: reviews, images, seller stats, sentiment, AI detection
+
+Thresholds, points and warning texts come from the rule table (risk_rules.json,
+see risk_rules.py) - tuning them is a file edit, picked up without a restart.
 """
 
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 from collections import Counter
 
+import numpy as np
+
+from analyzers.review_burst_detector import ReviewBurstDetector
+from risk_rules import RISK_FEATURES, RiskRules, RiskRulesSource, StaticRiskRules
+
 logger = logging.getLogger(__name__)
 
+# Breakdown components in scoring order; '<component>_error' columns zero a component,
+# like the scalar path does when a component raises on malformed input
+RISK_COMPONENTS = ('reviews', 'seller', 'review_photos', 'sentiment', 'ai_images', 'duplicate_reviews', 'image_reuse')
+
+
+class _WarningFields(dict):
+    """Warning template values; a field the component does not have renders as '?'"""
+
+    def __missing__(self, key):
+        return '?'
+
+
+def _number(value) -> float:
+    """A rule input as float - None is NaN (not reported), anything else non-numeric raises"""
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    raise TypeError(f"not a number: {value!r}")
+
+
+def _rule_values(rules: RiskRules, names: tuple, values: Dict) -> Dict[str, float]:
+    """
+    Rule inputs as floats - raises where calculate_risk() would: the rules are picked on
+    the raw values first, so a malformed value only fails the component when a rule
+    actually compares it (one a tier short-circuits past becomes NaN, which cannot
+    change that tier's outcome)
+    """
+    for name in names:
+        rules[name].pick(values)
+    return {key: float(value) if isinstance(value, (int, float)) else np.nan for key, value in values.items()}
+
 
 class ListingRiskCalculator:
     """
@@ -813,9 +853,27 @@ class ListingRiskCalculator:
     Score: 0-100 (0 = trustworthy, 100 = likely fake)
     """
     
-    def __init__(self):
+    def __init__(self, rules=None):
+        """
+        Args:
+            rules: Rule file path, a RiskRulesSource, or compiled RiskRules (fixed);
+                default RISK_RULES_FILE / the bundled risk_rules.json, hot-reloaded
+        """
+        if isinstance(rules, RiskRules):
+            rules = StaticRiskRules(rules)
+        elif rules is None or isinstance(rules, str):
+            rules = RiskRulesSource(rules)
+        self.rules = rules
+        self.burst_detector = ReviewBurstDetector()
         logger.info("✅ ListingRiskCalculator initialized")
     
+    def _apply(self, rule, values: Dict, warnings: List[str]):
+        """Points of one rule for these values (its warning, if any, goes to warnings)"""
+        points, warning = rule.pick(values)
+        if warning:
+            warnings.append(warning.format_map(_WarningFields(values)))
+        return points
+    
     def calculate_risk(self, data: Dict) -> Dict:
         """
         Calculate comprehensive risk score
@@ -827,6 +885,7 @@ class ListingRiskCalculator:
             Dict with risk score, level, breakdown, and warnings
         """
         logger.info("🎯 Starting risk calculation...")
+        rules = self.rules.get()
         score = 0
         warnings = []
         breakdown = {}
@@ -837,23 +896,22 @@ class ListingRiskCalculator:
         sentiment = data.get('results', {}).get('sentiment', {})
         synthid = data.get('results', {}).get('synthid', {})
         clip_similarity = data.get('results', {}).get('image_similarity', {})
-        
-        logger.info(f"   Reviews: {len(reviews)}")
-        logger.info(f"   Sentiment data: {sentiment is not None}")
-        logger.info(f"   SynthID data: {synthid is not None}")
-        logger.info(f"   Image similarity data: {clip_similarity is not None}")
-        
-        if synthid:
-            logger.info(f"   SynthID AI detected: {synthid.get('any_ai', False)}")
-            logger.info(f"   SynthID results length: {len(synthid.get('results', []))}")
-        
-        if clip_similarity:
-            logger.info(f"   CLIP analyzed: {clip_similarity.get('analyzed', False)}")
-            logger.info(f"   CLIP avg match: {clip_similarity.get('average_match_score', 0)}%")
+        duplicates = data.get('results', {}).get('duplicates', {})
+        image_reuse = data.get('results', {}).get('image_reuse', {})
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("   Reviews: %d, sentiment data: %s, SynthID data: %s, image similarity data: %s",
+                         len(reviews), sentiment is not None, synthid is not None, clip_similarity is not None)
+            if synthid:
+                logger.debug("   SynthID AI detected: %s (%d results)",
+                             synthid.get('any_ai', False), len(synthid.get('results', [])))
+            if clip_similarity:
+                logger.debug("   CLIP analyzed: %s, avg match: %s%%",
+                             clip_similarity.get('analyzed', False), clip_similarity.get('average_match_score', 0))
         
         # 1. REVIEW ANALYSIS (0-30 points)
         try:
-            review_risk, review_warnings = self._analyze_reviews(reviews)
+            review_risk, review_warnings = self._analyze_reviews(reviews, rules)
             score += review_risk
             warnings.extend(review_warnings)
             breakdown['reviews'] = review_risk
@@ -863,7 +921,7 @@ class ListingRiskCalculator:
         
         # 2. SELLER CREDIBILITY (0-25 points)
         try:
-            seller_risk, seller_warnings = self._analyze_seller(listing_data)
+            seller_risk, seller_warnings = self._analyze_seller(listing_data, rules)
             score += seller_risk
             warnings.extend(seller_warnings)
             breakdown['seller'] = seller_risk
@@ -873,7 +931,7 @@ class ListingRiskCalculator:
         
         # 3. REVIEW PHOTOS & CLIP SIMILARITY (0-20 points - PROTECTIVE FACTOR)
         try:
-            photo_risk, photo_warnings = self._analyze_review_photos_with_clip(reviews, clip_similarity)
+            photo_risk, photo_warnings = self._analyze_review_photos_with_clip(reviews, clip_similarity, rules)
             score += photo_risk
             warnings.extend(photo_warnings)
             breakdown['review_photos'] = photo_risk
@@ -883,7 +941,7 @@ class ListingRiskCalculator:
         
         # 4. SENTIMENT ANALYSIS (0-15 points)
         try:
-            sentiment_risk, sentiment_warnings = self._analyze_sentiment(sentiment, reviews)
+            sentiment_risk, sentiment_warnings = self._analyze_sentiment(sentiment, reviews, rules)
             score += sentiment_risk
             warnings.extend(sentiment_warnings)
             breakdown['sentiment'] = sentiment_risk
@@ -893,7 +951,7 @@ class ListingRiskCalculator:
         
         # 5. AI DETECTION (0-10 points with context)
         try:
-            ai_risk, ai_warnings = self._analyze_ai_images(synthid, reviews, listing_data)
+            ai_risk, ai_warnings = self._analyze_ai_images(synthid, reviews, listing_data, rules)
             score += ai_risk
             warnings.extend(ai_warnings)
             breakdown['ai_images'] = ai_risk
@@ -901,25 +959,33 @@ class ListingRiskCalculator:
             logger.error(f"Error analyzing AI images: {e}")
             breakdown['ai_images'] = 0
         
+        # 6. DUPLICATE REVIEW TEXT (0-15 points)
+        try:
+            duplicate_risk, duplicate_warnings = self._analyze_duplicates(duplicates, rules)
+            score += duplicate_risk
+            warnings.extend(duplicate_warnings)
+            breakdown['duplicate_reviews'] = duplicate_risk
+        except Exception as e:
+            logger.error(f"Error analyzing duplicate reviews: {e}")
+            breakdown['duplicate_reviews'] = 0
+        
+        # 7. LISTING IMAGES REUSED BY OTHER SELLERS (0-20 points)
+        try:
+            reuse_risk, reuse_warnings = self._analyze_image_reuse(image_reuse, rules)
+            score += reuse_risk
+            warnings.extend(reuse_warnings)
+            breakdown['image_reuse'] = reuse_risk
+        except Exception as e:
+            logger.error(f"Error analyzing image reuse: {e}")
+            breakdown['image_reuse'] = 0
+        
         # Cap at 100
         score = min(100, max(0, score))
         
         # Determine risk level
-        if score < 20:
-            level = "VERY LOW"
-            color = "#22c55e"
-        elif score < 40:
-            level = "LOW"
-            color = "#84cc16"
-        elif score < 60:
-            level = "MEDIUM"
-            color = "#f59e0b"
-        elif score < 80:
-            level = "HIGH"
-            color = "#ef4444"
-        else:
-            level = "VERY HIGH"
-            color = "#dc2626"
+        band = rules.band(score)
+        level = rules.levels[band]
+        color = rules.level_colors[band]
         
         return {
             'score': round(score, 1),
@@ -927,174 +993,120 @@ class ListingRiskCalculator:
             'color': color,
             'warnings': warnings,
             'breakdown': breakdown,
-            'recommendation': self._get_recommendation(score, warnings)
+            'recommendation': self._get_recommendation(score, warnings, rules)
         }
     
-    def _analyze_reviews(self, reviews: List[Dict]) -> tuple:
+    def _analyze_reviews(self, reviews: List[Dict], rules: RiskRules) -> tuple:
         """Analyze review patterns (0-30 points)"""
         risk = 0
         warnings = []
         
         if not reviews:
-            risk += 15
-            warnings.append("⚠️ No reviews found - cannot verify product quality")
+            risk += self._apply(rules['reviews.none'], {}, warnings)
             return risk, warnings
         
-        review_count = len(reviews)
-        
         # Very few reviews
-        if review_count < 5:
-            risk += 10
-            warnings.append(f"⚠️ Only {review_count} reviews - limited feedback")
-        elif review_count < 10:
-            risk += 5
-            warnings.append(f"⚠️ Only {review_count} reviews - consider more established listings")
+        risk += self._apply(rules['reviews.count'], {'review_count': len(reviews)}, warnings)
         
         # Check review dates clustering
         dates = [r.get('date') for r in reviews if r.get('date')]
         if dates:
-            date_risk, date_warning = self._check_date_clustering(dates)
+            date_risk, date_warning = self._check_date_clustering(dates, rules)
             risk += date_risk
             if date_warning:
                 warnings.append(date_warning)
         
         return risk, warnings
     
-    def _check_date_clustering(self, dates: List[str]) -> tuple:
-        """Check if reviews are suspiciously clustered in time"""
-        # TODO: Parse dates and check if they're all within a short time period
-        # For now, return 0
-        return 0, None
+    def _burst_clustering(self, dates: List) -> Optional[Dict]:
+        """Burst detector result, None if it failed (only the burst points are lost, not the review count)"""
+        try:
+            return self.burst_detector.analyze(dates)
+        except Exception as e:
+            logger.error(f"Error checking review date clustering: {e}")
+            return None
     
-    def _analyze_seller(self, listing_data: Dict) -> tuple:
+    def _check_date_clustering(self, dates: List[str], rules: RiskRules) -> tuple:
+        """Check if reviews are suspiciously clustered in time (0-10 points)"""
+        clustering = self._burst_clustering(dates)
+        
+        if not clustering or not clustering['analyzed']:
+            return 0, None
+        
+        values = {
+            'burst_score': clustering['burst_score'],
+            'burst_share': round(clustering['max_window_share'] * 100),
+            'burst_window_days': clustering['window_days'],
+            'burst_start': clustering.get('burst_start'),
+        }
+        warnings = []
+        risk = self._apply(rules['reviews.burst'], values, warnings)
+        return risk, (warnings[0] if warnings else None)
+    
+    def _analyze_seller(self, listing_data: Dict, rules: RiskRules) -> tuple:
         """Analyze seller credibility (0-25 points)"""
         risk = 0
         warnings = []
         
-        seller_age_months = listing_data.get('sellerAgeMonths')
-        sales_count = listing_data.get('salesCount')
-        listing_age_days = listing_data.get('listingAgeDays')
-        
-        # Seller age
-        if seller_age_months is not None:
-            if seller_age_months < 6:
-                risk += 12
-                warnings.append(f"🚩 Very new seller (< 6 months old)")
-            elif seller_age_months < 12:
-                risk += 8
-                warnings.append(f"⚠️ New seller ({seller_age_months} months old)")
-            elif seller_age_months < 24:
-                risk += 4
-                warnings.append(f"ℹ️ Relatively new seller ({seller_age_months} months)")
-        
-        # Sales count
-        if sales_count is not None:
-            if sales_count < 10:
-                risk += 10
-                warnings.append(f"🚩 Very few sales ({sales_count})")
-            elif sales_count < 50:
-                risk += 5
-                warnings.append(f"⚠️ Limited sales history ({sales_count})")
-        
-        # Listing age (very new listings can be suspicious)
-        if listing_age_days is not None:
-            if listing_age_days < 3:
-                risk += 3
-                warnings.append(f"ℹ️ Very new listing ({listing_age_days} days old)")
+        values = {
+            'seller_age_months': listing_data.get('sellerAgeMonths'),
+            'sales_count': listing_data.get('salesCount'),
+            'listing_age_days': listing_data.get('listingAgeDays'),  # very new listings can be suspicious
+        }
+        
+        for feature, rule in (('seller_age_months', 'seller.age_months'), ('sales_count', 'seller.sales'),
+                              ('listing_age_days', 'seller.listing_age_days')):
+            if values[feature] is not None:
+                risk += self._apply(rules[rule], values, warnings)
         
         return risk, warnings
     
-    def _analyze_review_photos_with_clip(self, reviews: List[Dict], clip_similarity: Dict) -> tuple:
+    def _analyze_review_photos_with_clip(self, reviews: List[Dict], clip_similarity: Dict, rules: RiskRules) -> tuple:
         """
         Analyze review photos with CLIP similarity - PROTECTIVE FACTOR
         CLIP verification makes this even more protective
         """
-        risk = 0
         warnings = []
         
         if not reviews:
             return 0, []
         
         reviews_with_photos = sum(1 for r in reviews if r.get('images') and len(r.get('images', [])) > 0)
-        total_reviews = len(reviews)
         
         # Check if CLIP analysis was performed
         if clip_similarity and clip_similarity.get('analyzed'):
-            verified = clip_similarity.get('verified_authentic', False)
-            avg_match = clip_similarity.get('average_match_score', 0)
-            high_matches = clip_similarity.get('high_confidence_matches', 0)
-            total_comparisons = clip_similarity.get('total_comparisons', 0)
-            
-            if verified and avg_match >= 70:
-                # STRONG protection - photos match listing images very well
-                risk -= 20
-                warnings.append(f"✅ CLIP verified: {high_matches} review photos strongly match listing ({avg_match}% avg)")
-            elif verified and avg_match >= 60:
-                # GOOD protection - photos match reasonably well
-                risk -= 15
-                warnings.append(f"✅ CLIP verified: Review photos match listing images ({avg_match}% avg)")
-            elif avg_match >= 50:
-                # MODERATE match
-                risk -= 10
-                warnings.append(f"ℹ️ CLIP analysis: Partial match with listing images ({avg_match}% avg)")
-            elif avg_match >= 30:
-                # WEAK match - slightly concerning
-                risk += 5
-                warnings.append(f"⚠️ CLIP analysis: Weak match with listing images ({avg_match}% avg)")
-            else:
-                # POOR match - concerning!
-                risk += 15
-                warnings.append(f"🚩 CLIP analysis: Poor match - review photos may show different products ({avg_match}% avg)")
+            values = {
+                'clip_verified': clip_similarity.get('verified_authentic', False),
+                'clip_avg_match': clip_similarity.get('average_match_score', 0),
+                'clip_high_matches': clip_similarity.get('high_confidence_matches', 0),
+            }
+            risk = self._apply(rules['review_photos.clip'], values, warnings)
         else:
             # No CLIP analysis - fall back to simple photo count
-            if reviews_with_photos >= 5:
-                risk -= 15
-                warnings.append(f"✅ {reviews_with_photos} reviews have photos - strong authenticity indicator")
-            elif reviews_with_photos >= 3:
-                risk -= 10
-                warnings.append(f"✅ {reviews_with_photos} reviews have photos - good verification")
-            elif reviews_with_photos >= 1:
-                risk -= 5
-                warnings.append(f"ℹ️ {reviews_with_photos} review(s) have photos")
-            else:
-                risk += 15
-                warnings.append(f"⚠️ No review photos - cannot verify actual product appearance")
+            risk = self._apply(rules['review_photos.count'], {'reviews_with_photos': reviews_with_photos}, warnings)
         
         return risk, warnings
     
-    def _analyze_review_photos(self, reviews: List[Dict]) -> tuple:
+    def _analyze_review_photos(self, reviews: List[Dict], rules: RiskRules = None) -> tuple:
         """
         Legacy method - kept for compatibility
         Analyze review photos - PROTECTIVE FACTOR
         Photos REDUCE risk (negative points)
         """
-        risk = 0
         warnings = []
         
         if not reviews:
             return 0, []
         
         reviews_with_photos = sum(1 for r in reviews if r.get('images') and len(r.get('images', [])) > 0)
-        total_reviews = len(reviews)
-        photo_percentage = (reviews_with_photos / total_reviews * 100) if total_reviews > 0 else 0
         
         # Photos are PROTECTIVE - they reduce risk
-        if reviews_with_photos >= 5:
-            risk -= 15  # Strong protection
-            warnings.append(f"✅ {reviews_with_photos} reviews have photos - strong authenticity indicator")
-        elif reviews_with_photos >= 3:
-            risk -= 10  # Good protection
-            warnings.append(f"✅ {reviews_with_photos} reviews have photos - good verification")
-        elif reviews_with_photos >= 1:
-            risk -= 5  # Some protection
-            warnings.append(f"ℹ️ {reviews_with_photos} review(s) have photos")
-        else:
-            risk += 15  # No photos = increased risk
-            warnings.append(f"⚠️ No review photos - cannot verify actual product appearance")
+        risk = self._apply((rules or self.rules.get())['review_photos.count'],
+                           {'reviews_with_photos': reviews_with_photos}, warnings)
         
         return risk, warnings
     
-    def _analyze_sentiment(self, sentiment: Dict, reviews: List[Dict]) -> tuple:
+    def _analyze_sentiment(self, sentiment: Dict, reviews: List[Dict], rules: RiskRules) -> tuple:
         """Analyze sentiment patterns (0-15 points)"""
         risk = 0
         warnings = []
@@ -1102,33 +1114,27 @@ class ListingRiskCalculator:
         if not sentiment or not reviews:
             return 0, []
         
-        suspicious_count = sentiment.get('sentiment_rating_mismatch_count', 0)
-        avg_sentiment = sentiment.get('average_sentiment', 0)
-        positive_pct = sentiment.get('sentiment_percentages', {}).get('positive', 0)
+        values = {
+            'suspicious_count': sentiment.get('sentiment_rating_mismatch_count', 0),
+            'average_sentiment': sentiment.get('average_sentiment', 0),
+            'positive_pct': sentiment.get('sentiment_percentages', {}).get('positive', 0),
+            'review_count': len(reviews),
+        }
         
         # Suspicious reviews (rating doesn't match sentiment)
-        if suspicious_count > 0:
-            risk += min(suspicious_count * 5, 15)  # Up to 15 points
-            warnings.append(f"🚩 {suspicious_count} suspicious review(s) - rating doesn't match text sentiment")
-        
+        risk += self._apply(rules['sentiment.suspicious'], values, warnings)
         # Unnaturally high positivity (possible fake reviews)
-        if positive_pct > 95 and len(reviews) > 10:
-            risk += 5
-            warnings.append(f"⚠️ Unusually high positive sentiment ({positive_pct}%) - may indicate fake reviews")
-        
+        risk += self._apply(rules['sentiment.positivity'], values, warnings)
         # Very high average sentiment can be suspicious
-        if avg_sentiment > 0.7 and len(reviews) > 15:
-            risk += 3
-            warnings.append(f"ℹ️ Very enthusiastic reviews (avg sentiment: {avg_sentiment}) - verify authenticity")
+        risk += self._apply(rules['sentiment.enthusiasm'], values, warnings)
         
         return risk, warnings
     
-    def _analyze_ai_images(self, synthid: Dict, reviews: List[Dict], listing_data: Dict) -> tuple:
+    def _analyze_ai_images(self, synthid: Dict, reviews: List[Dict], listing_data: Dict, rules: RiskRules) -> tuple:
         """
         Analyze AI-generated images with context (0-10 points)
         Context matters: AI images are MORE suspicious with fewer reviews
         """
-        risk = 0
         warnings = []
         
         if not synthid:
@@ -1145,40 +1151,270 @@ class ListingRiskCalculator:
         if not ai_detected:
             return 0, []
         
-        # AI detected - check context
-        reviews_with_photos = sum(1 for r in reviews if r.get('images') and len(r.get('images', [])) > 0)
-        seller_age_months = listing_data.get('sellerAgeMonths', 0)
-        sales_count = listing_data.get('salesCount', 0)
-        
-        # Established seller with review photos - likely just edited product photo
-        if reviews_with_photos >= 3 and seller_age_months >= 12 and sales_count >= 100:
-            risk += 2
-            warnings.append(f"ℹ️ AI-detected in listing image ({confidence}% confidence) - likely edited product photo given established seller")
+        # AI detected - established seller with review photos is likely just an edited
+        # product photo; a new seller with no review photos is very suspicious
+        values = {
+            'ai_confidence': confidence,
+            'reviews_with_photos': sum(1 for r in reviews if r.get('images') and len(r.get('images', [])) > 0),
+            'seller_age_months': listing_data.get('sellerAgeMonths', 0),
+            'sales_count': listing_data.get('salesCount', 0),
+        }
+        risk = self._apply(rules['ai_images'], values, warnings)
         
-        # New seller with no review photos - VERY suspicious
-        elif reviews_with_photos == 0 and seller_age_months < 6:
-            risk += 10
-            warnings.append(f"🚩 AI-generated listing image ({confidence}% confidence) + no review photos + new seller - HIGH RISK")
+        return risk, warnings
+    
+    def _analyze_duplicates(self, duplicates: Dict, rules: RiskRules) -> tuple:
+        """
+        Analyze near-duplicate review texts (0-15 points)
+        Review farms paste the same text with small edits across many reviews
+        """
+        if not duplicates or not duplicates.get('analyzed'):
+            return 0, []
         
-        # Middle ground
-        else:
-            risk += 5
-            warnings.append(f"⚠️ AI-detected in listing image ({confidence}% confidence) - verify with review photos")
+        values = {
+            'duplicate_count': duplicates.get('duplicate_review_count', 0),
+            'duplicate_ratio': duplicates.get('duplicate_ratio', 0),
+            'largest_duplicate_group': duplicates.get('largest_group_size', 0),
+            'duplicate_groups': duplicates.get('duplicate_group_count', 0),
+        }
+        warnings = []
+        return self._apply(rules['duplicate_reviews'], values, warnings), warnings
+    
+    def _analyze_image_reuse(self, image_reuse: Dict, rules: RiskRules) -> tuple:
+        """
+        Analyze listing photos found under other sellers (0-20 points)
+        Stolen or dropshipped product photos are a strong scam signal
+        """
+        if not image_reuse or not image_reuse.get('analyzed'):
+            return 0, []
         
-        return risk, warnings
+        values = {
+            'images_reused': image_reuse.get('images_reused_by_other_sellers', 0),
+            'other_seller_count': image_reuse.get('other_seller_count', 0),
+        }
+        warnings = []
+        return self._apply(rules['image_reuse'], values, warnings), warnings
     
-    def _get_recommendation(self, score: float, warnings: List[str]) -> str:
+    def _get_recommendation(self, score: float, warnings: List[str], rules: RiskRules = None) -> str:
         """Get purchase recommendation based on score"""
-        if score < 20:
-            return "✅ Appears trustworthy - safe to purchase"
-        elif score < 40:
-            return "✅ Likely legitimate - proceed with normal caution"
-        elif score < 60:
-            return "⚠️ Exercise caution - verify seller credibility and reviews carefully"
-        elif score < 80:
-            return "⚠️ High risk - look for review photos and established seller history before purchasing"
-        else:
-            return "🚫 Very high risk - consider alternative listings with more reviews and established sellers"
+        rules = rules or self.rules.get()
+        return rules.recommendations[rules.band(score)]
+
+    # ------------------------------------------------------------------
+    # Batch scoring
+    # ------------------------------------------------------------------
+    def risk_features(self, listings: List[Dict], rules: RiskRules = None) -> Dict[str, np.ndarray]:
+        """
+        Columns for calculate_risk_batch() from calculate_risk() inputs
+
+        Args:
+            listings: Dicts shaped like calculate_risk()'s data argument
+            rules: Rules the '<component>_error' flags are worked out against (default
+                the current ones) - a malformed value only fails rules that compare it
+
+        Returns:
+            Dict column -> array (RISK_FEATURES plus '<component>_error' flags)
+        """
+        columns = {name: [] for name in RISK_FEATURES}
+        errors = {name: [] for name in RISK_COMPONENTS}
+        rules = rules or self.rules.get()
+        for data in listings:
+            row, failed = self._feature_row(data, rules)
+            for name, default in RISK_FEATURES.items():
+                columns[name].append(row.get(name, default))
+            for name in RISK_COMPONENTS:
+                errors[name].append(name in failed)
+
+        features = {name: np.array(values, dtype=bool if isinstance(RISK_FEATURES[name], bool) else float)
+                    for name, values in columns.items()}
+        features.update({f'{name}_error': np.array(values, dtype=bool) for name, values in errors.items()})
+        return features
+
+    def _feature_row(self, data: Dict, rules: RiskRules) -> tuple:
+        """(feature values, components that would raise in calculate_risk) for one listing"""
+        listing_data = data.get('data', {})
+        reviews = listing_data.get('reviews', [])
+        results = data.get('results', {})
+        sentiment = results.get('sentiment', {})
+        synthid = results.get('synthid', {})
+        clip_similarity = results.get('image_similarity', {})
+        duplicates = results.get('duplicates', {})
+        image_reuse = results.get('image_reuse', {})
+
+        row, failed = {}, set()
+
+        def component(name, fill):
+            try:
+                fill()
+            except (TypeError, ValueError, AttributeError, KeyError, IndexError):
+                failed.add(name)
+
+        def reviews_part():
+            row['review_count'] = len(reviews) if reviews else 0
+            dates = [r.get('date') for r in reviews if r.get('date')] if reviews else []
+            if dates:
+                clustering = self._burst_clustering(dates)
+                if clustering and clustering['analyzed']:
+                    row['burst_score'] = _number(clustering['burst_score'])
+        component('reviews', reviews_part)
+
+        def seller_part():
+            for key, name in (('sellerAgeMonths', 'seller_age_months'), ('salesCount', 'sales_count'),
+                              ('listingAgeDays', 'listing_age_days')):
+                row[name] = _number(listing_data.get(key))
+        component('seller', seller_part)
+
+        def photos_part():
+            row['reviews_with_photos'] = sum(1 for r in reviews if r.get('images') and len(r.get('images', [])) > 0) if reviews else 0
+            if clip_similarity and clip_similarity.get('analyzed'):
+                values = _rule_values(rules, ('review_photos.clip',), {
+                    'clip_verified': clip_similarity.get('verified_authentic', False),
+                    'clip_avg_match': clip_similarity.get('average_match_score', 0),
+                    'clip_high_matches': clip_similarity.get('high_confidence_matches', 0),
+                })
+                row['clip_analyzed'] = True
+                row['clip_verified'] = bool(clip_similarity.get('verified_authentic', False))
+                row['clip_avg_match'] = values['clip_avg_match']
+        component('review_photos', photos_part)
+
+        def sentiment_part():
+            if sentiment and reviews:
+                values = _rule_values(rules, ('sentiment.suspicious', 'sentiment.positivity', 'sentiment.enthusiasm'), {
+                    'suspicious_count': sentiment.get('sentiment_rating_mismatch_count', 0),
+                    'average_sentiment': sentiment.get('average_sentiment', 0),
+                    'positive_pct': sentiment.get('sentiment_percentages', {}).get('positive', 0),
+                    'review_count': len(reviews),
+                })
+                row['sentiment_analyzed'] = True
+                row.update({key: values[key] for key in ('suspicious_count', 'average_sentiment', 'positive_pct')})
+        component('sentiment', sentiment_part)
+
+        def ai_part():
+            if synthid and synthid.get('any_ai', False):
+                row['ai_detected'] = True
+                results = synthid.get('results', [])
+                if results and isinstance(results[0], dict):
+                    confidence = results[0].get('confidence', 0)
+                    row['ai_confidence'] = float(confidence) if isinstance(confidence, (int, float)) else np.nan
+                # The AI rules compare seller age / sales (0 for a missing key) only on some branches
+                _rule_values(rules, ('ai_images',), {
+                    'ai_confidence': row.get('ai_confidence', 0),
+                    'reviews_with_photos': sum(1 for r in reviews if r.get('images') and len(r.get('images', [])) > 0),
+                    'seller_age_months': listing_data.get('sellerAgeMonths', 0),
+                    'sales_count': listing_data.get('salesCount', 0),
+                })
+        component('ai_images', ai_part)
+
+        def duplicates_part():
+            if duplicates and duplicates.get('analyzed'):
+                values = _rule_values(rules, ('duplicate_reviews',), {
+                    'duplicate_count': duplicates.get('duplicate_review_count', 0),
+                    'duplicate_ratio': duplicates.get('duplicate_ratio', 0),
+                    'largest_duplicate_group': duplicates.get('largest_group_size', 0),
+                    'duplicate_groups': duplicates.get('duplicate_group_count', 0),
+                })
+                row['duplicates_analyzed'] = True
+                row.update({key: values[key] for key in ('duplicate_count', 'duplicate_ratio', 'largest_duplicate_group')})
+        component('duplicate_reviews', duplicates_part)
+
+        def reuse_part():
+            if image_reuse and image_reuse.get('analyzed'):
+                values = _rule_values(rules, ('image_reuse',), {
+                    'images_reused': image_reuse.get('images_reused_by_other_sellers', 0),
+                    'other_seller_count': image_reuse.get('other_seller_count', 0),
+                })
+                row['image_reuse_analyzed'] = True
+                row.update(values)
+        component('image_reuse', reuse_part)
+
+        return row, failed
+
+    def calculate_risk_batch(self, features, rules: RiskRules = None) -> Dict:
+        """
+        Vectorized calculate_risk() over many listings
+
+        Same rules, same numbers: score, level, color, recommendation and breakdown
+        match the scalar path row for row (warnings are not built - use calculate_risk()
+        for the text of one listing).
+
+        Args:
+            features: Mapping column -> array-like (a dict of NumPy arrays or a pandas
+                DataFrame) with the RISK_FEATURES columns; missing columns take their
+                defaults. risk_features() builds it from calculate_risk() inputs.
+            rules: Compiled rules to score with instead of the current ones (threshold sweeps)
+
+        Returns:
+            Dict with 'score', 'level', 'color', 'recommendation' arrays and
+            'breakdown': component -> points array
+        """
+        rules = rules or self.rules.get()
+        n = len(next(iter(features.values()))) if len(features) else 0
+        col = {}
+        for name, default in RISK_FEATURES.items():
+            if name in features:
+                col[name] = np.asarray(features[name], dtype=bool if isinstance(default, bool) else float)
+            else:
+                col[name] = np.full(n, default, dtype=bool if isinstance(default, bool) else float)
+
+        has_reviews = col['review_count'] > 0
+
+        # 1. Reviews: no reviews, few reviews, date clustering
+        reviews = np.where(
+            has_reviews,
+            rules['reviews.count'].points(col) + rules['reviews.burst'].points(col),
+            rules['reviews.none'].points(col),
+        )
+
+        # 2. Seller: age, sales, listing age (NaN = not reported, no band matches)
+        seller = (rules['seller.age_months'].points(col) + rules['seller.sales'].points(col)
+                  + rules['seller.listing_age_days'].points(col))
+
+        # 3. Review photos: CLIP verdict, or the photo count without CLIP
+        review_photos = np.where(
+            has_reviews,
+            np.where(col['clip_analyzed'], rules['review_photos.clip'].points(col),
+                     rules['review_photos.count'].points(col)),
+            0,
+        )
+
+        # 4. Sentiment: rating mismatches, unnatural positivity
+        sentiment = np.where(
+            col['sentiment_analyzed'] & has_reviews,
+            rules['sentiment.suspicious'].points(col) + rules['sentiment.positivity'].points(col)
+            + rules['sentiment.enthusiasm'].points(col),
+            0,
+        )
+
+        # 5. AI images, in the context of review photos and seller history (missing = 0)
+        ai_columns = dict(col, seller_age_months=np.nan_to_num(col['seller_age_months'], nan=0.0),
+                          sales_count=np.nan_to_num(col['sales_count'], nan=0.0))
+        ai_images = np.where(col['ai_detected'], rules['ai_images'].points(ai_columns), 0)
+
+        # 6. Near-duplicate review texts
+        duplicate_reviews = np.where(col['duplicates_analyzed'], rules['duplicate_reviews'].points(col), 0)
+
+        # 7. Listing images reused by other sellers
+        image_reuse = np.where(col['image_reuse_analyzed'], rules['image_reuse'].points(col), 0)
+
+        breakdown = {}
+        score = np.zeros(n)
+        for name, points in zip(RISK_COMPONENTS, (reviews, seller, review_photos, sentiment, ai_images,
+                                                 duplicate_reviews, image_reuse)):
+            points = points.astype(float)
+            if f'{name}_error' in features:
+                points = np.where(np.asarray(features[f'{name}_error'], dtype=bool), 0.0, points)
+            breakdown[name] = points
+            score = score + points
+
+        score = np.clip(score, 0, 100)
+        band = rules.bands(score)
+        return {
+            'score': np.round(score, 1),
+            'level': np.array(rules.levels, dtype=object)[band],
+            'color': np.array(rules.level_colors, dtype=object)[band],
+            'recommendation': np.array(rules.recommendations, dtype=object)[band],
+            'breakdown': breakdown,
+        }
 
 
 # Test
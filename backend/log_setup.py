@@ -0,0 +1,115 @@
+"""
+log_setup.py - logging for the API processes
+
+Records are handed to a QueueHandler and written by a QueueListener thread, so
+request threads never block on stderr / file I/O. Level and format come from the
+environment:
+
+    LOG_LEVEL=INFO              root level (DEBUG shows per-image / per-comparison lines)
+    LOG_FORMAT=text|json        json: one object per line, with any extra={...} fields
+    LOG_PAYLOAD_SAMPLE=0.01     share of requests whose raw payload samples are logged (DEBUG only)
+
+Hot-path code should log with %-style arguments (formatted only if the record is
+emitted) and dump payloads through log_payload().
+"""
+
+import os
+import json
+import atexit
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime
+
+# Attributes every LogRecord has - anything else came from extra={...}
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE', 0.01))
+
+_listener = None
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message + extra fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def _start_listener():
+    """(Re)create the queue + listener thread; the handler keeps pointing at the new queue"""
+    global _listener
+    records = queue.SimpleQueue()
+    _handler.queue = records
+
+    output = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_logging(level=None):
+    """
+    Route the root logger through a background queue (safe to call more than once)
+
+    Args:
+        level: Root level name or number (default: LOG_LEVEL, else INFO)
+    """
+    global _handler
+    if _handler is not None:
+        return
+
+    root = logging.getLogger()
+    root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO').upper())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    _handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    root.addHandler(_handler)
+    _start_listener()
+
+    # The listener thread does not survive fork() (gunicorn preload) - give each child its own
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_start_listener)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records (called at exit)"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def sample_payloads() -> bool:
+    """Decide once per request whether its payload samples are logged"""
+    return PAYLOAD_SAMPLE_RATE > 0 and random.random() < PAYLOAD_SAMPLE_RATE
+
+
+def log_payload(logger, sampled, label, value, limit=800):
+    """
+    DEBUG-log a truncated JSON dump of value, only for sampled requests
+
+    Args:
+        logger: Logger to write to
+        sampled: Result of sample_payloads() for this request
+        label: Prefix, e.g. "🧾 Image sample"
+        value: Anything json.dumps can handle
+        limit: Max characters of the dump
+    """
+    if sampled and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: %s", label, json.dumps(value, ensure_ascii=False, default=str)[:limit])
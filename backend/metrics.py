@@ -0,0 +1,247 @@
+"""
+metrics.py - in-process counters, gauges and histograms for /metrics
+
+Rendered in the Prometheus text exposition format by render(); /status and
+/cache/stats show a summary of the same numbers. Values are per process - under
+gunicorn with several workers, each worker reports its own (scrape them per
+worker or run WEB_WORKERS=1 to read one set).
+
+    with GEMINI_SECONDS.time(mode='sync'):
+        response = model.generate_content(...)
+    CACHE_REQUESTS.inc(result='hit')
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.type}'
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+
+class Counter(_Metric):
+    """Monotonic count (requests, hits, errors)"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    """Value that goes up and down (in-flight work)"""
+
+    type = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in flight while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Latency distribution in seconds (cumulative buckets + sum + count)"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self, **labels) -> Dict:
+        """{'count', 'avg_ms', 'p50_ms', 'p95_ms'} for one label set (percentiles estimated from buckets)"""
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            series = {'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']} if series else None
+        if not series or not series['count']:
+            return {'count': 0}
+        return {
+            'count': series['count'],
+            'avg_ms': round(series['sum'] / series['count'] * 1000, 1),
+            'p50_ms': self._quantile(series, 0.5),
+            'p95_ms': self._quantile(series, 0.95),
+        }
+
+    def _quantile(self, series, q):
+        rank = q * series['count']
+        lower, below = 0.0, 0
+        for bound, cumulative in zip(self.buckets, series['buckets']):
+            if cumulative >= rank:
+                share = (rank - below) / (cumulative - below) if cumulative > below else 0
+                return round((lower + (bound - lower) * share) * 1000, 1)
+            lower, below = bound, cumulative
+        # Above the largest bucket
+        return round(self.buckets[-1] * 1000, 1)
+
+    def label_sets(self):
+        with self._lock:
+            return [dict(zip(self.labels, key)) for key in sorted(self._values)]
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.type}'
+        with self._lock:
+            items = sorted((key, dict(series, buckets=list(series['buckets']))) for key, series in self._values.items())
+        for key, series in items:
+            for bound, cumulative in zip(self.buckets, series['buckets']):
+                yield f'{self.name}_bucket{_format_labels(self.labels, key, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_bucket{_format_labels(self.labels, key, [("le", "+Inf")])} {series["count"]}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series["sum"])}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {series["count"]}'
+
+
+_REGISTRY = []
+
+
+def _register(metric):
+    _REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    return '\n'.join(line for metric in _REGISTRY for line in metric.render()) + '\n'
+
+
+# ---------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------
+
+SCAN_SECONDS = _register(Histogram('analysis_scan_duration_seconds', 'Whole /analyze scan (cache misses)'))
+SCANS_IN_FLIGHT = _register(Gauge('analysis_scans_in_flight', 'Scans currently running'))
+STAGE_SECONDS = _register(Histogram('analysis_stage_duration_seconds', 'Time per pipeline stage', ('stage',)))
+STAGE_RUNS = _register(Counter('analysis_stage_runs_total', 'Pipeline stage outcomes', ('stage', 'status')))
+STAGES_IN_FLIGHT = _register(Gauge('analysis_stages_in_flight', 'Stages currently running', ('stage',)))
+ANALYZER_ERRORS = _register(Counter('analyzer_errors_total', 'Stages that raised an exception', ('stage',)))
+
+IMAGE_DOWNLOAD_SECONDS = _register(Histogram('image_download_duration_seconds', 'Image downloads', ('source',)))
+IMAGE_DOWNLOAD_ERRORS = _register(Counter('image_download_errors_total', 'Failed image downloads', ('source',)))
+CLIP_ENCODE_SECONDS = _register(Histogram('clip_encode_duration_seconds', 'OpenCLIP image encoding'))
+GEMINI_SECONDS = _register(Histogram('gemini_request_duration_seconds', 'Gemini generate_content calls', ('mode',)))
+GEMINI_IN_FLIGHT = _register(Gauge('gemini_requests_in_flight', 'Gemini calls waiting for a response'))
+
+BATCH_SECONDS = _register(Histogram('analysis_batch_duration_seconds', 'Whole /analyze/batch request'))
+BATCH_LISTINGS = _register(Counter('analysis_batch_listings_total', 'Listings submitted through /analyze/batch'))
+
+CACHE_SECONDS = _register(Histogram('cache_operation_duration_seconds', 'Response cache get / set', ('op',)))
+CACHE_REQUESTS = _register(Counter('cache_requests_total', 'Response cache lookups', ('result',)))
+CACHE_EVICTIONS = _register(Counter('cache_evictions_total', 'Entries dropped (expired or over capacity)', ('cache',)))
+SHOP_CACHE_REQUESTS = _register(Counter('shop_cache_requests_total', 'Shop-level review result lookups', ('result',)))
+
+
+def stage_summary() -> Dict:
+    """Per-stage latency + outcome counts for /status"""
+    summary = {}
+    for labels in STAGE_SECONDS.label_sets():
+        stage = labels['stage']
+        entry = STAGE_SECONDS.summary(stage=stage)
+        for status in ('error', 'timeout'):
+            entry[f'{status}s'] = STAGE_RUNS.value(stage=stage, status=status)
+        summary[stage] = entry
+    return summary
+
+
+def status_summary() -> Dict:
+    """/status 'metrics' block"""
+    return {
+        'scans': SCAN_SECONDS.summary(),
+        'scans_in_flight': SCANS_IN_FLIGHT.value(),
+        'stages': stage_summary(),
+        'gemini': dict(GEMINI_SECONDS.summary(mode='sync'), in_flight=GEMINI_IN_FLIGHT.value()),
+        'gemini_async': GEMINI_SECONDS.summary(mode='async'),
+        'clip_encode': CLIP_ENCODE_SECONDS.summary(),
+        'shop_cache': shop_cache_summary(),
+    }
+
+
+def shop_cache_summary() -> Dict:
+    """Shop cache reuse (hit = review results reused, changed = recomputed because the reviews changed)"""
+    counts = {result: SHOP_CACHE_REQUESTS.value(result=result) for result in ('hit', 'changed', 'miss')}
+    lookups = sum(counts.values())
+    return dict(counts, hit_rate=round(counts['hit'] / lookups, 3) if lookups else None,
+                evictions=CACHE_EVICTIONS.value(cache='shop'))
+
+
+def cache_summary() -> Dict:
+    """/cache/stats 'metrics' block"""
+    hits, misses = CACHE_REQUESTS.value(result='hit'), CACHE_REQUESTS.value(result='miss')
+    return {
+        'hits': hits,
+        'misses': misses,
+        'errors': CACHE_REQUESTS.value(result='error'),
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'evictions': CACHE_EVICTIONS.value(cache='response'),
+        'get': CACHE_SECONDS.summary(op='get'),
+        'set': CACHE_SECONDS.summary(op='set'),
+    }
@@ -0,0 +1,187 @@
+"""
+profiler.py - statistical profiler for /analyze that can be switched on in production
+
+While a profile runs, ITIMER_PROF fires SIGPROF every `interval` seconds of CPU
+time used by the process; the handler records the stack of every thread that is
+currently serving /analyze or running a pipeline stage (see track()); threads
+that are blocked (IDLE_FRAMES) are skipped, so the profile shows CPU. Nothing is
+sampled - and no signal is delivered - when no profile is running. A thread blocked
+inside some other C call (lock acquire, socket read) is attributed to the Python
+frame that made the call.
+
+The output is in the collapsed-stack format ("outer;inner;leaf count" per line)
+read by flamegraph.pl, speedscope and inferno.
+
+Where SIGPROF is not available (Windows, or the app was not created in the main
+thread) a background thread samples on wall-clock time instead.
+
+Profiles are per process: under gunicorn the /admin/profile request starts a
+profile in whichever worker served it.
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+# Innermost frames of a thread that is blocked rather than using CPU (idle pool worker,
+# lock / condition wait, event loop select) - such samples are dropped
+IDLE_FRAMES = {
+    ('thread.py', '_worker'),
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+}
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Collapsed stacks of tracked threads, sampled for a limited time"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.interval = 0.01
+        self.started_at = None
+        self.until = 0.0
+        self.mode = None
+        self._tracked = Counter()  # thread id -> nesting depth
+        # Reentrant: the SIGPROF handler may interrupt start()/stop() in the main thread (Quart)
+        self._lock = threading.RLock()
+        self._signal_ready = False
+
+    # ------------------------------------------------------------------
+    # Which threads are sampled
+    # ------------------------------------------------------------------
+    def enter(self):
+        """Start sampling the current thread (also usable as a thread pool initializer)"""
+        self._tracked[threading.get_ident()] += 1
+
+    def exit(self):
+        ident = threading.get_ident()
+        self._tracked[ident] -= 1
+        if self._tracked[ident] <= 0:
+            del self._tracked[ident]
+
+    @contextmanager
+    def track(self):
+        """Sample the current thread while the block runs"""
+        self.enter()
+        try:
+            yield
+        finally:
+            self.exit()
+
+    # ------------------------------------------------------------------
+    # Sampling
+    # ------------------------------------------------------------------
+    def install(self):
+        """Install the SIGPROF handler (must run in the main thread; no-op elsewhere)"""
+        if self._signal_ready or not hasattr(signal, 'SIGPROF'):
+            return
+        if threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGPROF, self._on_signal)
+        self._signal_ready = True
+
+    @property
+    def running(self) -> bool:
+        # SIGPROF only fires while the process uses CPU, so an idle process may pass
+        # `until` without the handler noticing
+        return self.mode is not None and time.monotonic() < self.until
+
+    def start(self, seconds: float, interval: float = 0.01):
+        """
+        Profile for `seconds` (previous samples are discarded)
+
+        Raises:
+            RuntimeError: A profile is already running
+        """
+        with self._lock:
+            if self.running:
+                raise RuntimeError('A profile is already running')
+            self.stop()
+            self.stacks = Counter()
+            self.samples = 0
+            self.interval = interval
+            self.started_at = time.time()
+            self.until = time.monotonic() + seconds
+            if self._signal_ready:
+                self.mode = 'signal'
+                signal.setitimer(signal.ITIMER_PROF, interval, interval)
+            else:
+                self.mode = 'thread'
+                threading.Thread(target=self._sample_loop, name='profiler', daemon=True).start()
+        logger.info(f"🔬 Profiling /analyze for {seconds}s every {interval * 1000:.0f}ms ({self.mode} sampling)")
+
+    def stop(self):
+        with self._lock:
+            if self.mode == 'signal':
+                signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            if self.mode is not None:
+                logger.info(f"🔬 Profile finished: {self.samples} samples")
+            self.mode = None
+
+    def _on_signal(self, signum, frame):
+        if time.monotonic() >= self.until:
+            self.stop()
+            return
+        self._sample()
+
+    def _sample_loop(self):
+        while self.running:
+            self._sample()
+            time.sleep(self.interval)
+        self.stop()
+
+    def _sample(self):
+        tracked = set(self._tracked)
+        if not tracked:
+            return
+        for ident, frame in sys._current_frames().items():
+            if ident not in tracked:
+                continue
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    # ------------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------------
+    def collapsed(self) -> str:
+        """'frame;frame;frame count' lines, most frequent first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def status(self, top: int = 10) -> Dict:
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return {
+            'running': self.running,
+            'mode': 'signal' if self._signal_ready else 'thread',
+            'started_at': self.started_at,
+            'seconds_left': round(max(0.0, self.until - time.monotonic()), 1) if self.running else 0,
+            'interval_ms': round(self.interval * 1000, 1),
+            'samples': self.samples,
+            'distinct_stacks': len(self.stacks),
+            'top_frames': [{'frame': f, 'samples': n} for f, n in leaves.most_common(top)],
+        }
+
+
+PROFILER = SamplingProfiler()
@@ -4,7 +4,7 @@ Analyzes sentiment of Etsy reviews and compares with star ratings
 """
 
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 from textblob import TextBlob
 
 logger = logging.getLogger(__name__)
@@ -19,12 +19,14 @@ class ReviewSentimentAnalyzer:
         """Initialize the sentiment analyzer"""
         logger.info("✅ ReviewSentimentAnalyzer initialized")
     
-    def analyze_reviews(self, reviews: List[Dict]) -> Dict:
+    def analyze_reviews(self, reviews: List[Dict], scores: Optional[Dict[str, float]] = None) -> Dict:
         """
         Analyze sentiment of all reviews
         
         Args:
             reviews: List of review dicts with 'text' and 'rating' fields
+            scores: Optional text -> polarity memo shared between calls, so a review
+                text repeated across listings (batch scans) is scored once
             
         Returns:
             Dict with sentiment analysis results
@@ -39,80 +41,28 @@ class ReviewSentimentAnalyzer:
                 'message': 'No reviews to analyze'
             }
         
-        logger.info(f"🔍 Analyzing {len(reviews)} reviews...")
+        logger.debug("🔍 Analyzing %d reviews...", len(reviews))
         
-        positive_count = 0
-        negative_count = 0
-        neutral_count = 0
+        accumulator = self.start_stream(scores)
+        accumulator.add_reviews(reviews)
+        result = accumulator.result()
         
-        suspicious_reviews = []
-        total_sentiment = 0
-        analyzed_count = 0
+        # The pipeline's sentiment stage logs the summary at INFO
+        logger.debug("✅ Analysis complete: %s", result['sentiment_counts'])
         
-        for i, review in enumerate(reviews):
-            text = review.get('text', '')
-            rating = review.get('rating')
-            
-            if not text:
-                continue
-            
-            # Analyze sentiment using TextBlob
-            sentiment_score = self._analyze_sentiment(text)
-            total_sentiment += sentiment_score
-            analyzed_count += 1
-            
-            # Categorize sentiment
-            if sentiment_score > 0.1:
-                sentiment_category = 'positive'
-                positive_count += 1
-            elif sentiment_score < -0.1:
-                sentiment_category = 'negative'
-                negative_count += 1
-            else:
-                sentiment_category = 'neutral'
-                neutral_count += 1
-            
-            # Check for mismatch between sentiment and rating
-            is_suspicious = self._is_suspicious_mismatch(sentiment_score, rating)
-            
-            if is_suspicious:
-                suspicious_reviews.append({
-                    'index': i,
-                    'text': text[:100] + ('...' if len(text) > 100 else ''),
-                    'rating': rating,
-                    'sentiment_score': round(sentiment_score, 3),
-                    'sentiment_category': sentiment_category,
-                    'reason': self._get_mismatch_reason(sentiment_score, rating)
-                })
-        
-        avg_sentiment = total_sentiment / analyzed_count if analyzed_count > 0 else 0
-        
-        result = {
-            'total_reviews': len(reviews),
-            'analyzed_reviews': analyzed_count,
-            'sentiment_counts': {
-                'positive': positive_count,
-                'negative': negative_count,
-                'neutral': neutral_count
-            },
-            'sentiment_percentages': {
-                'positive': round(positive_count / analyzed_count * 100, 1) if analyzed_count > 0 else 0,
-                'negative': round(negative_count / analyzed_count * 100, 1) if analyzed_count > 0 else 0,
-                'neutral': round(neutral_count / analyzed_count * 100, 1) if analyzed_count > 0 else 0
-            },
-            'average_sentiment': round(avg_sentiment, 3),
-            'suspicious_reviews': suspicious_reviews,
-            'sentiment_rating_mismatch_count': len(suspicious_reviews),
-            'message': f'Analyzed {analyzed_count} reviews'
-        }
+        return result
+    
+    def start_stream(self, scores: Optional[Dict[str, float]] = None) -> 'SentimentAccumulator':
+        """
+        Start an incremental analysis that accepts reviews page by page
         
-        logger.info(f"✅ Analysis complete:")
-        logger.info(f"   Positive: {positive_count} ({result['sentiment_percentages']['positive']}%)")
-        logger.info(f"   Negative: {negative_count} ({result['sentiment_percentages']['negative']}%)")
-        logger.info(f"   Neutral: {neutral_count} ({result['sentiment_percentages']['neutral']}%)")
-        logger.info(f"   Suspicious: {len(suspicious_reviews)}")
+        Args:
+            scores: Optional text -> polarity memo (see analyze_reviews)
         
-        return result
+        Returns:
+            SentimentAccumulator whose result() matches analyze_reviews()
+        """
+        return SentimentAccumulator(self, scores)
     
     def _analyze_sentiment(self, text: str) -> float:
         """
@@ -183,6 +133,91 @@ class ReviewSentimentAnalyzer:
             return f"Rating-sentiment mismatch: {rating} stars, {sentiment_score:.2f} sentiment"
 
 
+class SentimentAccumulator:
+    """
+    Running sentiment totals for reviews that arrive in pages
+    Only counters and the suspicious-review summaries are kept, never the full texts
+    """
+    
+    def __init__(self, analyzer: ReviewSentimentAnalyzer, scores: Optional[Dict[str, float]] = None):
+        self.analyzer = analyzer
+        self.scores = scores
+        self.total_reviews = 0
+        self.analyzed_count = 0
+        self.positive_count = 0
+        self.negative_count = 0
+        self.neutral_count = 0
+        self.total_sentiment = 0
+        self.suspicious_reviews = []
+    
+    def add_reviews(self, reviews: List[Dict]) -> None:
+        """Score one page of reviews and fold it into the running totals"""
+        for review in reviews:
+            i = self.total_reviews
+            self.total_reviews += 1
+            
+            text = review.get('text', '')
+            rating = review.get('rating')
+            
+            if not text:
+                continue
+            
+            # Analyze sentiment using TextBlob
+            sentiment_score = self.scores.get(text) if self.scores is not None else None
+            if sentiment_score is None:
+                sentiment_score = self.analyzer._analyze_sentiment(text)
+                if self.scores is not None:
+                    self.scores[text] = sentiment_score
+            self.total_sentiment += sentiment_score
+            self.analyzed_count += 1
+            
+            # Categorize sentiment
+            if sentiment_score > 0.1:
+                sentiment_category = 'positive'
+                self.positive_count += 1
+            elif sentiment_score < -0.1:
+                sentiment_category = 'negative'
+                self.negative_count += 1
+            else:
+                sentiment_category = 'neutral'
+                self.neutral_count += 1
+            
+            # Check for mismatch between sentiment and rating
+            if self.analyzer._is_suspicious_mismatch(sentiment_score, rating):
+                self.suspicious_reviews.append({
+                    'index': i,
+                    'text': text[:100] + ('...' if len(text) > 100 else ''),
+                    'rating': rating,
+                    'sentiment_score': round(sentiment_score, 3),
+                    'sentiment_category': sentiment_category,
+                    'reason': self.analyzer._get_mismatch_reason(sentiment_score, rating)
+                })
+    
+    def result(self) -> Dict:
+        """Build the same result dict as ReviewSentimentAnalyzer.analyze_reviews()"""
+        analyzed_count = self.analyzed_count
+        avg_sentiment = self.total_sentiment / analyzed_count if analyzed_count > 0 else 0
+        
+        return {
+            'total_reviews': self.total_reviews,
+            'analyzed_reviews': analyzed_count,
+            'sentiment_counts': {
+                'positive': self.positive_count,
+                'negative': self.negative_count,
+                'neutral': self.neutral_count
+            },
+            'sentiment_percentages': {
+                'positive': round(self.positive_count / analyzed_count * 100, 1) if analyzed_count > 0 else 0,
+                'negative': round(self.negative_count / analyzed_count * 100, 1) if analyzed_count > 0 else 0,
+                'neutral': round(self.neutral_count / analyzed_count * 100, 1) if analyzed_count > 0 else 0
+            },
+            'average_sentiment': round(avg_sentiment, 3),
+            'suspicious_reviews': self.suspicious_reviews,
+            'sentiment_rating_mismatch_count': len(self.suspicious_reviews),
+            'message': f'Analyzed {analyzed_count} reviews'
+        }
+
+
 # Test function
 def main():
     """Test the sentiment analyzer"""
@@ -0,0 +1,391 @@
+"""
+risk_rules.py - the thresholds and points ListingRiskCalculator scores with
+
+The rules live in a JSON file (risk_rules.json next to this module, or
+RISK_RULES_FILE) and are compiled once into threshold arrays and lookup tables:
+
+    bands   one feature against sorted thresholds ("below" or "at_least") - a
+            bisect / np.searchsorted picks the points and the warning
+    tiers   first matching tier of conditions ("all" / "any" of
+            [feature, op, value], or a bare feature name for "is truthy")
+    scaled  value * per, capped at max, once the value is above a floor
+
+plus the risk level bands. Both calculate_risk() and calculate_risk_batch()
+evaluate the same compiled rules. Warnings are str.format templates over the
+component's values (feature names, plus the extras in WARNING_FIELDS).
+
+RiskRulesSource re-reads the file when its mtime changes (checked at most every
+RISK_RULES_CHECK_SECONDS), so every worker picks up a tuning change without a
+restart. A file that fails to compile is logged and the previous rules stay.
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import operator
+import threading
+from bisect import bisect_right
+from string import Formatter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'risk_rules.json')
+
+# Columns the rules (and calculate_risk_batch()) read, with the value used when a column
+# is not given. NaN means "not reported" (the scalar path's None / missing key).
+RISK_FEATURES = {
+    'review_count': 0,                 # len(reviews)
+    'reviews_with_photos': 0,
+    'burst_score': np.nan,             # ReviewBurstDetector score, NaN when not analyzed
+    'seller_age_months': np.nan,
+    'sales_count': np.nan,
+    'listing_age_days': np.nan,
+    'clip_analyzed': False,
+    'clip_verified': False,
+    'clip_avg_match': 0.0,
+    'sentiment_analyzed': False,
+    'suspicious_count': 0,
+    'average_sentiment': 0.0,
+    'positive_pct': 0.0,
+    'ai_detected': False,
+    'ai_confidence': 0.0,              # not scored, kept for threshold calibration
+    'duplicates_analyzed': False,
+    'duplicate_count': 0,
+    'duplicate_ratio': 0.0,
+    'largest_duplicate_group': 0,
+    'image_reuse_analyzed': False,
+    'images_reused': 0,
+    'other_seller_count': 0,
+}
+
+# Values warnings can show besides the features
+WARNING_FIELDS = ('burst_share', 'burst_window_days', 'burst_start', 'clip_high_matches', 'duplicate_groups')
+
+# Rules calculate_risk() looks up - a rule file must define all of them
+RULE_NAMES = (
+    'reviews.none', 'reviews.count', 'reviews.burst',
+    'seller.age_months', 'seller.sales', 'seller.listing_age_days',
+    'review_photos.clip', 'review_photos.count',
+    'sentiment.suspicious', 'sentiment.positivity', 'sentiment.enthusiasm',
+    'ai_images', 'duplicate_reviews', 'image_reuse',
+)
+
+OPERATORS = {
+    '<': (operator.lt, np.less),
+    '<=': (operator.le, np.less_equal),
+    '>': (operator.gt, np.greater),
+    '>=': (operator.ge, np.greater_equal),
+    '==': (operator.eq, np.equal),
+    '!=': (operator.ne, np.not_equal),
+}
+
+
+class RiskRulesError(ValueError):
+    """A rule file that does not compile"""
+
+
+def _check_warning(name: str, template: Optional[str]) -> Optional[str]:
+    if template is None:
+        return None
+    if not isinstance(template, str):
+        raise RiskRulesError(f"{name}: warning must be a string")
+    for _, field, _, _ in Formatter().parse(template):
+        if field is not None and field not in RISK_FEATURES and field not in WARNING_FIELDS:
+            raise RiskRulesError(f"{name}: unknown field {{{field}}} in warning")
+    return template
+
+
+def _check_points(name: str, points):
+    if isinstance(points, bool) or not isinstance(points, (int, float)):
+        raise RiskRulesError(f"{name}: points must be a number")
+    return points
+
+
+def _check_feature(name: str, feature):
+    if feature not in RISK_FEATURES:
+        raise RiskRulesError(f"{name}: unknown feature {feature!r}")
+    return feature
+
+
+def _outcome(name: str, spec) -> tuple:
+    """(points, warning) of an "else" / constant rule"""
+    spec = spec or {}
+    return _check_points(name, spec.get('points', 0)), _check_warning(name, spec.get('warning'))
+
+
+class BandRule:
+    """One feature against sorted thresholds; NaN matches no band (the else outcome)"""
+
+    def __init__(self, name: str, spec: Dict):
+        self.name = name
+        self.feature = _check_feature(name, spec.get('feature'))
+        direction = 'below' if 'below' in spec else 'at_least'
+        bands = spec.get(direction)
+        if not bands or not isinstance(bands, list):
+            raise RiskRulesError(f"{name}: bands need a non-empty 'below' or 'at_least' list")
+
+        thresholds = [_check_points(name, band.get('threshold')) for band in bands]
+        outcomes = [(_check_points(name, band.get('points', 0)), _check_warning(name, band.get('warning')))
+                    for band in bands]
+        fallback = _outcome(name, spec.get('else'))
+
+        # "below" bands are listed ascending (first match = lowest threshold), "at_least"
+        # descending; either way the edges end up ascending for bisect
+        if direction == 'at_least':
+            thresholds, outcomes = thresholds[::-1], outcomes[::-1]
+            outcomes = [fallback] + outcomes
+            self.nan_index = 0
+        else:
+            outcomes = outcomes + [fallback]
+            self.nan_index = len(thresholds)
+        if any(a >= b for a, b in zip(thresholds, thresholds[1:])):
+            raise RiskRulesError(f"{name}: thresholds must be strictly {'de' if direction == 'at_least' else 'in'}creasing")
+
+        self.edges = thresholds
+        self.outcomes = outcomes
+        self._edges = np.array(thresholds, dtype=float)
+        self._points = np.array([points for points, _ in outcomes], dtype=float)
+
+    def pick(self, values: Dict) -> tuple:
+        value = values[self.feature]
+        if value != value:  # NaN
+            return self.outcomes[self.nan_index]
+        return self.outcomes[bisect_right(self.edges, value)]
+
+    def points(self, columns: Dict) -> np.ndarray:
+        values = columns[self.feature]
+        index = np.searchsorted(self._edges, values, side='right')
+        return self._points[np.where(np.isnan(values), self.nan_index, index)]
+
+
+class TierRule:
+    """First tier whose conditions hold; conditions short-circuit like `and` / `or`"""
+
+    def __init__(self, name: str, spec: Dict):
+        self.name = name
+        tiers = spec.get('tiers')
+        if not tiers or not isinstance(tiers, list):
+            raise RiskRulesError(f"{name}: 'tiers' must be a non-empty list")
+        self.tiers = []
+        for tier in tiers:
+            mode = 'all' if 'all' in tier else 'any'
+            conditions = tier.get(mode)
+            if not conditions or not isinstance(conditions, list):
+                raise RiskRulesError(f"{name}: each tier needs a non-empty 'all' or 'any' list")
+            self.tiers.append((mode, [self._condition(c) for c in conditions],
+                               (_check_points(name, tier.get('points', 0)), _check_warning(name, tier.get('warning')))))
+        self.fallback = _outcome(name, spec.get('else'))
+
+    def _condition(self, condition) -> tuple:
+        if isinstance(condition, str):
+            return _check_feature(self.name, condition), None, None
+        if not isinstance(condition, list) or len(condition) != 3 or condition[1] not in OPERATORS:
+            raise RiskRulesError(f"{self.name}: condition must be a feature name or [feature, op, value], "
+                                 f"op one of {', '.join(OPERATORS)}")
+        feature, op, value = condition
+        return _check_feature(self.name, feature), OPERATORS[op], _check_points(self.name, value)
+
+    def pick(self, values: Dict) -> tuple:
+        for mode, conditions, outcome in self.tiers:
+            if mode == 'all':
+                for feature, op, value in conditions:
+                    if not (values[feature] if op is None else op[0](values[feature], value)):
+                        break
+                else:
+                    return outcome
+            else:
+                for feature, op, value in conditions:
+                    if values[feature] if op is None else op[0](values[feature], value):
+                        return outcome
+        return self.fallback
+
+    def points(self, columns: Dict) -> np.ndarray:
+        matches = []
+        for mode, conditions, _ in self.tiers:
+            held = [np.asarray(columns[feature], dtype=bool) if op is None else op[1](columns[feature], value)
+                    for feature, op, value in conditions]
+            matches.append((np.logical_and if mode == 'all' else np.logical_or).reduce(held))
+        return np.select(matches, [outcome[0] for _, _, outcome in self.tiers], self.fallback[0]).astype(float)
+
+
+class ScaledRule:
+    """min(value * per, max) points once the value is above `above`"""
+
+    def __init__(self, name: str, spec: Dict):
+        self.name = name
+        self.feature = _check_feature(name, spec.get('feature'))
+        self.above = _check_points(name, spec.get('above', 0))
+        self.per = _check_points(name, spec.get('per'))
+        self.max = _check_points(name, spec.get('max', math.inf))
+        self.warning = _check_warning(name, spec.get('warning'))
+
+    def pick(self, values: Dict) -> tuple:
+        value = values[self.feature]
+        if value > self.above:
+            return min(value * self.per, self.max), self.warning
+        return 0, None
+
+    def points(self, columns: Dict) -> np.ndarray:
+        values = columns[self.feature]
+        return np.where(values > self.above, np.minimum(values * self.per, self.max), 0).astype(float)
+
+
+class ConstantRule:
+    """Fixed points (and warning) for a case the calculator detects itself"""
+
+    def __init__(self, name: str, spec: Dict):
+        self.name = name
+        self.outcome = _outcome(name, spec)
+
+    def pick(self, values: Dict) -> tuple:
+        return self.outcome
+
+    def points(self, columns: Dict) -> np.ndarray:
+        n = len(next(iter(columns.values()))) if columns else 0
+        return np.full(n, float(self.outcome[0]))
+
+
+def _compile_rule(name: str, spec) -> object:
+    if not isinstance(spec, dict):
+        raise RiskRulesError(f"{name}: rule must be an object")
+    if 'tiers' in spec:
+        return TierRule(name, spec)
+    if 'below' in spec or 'at_least' in spec:
+        return BandRule(name, spec)
+    if 'per' in spec:
+        return ScaledRule(name, spec)
+    return ConstantRule(name, spec)
+
+
+class RiskRules:
+    """A compiled rule file: rules by name plus the level bands"""
+
+    def __init__(self, raw: Dict, source: str = None):
+        """
+        Args:
+            raw: Parsed rule file ({"version", "levels", "rules"})
+            source: Where it came from, for logs
+
+        Raises:
+            RiskRulesError: If the file is incomplete or a rule does not compile
+        """
+        if not isinstance(raw, dict):
+            raise RiskRulesError("rule file must be a JSON object")
+        self.version = str(raw.get('version', 'unversioned'))
+        self.source = source
+
+        rules = raw.get('rules') or {}
+        missing = [name for name in RULE_NAMES if name not in rules]
+        if missing:
+            raise RiskRulesError(f"missing rules: {', '.join(missing)}")
+        self.rules = {name: _compile_rule(name, spec) for name, spec in rules.items()}
+
+        levels = raw.get('levels')
+        if not levels or not isinstance(levels, list):
+            raise RiskRulesError("'levels' must be a non-empty list")
+        edges = [_check_points('levels', level.get('below')) for level in levels[:-1]]
+        if any(a >= b for a, b in zip(edges, edges[1:])):
+            raise RiskRulesError("levels: 'below' must be strictly increasing")
+        self.level_edges = edges
+        self.levels = [str(level.get('name')) for level in levels]
+        self.level_colors = [str(level.get('color')) for level in levels]
+        self.recommendations = [str(level.get('recommendation')) for level in levels]
+        self._level_edges = np.array(edges, dtype=float)
+
+    def __getitem__(self, name: str):
+        return self.rules[name]
+
+    def band(self, score: float) -> int:
+        """Index into levels / level_colors / recommendations for a 0-100 score"""
+        return bisect_right(self.level_edges, score)
+
+    def bands(self, scores: np.ndarray) -> np.ndarray:
+        return np.digitize(scores, self._level_edges)
+
+
+def load_rules(path: str) -> RiskRules:
+    """Read and compile a rule file (raises RiskRulesError / OSError)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            raw = json.load(f)
+        except json.JSONDecodeError as e:
+            raise RiskRulesError(f"invalid JSON: {e}") from e
+    return RiskRules(raw, source=path)
+
+
+class RiskRulesSource:
+    """The current rules of a file, recompiled when the file changes"""
+
+    def __init__(self, path: str = None, check_interval: float = None):
+        """
+        Args:
+            path: Rule file (default RISK_RULES_FILE, else the bundled risk_rules.json)
+            check_interval: Seconds between mtime checks (default RISK_RULES_CHECK_SECONDS,
+                5); 0 = never reload
+
+        Raises:
+            RiskRulesError, OSError: If the file cannot be loaded at startup
+        """
+        self.path = path or os.getenv('RISK_RULES_FILE') or DEFAULT_RULES_FILE
+        if check_interval is None:
+            check_interval = float(os.getenv('RISK_RULES_CHECK_SECONDS', 5))
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._rules = load_rules(self.path)
+        self._next_check = time.monotonic() + check_interval
+        logger.info(f"✅ Risk rules {self._rules.version} loaded from {self.path}")
+
+    def get(self) -> RiskRules:
+        """The compiled rules (re-reads the file first if it changed since the last check)"""
+        if self.check_interval > 0 and time.monotonic() >= self._next_check:
+            self._maybe_reload()
+        return self._rules
+
+    def _maybe_reload(self):
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if self.last_error != str(e):
+                    logger.error(f"❌ Risk rules file unavailable, keeping {self._rules.version}: {e}")
+                    self.last_error = str(e)
+                return
+            if mtime == self._mtime:
+                return
+            # Remember the mtime even on failure, so a broken file is reported once, not every check
+            self._mtime = mtime
+            try:
+                rules = load_rules(self.path)
+            except (RiskRulesError, OSError) as e:
+                logger.error(f"❌ Risk rules in {self.path} rejected, keeping {self._rules.version}: {e}")
+                self.last_error = str(e)
+                return
+            self._rules = rules
+            self.reloads += 1
+            self.last_error = None
+            logger.info(f"✅ Risk rules reloaded: {rules.version} from {self.path}")
+
+    def status(self) -> Dict:
+        return {'path': self.path, 'version': self._rules.version, 'reloads': self.reloads,
+                'last_error': self.last_error}
+
+
+class StaticRiskRules:
+    """RiskRulesSource stand-in for rules that never change (a compiled RiskRules)"""
+
+    def __init__(self, rules: RiskRules):
+        self._rules = rules
+
+    def get(self) -> RiskRules:
+        return self._rules
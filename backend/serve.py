@@ -0,0 +1,89 @@
+"""
+serve.py - production launcher for the Flask app
+
+Uses gunicorn (preforked workers x threads, models preloaded before the fork,
+settings from gunicorn.conf.py). gunicorn does not run on Windows, so there it
+falls back to waitress: one process, a thread pool, same app.
+
+Usage:
+    python serve.py
+    python serve.py --workers 4 --threads 8 --port 5000
+    python serve.py --server waitress
+"""
+
+import argparse
+import os
+import signal
+import sys
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the analysis API with a production server')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', 2)),
+                        help='Worker processes (gunicorn only)')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', 8)),
+                        help='Threads per worker')
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('WEB_TIMEOUT', 120)),
+                        help='Request timeout in seconds')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress'], default='auto')
+    return parser.parse_args()
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import Application
+
+    class GunicornServer(Application):
+        """gunicorn with gunicorn.conf.py + command line overrides"""
+
+        def load_config(self):
+            self.load_config_from_file(CONFIG_FILE)
+            self.cfg.set('bind', [f'{args.host}:{args.port}'])
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('timeout', args.timeout)
+
+        def load(self):
+            from app import app
+            return app
+
+    GunicornServer().run()
+
+
+def run_waitress(args):
+    from waitress import create_server
+    from app import app, flush_indexes
+
+    server = create_server(app, host=args.host, port=args.port, threads=args.threads,
+                           channel_timeout=args.timeout)
+
+    def stop(signum, frame):
+        print(f"\n🛑 Signal {signum} received, shutting down...")
+        server.close()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f"🚀 waitress serving on http://{args.host}:{args.port} ({args.threads} threads)")
+    try:
+        server.run()
+    except OSError:
+        # asyncore loop raises once the listening socket is closed
+        pass
+    finally:
+        flush_indexes()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = args.server
+    if server == 'auto':
+        server = 'waitress' if sys.platform == 'win32' else 'gunicorn'
+
+    if server == 'gunicorn':
+        run_gunicorn(args)
+    else:
+        run_waitress(args)
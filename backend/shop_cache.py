@@ -0,0 +1,175 @@
+"""
+shop_cache.py - shop-level analysis cache keyed by Etsy shop_id
+
+Browsing several listings of one shop sends the same (usually shop-wide) deep-dive
+review set with every listing. ShopCache keeps one entry per shop_id (the id
+content.js sends in data.reviewDebug) with:
+
+    seller        - latest seller stats seen on the shop's listing pages
+    review_stats  - review count and review-photo stats
+    results       - review-derived stage outputs (sentiment, duplicates)
+
+The review results are only reused for the exact review set they were computed
+from (same reviews, same order - see review_fingerprint). When new reviews appear
+the next scan recomputes them and replaces the entry.
+
+The cache is in memory and per process (each gunicorn worker has its own),
+bounded by max_shops (least recently used shops are dropped) and ttl.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from metrics import SHOP_CACHE_REQUESTS, CACHE_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+# Shop-level listing fields worth carrying over to listing pages that lack them
+SELLER_FIELDS = ('sellerName', 'sellerAgeMonths', 'salesCount')
+
+
+def shop_id_of(data: Dict) -> Optional[str]:
+    """shop_id from an extension payload (data.reviewDebug.shop_id), None if missing"""
+    listing_data = data.get('data') if isinstance(data.get('data'), dict) else {}
+    shop_id = (listing_data.get('reviewDebug') or {}).get('shop_id')
+    return str(shop_id) if shop_id not in (None, '') else None
+
+
+def _review_key(review: Dict) -> Optional[bytes]:
+    """Short digest identifying one review (None if it has neither transactionId nor text)"""
+    ident = review.get('transactionId')
+    if ident is None:
+        # Same fallback id content.js dedupes deep-dive pages with
+        if not review.get('text'):
+            return None
+        ident = f"{review.get('buyerProfileUrl') or ''}|{review.get('date') or ''}|{review.get('text')}"
+    raw = f"{ident}|{review.get('rating')}|{review.get('date')}"
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).digest()
+
+
+def review_fingerprint(reviews: List[Dict]) -> Tuple[Optional[str], frozenset]:
+    """
+    Identify a review set
+
+    Returns:
+        (fingerprint of the reviews in order, frozenset of per-review keys);
+        (None, frozenset()) when there are no reviews or one cannot be identified
+    """
+    keys = [_review_key(r) for r in reviews or [] if isinstance(r, dict)]
+    if not keys or None in keys or len(keys) != len(reviews):
+        return None, frozenset()
+    return hashlib.blake2b(b''.join(keys), digest_size=16).hexdigest(), frozenset(keys)
+
+
+def review_photo_stats(reviews: List[Dict]) -> Dict:
+    """Review count and review-photo counts (same photo test as the parse stage)"""
+    with_photos = [r for r in reviews if r.get('images')]
+    return {
+        'review_count': len(reviews),
+        'reviews_with_photos': len(with_photos),
+        'review_photos': sum(len(r['images']) for r in with_photos),
+        'photo_share': round(len(with_photos) / len(reviews) * 100, 1) if reviews else 0,
+    }
+
+
+class ShopCache:
+    """LRU + TTL map shop_id -> shop-level aggregate (entries are treated as read-only)"""
+
+    def __init__(self, max_shops: int = 512, ttl: float = 3600):
+        """
+        Args:
+            max_shops: Shops kept in memory (least recently used dropped first)
+            ttl: Seconds an entry is used for (seller stats and reviews go stale)
+        """
+        self.max_shops = max_shops
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        logger.info(f"✅ ShopCache initialized: {max_shops} shops, {ttl:.0f}s TTL")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, shop_id: str) -> Optional[Dict]:
+        """Live entry for a shop (caller holds the lock); expired entries are dropped"""
+        entry = self._entries.get(shop_id)
+        if entry is None:
+            return None
+        if self.ttl and time.monotonic() - entry['stored'] > self.ttl:
+            del self._entries[shop_id]
+            CACHE_EVICTIONS.inc(cache='shop')
+            return None
+        self._entries.move_to_end(shop_id)
+        return entry
+
+    def lookup(self, shop_id: str, fingerprint: Optional[str]) -> Tuple[Optional[Dict], str]:
+        """
+        Entry for a shop and whether its review results match this review set
+
+        Returns:
+            (entry or None, 'hit' | 'changed' | 'miss') - 'changed' means the shop is
+            cached but its reviews differ (e.g. new reviews appeared)
+        """
+        with self._lock:
+            entry = self._get(shop_id)
+        if entry is None:
+            result = 'miss'
+        elif fingerprint and entry['fingerprint'] == fingerprint and entry['results']:
+            result = 'hit'
+        elif fingerprint and entry['fingerprint']:
+            result = 'changed'
+        else:
+            result = 'miss'
+        SHOP_CACHE_REQUESTS.inc(result=result)
+        return entry, result
+
+    def update(self, shop_id: str, seller: Dict, reviews: List[Dict] = None, results: Dict = None) -> Dict:
+        """
+        Record what a scan of one of the shop's listings saw
+
+        Args:
+            shop_id: Shop the listing belongs to
+            seller: SELLER_FIELDS values from the listing page (None values are ignored)
+            reviews: The listing's reviews, when results were computed from them
+            results: Review-derived stage outputs for those reviews (e.g. sentiment, duplicates)
+
+        Returns:
+            The stored entry
+        """
+        fingerprint, keys = review_fingerprint(reviews) if results else (None, frozenset())
+        with self._lock:
+            old = self._get(shop_id)
+            entry = dict(old) if old else {
+                'shop_id': shop_id, 'seller': {}, 'fingerprint': None, 'review_keys': frozenset(),
+                'review_stats': None, 'results': {}, 'scans': 0,
+            }
+            entry['seller'] = dict(entry['seller'], **{k: v for k, v in seller.items() if v is not None})
+            entry['scans'] += 1
+            if fingerprint and fingerprint == entry['fingerprint']:
+                entry['results'] = dict(entry['results'], **results)
+            # A listing-scoped review page (a strict subset) must not replace the shop-wide set
+            elif fingerprint and not keys < entry['review_keys']:
+                entry.update({
+                    'fingerprint': fingerprint,
+                    'review_keys': keys,
+                    'review_stats': review_photo_stats(reviews),
+                    'results': dict(results),
+                })
+            entry['stored'] = time.monotonic()
+            entry['updated_at'] = datetime.now().isoformat()
+
+            self._entries[shop_id] = entry
+            self._entries.move_to_end(shop_id)
+            while len(self._entries) > self.max_shops:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.inc(cache='shop')
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
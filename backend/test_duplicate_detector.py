@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Checks for the near-duplicate review detector
+
+- copy-pasted reviews with small edits end up in one group
+- malformed reviews (non-string text, non-dict entries) are skipped instead of
+  failing the whole duplicate stage
+
+Run with pytest, or directly: python test_duplicate_detector.py
+"""
+
+import logging
+
+from analyzers.duplicate_detector import DuplicateReviewDetector
+
+logging.disable(logging.CRITICAL)
+
+FAKE = "Absolutely love this necklace, the quality is amazing and shipping was fast!"
+
+
+def test_groups_near_duplicates():
+    reviews = [{'text': FAKE}, {'text': FAKE.replace('amazing', 'great')}, {'text': FAKE + '!!'},
+               {'text': "Arrived broken, the seller never answered my messages about a refund."}]
+    result = DuplicateReviewDetector().find_duplicates(reviews)
+    assert result['analyzed']
+    assert result['duplicate_group_count'] == 1
+    assert result['duplicate_groups'][0]['review_indices'] == [0, 1, 2]
+
+
+def test_malformed_reviews_are_skipped():
+    reviews = [{'text': FAKE}, {'text': 12345}, {'text': None}, {'text': ['not', 'text']}, {'rating': 5},
+               'not a review', {'text': 1.5e30}, {'text': FAKE.replace('fast', 'quick')}]
+    result = DuplicateReviewDetector().find_duplicates(reviews)
+    assert result['analyzed']
+    assert result['total_reviews'] == len(reviews)
+    assert result['reviews_checked'] == 2
+    assert result['duplicate_groups'][0]['review_indices'] == [0, 7]
+
+    # Same through the page-by-page accumulator
+    stream = DuplicateReviewDetector().start_stream()
+    stream.add_reviews(reviews[:4])
+    stream.add_reviews(reviews[4:])
+    assert stream.result()['duplicate_groups'][0]['review_indices'] == [0, 7]
+
+
+if __name__ == '__main__':
+    for test in (test_groups_near_duplicates, test_malformed_reviews_are_skipped):
+        test()
+        print(f"✓ {test.__name__}")
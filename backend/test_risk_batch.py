@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Equivalence checks for the risk calculator
+
+- calculate_risk_batch() must give the same score, level, color, recommendation and
+  breakdown as calculate_risk() for every listing, including malformed input
+  ('<component>_error' flags) and NaN feature columns
+- the bundled risk_rules.json must score exactly like the thresholds that were
+  hard-coded in ListingRiskCalculator before the rule table (legacy_risk below)
+
+Run with pytest, or directly: python test_risk_batch.py
+"""
+
+import logging
+import math
+import random
+
+import numpy as np
+
+from listing_risk_calculator import ListingRiskCalculator, RISK_COMPONENTS, RISK_FEATURES
+
+logging.disable(logging.CRITICAL)
+
+FUZZ_LISTINGS = 5000
+NAN = float('nan')
+
+
+# =====================================================================
+# Fuzzed calculate_risk() inputs
+# =====================================================================
+
+def maybe(rng, value, p=0.15, junk=('x', None, NAN)):
+    """value, or now and then something malformed"""
+    return rng.choice(junk) if rng.random() < p / 2 else value
+
+
+def random_review(rng):
+    roll = rng.random()
+    if roll < 0.85:
+        day = f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+    elif roll < 0.9:
+        day = rng.choice([NAN, math.inf, 1e300, -1, 1704412800, 1704412800000])
+    else:
+        day = None
+    return {'text': 't', 'rating': 5, 'date': day, 'images': ['u'] if rng.random() < 0.3 else []}
+
+
+def random_listing(rng):
+    """One calculate_risk() input: threshold-edge values, missing blocks, junk values"""
+    reviews = [random_review(rng) for _ in range(rng.choice([0, 1, 3, 4, 5, 6, 9, 10, 12, 16, 30]))]
+    if rng.random() < 0.3:
+        # Review burst
+        for r in reviews:
+            r['date'] = f'2024-05-0{rng.randint(1, 3)}'
+    if reviews and rng.random() < 0.03:
+        reviews.append('x')
+    listing_data = {'reviews': reviews if rng.random() > 0.05 else rng.choice([None, []])}
+    # Seller fields arrive as JSON (NaN is sent as null): a NaN column means "not reported"
+    for key, values in (('sellerAgeMonths', [1, 5, 6, 11, 12, 23, 24, 100]),
+                        ('salesCount', [0, 9, 10, 49, 50, 99, 100, 5000]),
+                        ('listingAgeDays', [0, 2, 3, 50])):
+        if rng.random() < 0.85:
+            listing_data[key] = maybe(rng, rng.choice(values), junk=('x', None))
+
+    results = {}
+    if rng.random() < 0.8:
+        results['sentiment'] = rng.choice([{}, None, {
+            'sentiment_rating_mismatch_count': maybe(rng, rng.choice([0, 1, 2, 3, 5])),
+            'average_sentiment': rng.choice([0.1, 0.7, 0.71, 0.9]),
+            'sentiment_percentages': maybe(rng, {'positive': rng.choice([50, 95, 95.5, 100])}),
+        }])
+    if rng.random() < 0.8:
+        results['synthid'] = {'any_ai': rng.random() < 0.5,
+                              'results': [{'confidence': rng.choice([10, 80, None, 'x'])}]}
+    if rng.random() < 0.7:
+        results['image_similarity'] = {
+            'analyzed': rng.random() < 0.8,
+            'verified_authentic': rng.random() < 0.5,
+            'average_match_score': maybe(rng, rng.choice([0, 29.9, 30, 49.9, 50, 59.9, 60, 69.9, 70, 90.0])),
+        }
+    if rng.random() < 0.7:
+        results['duplicates'] = {
+            'analyzed': rng.random() < 0.8,
+            'duplicate_review_count': maybe(rng, rng.choice([0, 1, 2, 3, 4, 9])),
+            'duplicate_ratio': rng.choice([0, 0.05, 0.1, 0.19, 0.2, 0.5]),
+            'largest_group_size': rng.choice([0, 2, 4, 5]),
+        }
+    if rng.random() < 0.7:
+        results['image_reuse'] = {
+            'analyzed': rng.random() < 0.8,
+            'images_reused_by_other_sellers': maybe(rng, rng.choice([0, 1, 2, 3])),
+            'other_seller_count': rng.choice([0, 1, 2, 3, 4]),
+        }
+    return {'data': listing_data, 'results': results}
+
+
+def fuzz_listings(seed=0, count=FUZZ_LISTINGS):
+    rng = random.Random(seed)
+    return [random_listing(rng) for _ in range(count)]
+
+
+# =====================================================================
+# Pre rule-table scoring (the thresholds hard-coded before risk_rules.json)
+# =====================================================================
+
+LEGACY_LEVEL_EDGES = [20, 40, 60, 80]
+LEGACY_LEVELS = ["VERY LOW", "LOW", "MEDIUM", "HIGH", "VERY HIGH"]
+
+
+def _photos(reviews):
+    return sum(1 for r in reviews if r.get('images') and len(r.get('images', [])) > 0)
+
+
+def legacy_risk(calc, data):
+    """Score and breakdown as the hard-coded calculator computed them (a raising component scores 0)"""
+    listing_data = data.get('data', {})
+    reviews = listing_data.get('reviews', [])
+    results = data.get('results', {})
+
+    def review_points():
+        if not reviews:
+            return 15
+        points = 10 if len(reviews) < 5 else 5 if len(reviews) < 10 else 0
+        dates = [r.get('date') for r in reviews if r.get('date')]
+        if dates:
+            clustering = calc.burst_detector.analyze(dates)
+            if clustering['analyzed']:
+                burst = clustering['burst_score']
+                points += 10 if burst >= 60 else 5 if burst >= 35 else 0
+        return points
+
+    def seller_points():
+        points = 0
+        age, sales, listing_age = (listing_data.get(k) for k in ('sellerAgeMonths', 'salesCount', 'listingAgeDays'))
+        if age is not None:
+            points += 12 if age < 6 else 8 if age < 12 else 4 if age < 24 else 0
+        if sales is not None:
+            points += 10 if sales < 10 else 5 if sales < 50 else 0
+        if listing_age is not None and listing_age < 3:
+            points += 3
+        return points
+
+    def photo_points():
+        if not reviews:
+            return 0
+        with_photos = _photos(reviews)
+        clip = results.get('image_similarity', {})
+        if clip and clip.get('analyzed'):
+            verified, avg = clip.get('verified_authentic', False), clip.get('average_match_score', 0)
+            if verified and avg >= 70:
+                return -20
+            if verified and avg >= 60:
+                return -15
+            return -10 if avg >= 50 else 5 if avg >= 30 else 15
+        return -15 if with_photos >= 5 else -10 if with_photos >= 3 else -5 if with_photos >= 1 else 15
+
+    def sentiment_points():
+        sentiment = results.get('sentiment', {})
+        if not sentiment or not reviews:
+            return 0
+        suspicious = sentiment.get('sentiment_rating_mismatch_count', 0)
+        positive = sentiment.get('sentiment_percentages', {}).get('positive', 0)
+        points = min(suspicious * 5, 15) if suspicious > 0 else 0
+        if positive > 95 and len(reviews) > 10:
+            points += 5
+        if sentiment.get('average_sentiment', 0) > 0.7 and len(reviews) > 15:
+            points += 3
+        return points
+
+    def ai_points():
+        synthid = results.get('synthid', {})
+        if not synthid or not synthid.get('any_ai', False):
+            return 0
+        with_photos = _photos(reviews)
+        age, sales = listing_data.get('sellerAgeMonths', 0), listing_data.get('salesCount', 0)
+        if with_photos >= 3 and age >= 12 and sales >= 100:
+            return 2
+        if with_photos == 0 and age < 6:
+            return 10
+        return 5
+
+    def duplicate_points():
+        duplicates = results.get('duplicates', {})
+        if not duplicates or not duplicates.get('analyzed'):
+            return 0
+        count = duplicates.get('duplicate_review_count', 0)
+        ratio, largest = duplicates.get('duplicate_ratio', 0), duplicates.get('largest_group_size', 0)
+        if ratio >= 0.2 or largest >= 5:
+            return 15
+        if ratio >= 0.1 or count >= 4:
+            return 8
+        return 3 if count >= 2 else 0
+
+    def reuse_points():
+        reuse = results.get('image_reuse', {})
+        if not reuse or not reuse.get('analyzed'):
+            return 0
+        reused, sellers = reuse.get('images_reused_by_other_sellers', 0), reuse.get('other_seller_count', 0)
+        if reused >= 2 or sellers >= 3:
+            return 20
+        return 12 if reused == 1 else 0
+
+    breakdown = {}
+    for name, part in zip(RISK_COMPONENTS, (review_points, seller_points, photo_points, sentiment_points,
+                                           ai_points, duplicate_points, reuse_points)):
+        try:
+            breakdown[name] = part()
+        except Exception:
+            breakdown[name] = 0
+    score = min(100, max(0, sum(breakdown.values())))
+    level = LEGACY_LEVELS[sum(1 for edge in LEGACY_LEVEL_EDGES if score >= edge)]
+    return {'score': round(score, 1), 'level': level, 'breakdown': breakdown}
+
+
+# =====================================================================
+# Checks
+# =====================================================================
+
+def batch_row(batch, i):
+    return {
+        'score': float(batch['score'][i]),
+        'level': batch['level'][i],
+        'color': batch['color'][i],
+        'recommendation': batch['recommendation'][i],
+        'breakdown': {name: float(batch['breakdown'][name][i]) for name in RISK_COMPONENTS},
+    }
+
+
+def mismatches(expected, actual, keys):
+    """Fields where two results differ (breakdown compared entry by entry)"""
+    diff = [k for k in keys if expected[k] != actual[k]]
+    diff += [f'breakdown.{name}' for name in RISK_COMPONENTS
+             if float(expected['breakdown'].get(name, 0)) != actual['breakdown'][name]]
+    return diff
+
+
+def check_batch_matches_scalar(listings):
+    calc = ListingRiskCalculator()
+    features = calc.risk_features(listings)
+    batch = calc.calculate_risk_batch(features)
+    for i, data in enumerate(listings):
+        scalar = calc.calculate_risk(data)
+        diff = mismatches(scalar, batch_row(batch, i), ('score', 'level', 'color', 'recommendation'))
+        assert not diff, f"listing {i} differs in {diff}: {data}"
+    return features
+
+
+def test_batch_matches_scalar_on_fuzzed_listings():
+    features = check_batch_matches_scalar(fuzz_listings(seed=0))
+    # The fuzz must exercise the error path of every component and NaN (not reported) columns
+    for name in ('reviews', 'seller', 'review_photos', 'sentiment', 'duplicate_reviews', 'image_reuse'):
+        assert features[f'{name}_error'].any(), f"fuzz never made {name} fail"
+    for name in ('burst_score', 'seller_age_months', 'sales_count', 'listing_age_days'):
+        assert np.isnan(features[name]).any() and not np.isnan(features[name]).all(), name
+
+
+def test_batch_matches_scalar_on_malformed_components():
+    base = {'data': {'reviews': [{'text': 't', 'date': '2024-01-01', 'images': ['u']}] * 6,
+                     'sellerAgeMonths': 8, 'salesCount': 20},
+            'results': {'sentiment': {'sentiment_rating_mismatch_count': 1, 'average_sentiment': 0.5,
+                                      'sentiment_percentages': {'positive': 80}},
+                        'duplicates': {'analyzed': True, 'duplicate_review_count': 3, 'duplicate_ratio': 0.1},
+                        'image_reuse': {'analyzed': True, 'images_reused_by_other_sellers': 1}}}
+    broken = {
+        'seller': lambda d: d['data'].update(sellerAgeMonths='x'),
+        'sentiment': lambda d: d['results']['sentiment'].update(sentiment_percentages='x'),
+        'duplicate_reviews': lambda d: d['results']['duplicates'].update(duplicate_ratio=None),
+        'image_reuse': lambda d: d['results']['image_reuse'].update(images_reused_by_other_sellers='x'),
+        'review_photos': lambda d: d['results'].update(image_similarity={'analyzed': True, 'average_match_score': 'x'}),
+    }
+    calc = ListingRiskCalculator()
+    listings = []
+    for name, breaks in broken.items():
+        data = {'data': dict(base['data']), 'results': {k: dict(v) for k, v in base['results'].items()}}
+        breaks(data)
+        listings.append(data)
+        features = calc.risk_features([data])
+        assert features[f'{name}_error'][0], f"{name} not flagged"
+        assert calc.calculate_risk(data)['breakdown'][name] == 0
+    check_batch_matches_scalar(listings + [base])
+
+
+def test_nan_feature_columns_score_as_not_reported():
+    calc = ListingRiskCalculator()
+    n = 4
+    features = {name: np.full(n, default, dtype=bool if isinstance(default, bool) else float)
+                for name, default in RISK_FEATURES.items()}
+    features['review_count'][:] = 12
+    features['seller_age_months'] = np.array([NAN, 3, NAN, 30])
+    features['sales_count'] = np.array([NAN, NAN, 5, 500])
+    features['burst_score'] = np.array([NAN, 70, 40, NAN])
+    batch = calc.calculate_risk_batch(features)
+    assert list(batch['breakdown']['seller']) == [0, 12, 10, 0]
+    assert list(batch['breakdown']['reviews']) == [0, 10, 5, 0]
+
+    # Same rows through the scalar path (NaN and None both mean "not reported")
+    scalar = [calc.calculate_risk({'data': {'reviews': [{'text': 't'}] * 12, 'sellerAgeMonths': age,
+                                            'salesCount': sales}, 'results': {}})
+              for age, sales in ((NAN, None), (3, NAN), (None, 5), (30, 500))]
+    assert [s['breakdown']['seller'] for s in scalar] == list(batch['breakdown']['seller'])
+
+    # Columns left out take their defaults
+    partial = calc.calculate_risk_batch({'review_count': np.array([0, 12])})
+    assert list(partial['breakdown']['reviews']) == [15, 0]
+
+
+def test_rules_match_legacy_thresholds():
+    calc = ListingRiskCalculator()
+    for i, data in enumerate(fuzz_listings(seed=1)):
+        scalar, legacy = calc.calculate_risk(data), legacy_risk(calc, data)
+        diff = [k for k in ('score', 'level') if scalar[k] != legacy[k]]
+        diff += [f'breakdown.{name}' for name in RISK_COMPONENTS
+                 if scalar['breakdown'][name] != legacy['breakdown'][name]]
+        assert not diff, f"listing {i} differs from the legacy thresholds in {diff}: {data}"
+
+
+if __name__ == '__main__':
+    for test in (test_batch_matches_scalar_on_fuzzed_listings, test_batch_matches_scalar_on_malformed_components,
+                 test_nan_feature_columns_score_as_not_reported, test_rules_match_legacy_thresholds):
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,135 @@
+"""
+tracing.py - opt-in per-request span tree (/analyze?debug_timing=1)
+
+A traced scan records a tree of spans - the scan, each stage, and inside them
+image downloads (bytes), Gemini calls, CLIP encodes and cache get/set (hit/miss).
+The tree is returned in response['receipt']['timing'] and appended to TRACE_FILE
+(NDJSON, empty = no file).
+
+Spans follow the current trace through a ContextVar, so asyncio tasks pick it up
+automatically; work handed to a thread pool must be submitted with
+contextvars.copy_context().run. Outside a traced request span() does nothing.
+
+    with span('download', source='clip') as s:
+        resp = requests.get(url)
+        annotate(s, bytes=len(resp.content))
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE = os.getenv('TRACE_FILE', 'data/traces.ndjson')
+
+_current_span = ContextVar('trace_span', default=None)
+_file_lock = threading.Lock()
+
+
+class Span:
+    """One timed step; children may be added from several threads"""
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def child(self, name, attrs) -> 'Span':
+        span = Span(self.trace, name, attrs)
+        with self.trace.lock:
+            self.children.append(span)
+        return span
+
+    def to_dict(self) -> Dict:
+        node = {
+            'name': self.name,
+            'start_ms': round((self.start - self.trace.root.start) * 1000, 1),
+            # None: still running when the response was built (e.g. a stage that timed out)
+            'duration_ms': round((self.end - self.start) * 1000, 1) if self.end is not None else None,
+        }
+        node.update(self.attrs)
+        with self.trace.lock:
+            children = list(self.children)
+        if children:
+            node['children'] = [c.to_dict() for c in children]
+        return node
+
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.root = Span(self, name, attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a block as a child of the current span
+
+    Yields:
+        The Span (pass it to annotate), or None when the request is not traced
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = parent.child(name, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def annotate(current: Optional[Span], **attrs):
+    """Add attributes (bytes, cache hit/miss, status...) to a span from span()"""
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+@contextmanager
+def start_trace(name: str, enabled: bool = True, **attrs):
+    """
+    Make a new trace current for the block
+
+    Yields:
+        Trace, or None when not enabled
+    """
+    if not enabled:
+        yield None
+        return
+    trace = Trace(name, attrs)
+    token = _current_span.set(trace.root)
+    try:
+        yield trace
+    finally:
+        trace.root.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def export(trace: Trace, url=None) -> Dict:
+    """Span tree for the receipt; also appended to TRACE_FILE"""
+    tree = trace.root.to_dict()
+    if TRACE_FILE:
+        record = {'trace_id': trace.id, 'url': url, 'timestamp': datetime.now().isoformat(), 'spans': tree}
+        try:
+            with _file_lock:
+                os.makedirs(os.path.dirname(TRACE_FILE) or '.', exist_ok=True)
+                with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write trace to {TRACE_FILE}: {e}")
+    return dict(tree, trace_id=trace.id)
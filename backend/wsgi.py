@@ -0,0 +1,10 @@
+"""
+wsgi.py - WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    waitress-serve --port=5000 wsgi:app
+"""
+
+from app import app
+
+application = app